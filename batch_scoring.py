@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+批量评分任务队列
+从JSONL队列读取评分任务，每行一个任务：
+  {"job_id": "j1", "relation": "concept:worksfor", "pairs": [["head", "tail"], ...]}
+跨任务去重相同的 (relation, head, tail)，由共享缓存的线程池统一评分，
+每个任务输出一行JSONL结果：
+  {"job_id": "j1", "relation": "...", "results": [{"head", "tail", "cssm", "fscm", "ris", ...}, ...]}
+
+  python batch_scoring.py [--queue scoring_jobs.jsonl] [--output scoring_results.jsonl] [--workers 4] [--follow]
+  --processes N：父进程把 CSR 图、量化嵌入与实体度数/关系类型数发布到共享内存（shared_arrays.py），
+  由 N 个工作进程零拷贝挂载后评分（绕开GIL，内存占用不随进程数增长）
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from embedding_store import register_quantized
+from graph_backend import GRAPH_URI_ENV, GraphDatabase
+
+from scoring_service import NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD, ReliabilityScorer, UnknownRelation
+
+# ============ 配置区域 ============
+QUEUE_FILE = "scoring_jobs.jsonl"  # 任务队列（注意不是仓库根目录下的 requests.jsonl）
+OUTPUT_FILE = "scoring_results.jsonl"
+WORKERS = 4
+POLL_INTERVAL = 2  # --follow 模式下检查队列新任务的间隔（秒）
+PROCESSES = 0  # >0 时改用多进程评分，各进程挂载共享内存中的只读数据
+CHUNK_SIZE = 16  # 多进程评分时每次分派给工作进程的三元组数
+
+_WORKER = {}  # 工作进程内的评分器
+
+
+def read_jobs(queue_file, offset=0):
+    """从 offset 处读取队列中的完整行，返回 (任务列表, 新offset)"""
+    jobs = []
+    if not os.path.exists(queue_file):
+        return jobs, offset
+
+    with open(queue_file, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break  # 尚未写完的行留到下一轮
+            offset += len(line)
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                job = json.loads(line)
+                pairs = [(h, t) for h, t in job["pairs"]]
+                jobs.append({"job_id": job.get("job_id"), "relation": job["relation"], "pairs": pairs})
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"解析任务失败: {line[:200]} | 错误: {e}")
+    return jobs, offset
+
+
+def score_triple(scorer, triple):
+    h, relation, t = triple
+    try:
+        return triple, scorer.score(h, relation, t)
+    except UnknownRelation:
+        return triple, {"head": h, "relation": relation, "tail": t, "error": "unknown relation"}
+    except Exception as e:
+        # 单个三元组失败不中断整批任务，按实际异常写入结果
+        print(f"评分失败 {triple}: {type(e).__name__}: {e}")
+        return triple, {"head": h, "relation": relation, "tail": t, "error": f"{type(e).__name__}: {e}"}
+
+
+def init_worker(name):
+    """工作进程初始化：挂载父进程发布的共享图与量化嵌入，建立只读图上的评分器"""
+    from shared_arrays import attach, attach_embeddings
+
+    os.environ[GRAPH_URI_ENV] = f"shared://{name}"  # 任务脚本内再获取驱动时同样使用共享图
+    store = attach_embeddings(name)
+    if store is not None:
+        register_quantized(store, attach(name)[1]["embeddings_file"])
+    driver = GraphDatabase.driver(f"shared://{name}")
+    _WORKER["scorer"] = ReliabilityScorer(driver, embedding_dtype=store.dtype if store is not None else None)
+
+
+def score_in_worker(triple):
+    return score_triple(_WORKER["scorer"], triple)
+
+
+def run_jobs(scorer, jobs, workers=WORKERS, pool=None):
+    """
+    跨任务去重后并行评分，返回每个任务的结果；
+    给出 pool（init_worker 初始化的进程池）时由工作进程评分，否则由线程池共享 scorer 评分
+    """
+    unique_triples = []
+    seen = set()
+    for job in jobs:
+        for h, t in job["pairs"]:
+            triple = (h, job["relation"], t)
+            if triple not in seen:
+                seen.add(triple)
+                unique_triples.append(triple)
+    print(f"共 {len(jobs)} 个任务，去重后 {len(unique_triples)} 个三元组待评分")
+
+    # 先串行预热各关系的TopK案例，避免多个线程同时计算SD表；多进程时工作进程从SD缓存目录读取
+    for relation in sorted({job["relation"] for job in jobs}):
+        try:
+            scorer.get_task(relation)
+        except UnknownRelation:
+            print(f"没有关系 {relation} 对应的任务文件夹，相关任务将返回错误")
+
+    if pool is not None:
+        scores = dict(pool.map(score_in_worker, unique_triples, chunksize=CHUNK_SIZE))
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as threads:
+            scores = dict(threads.map(lambda triple: score_triple(scorer, triple), unique_triples))
+
+    outputs = []
+    for job in jobs:
+        results = [scores[(h, job["relation"], t)] for h, t in job["pairs"]]
+        outputs.append({"job_id": job["job_id"], "relation": job["relation"], "results": results})
+    return outputs
+
+
+def write_results(output_file, outputs):
+    """追加写入JSONL结果"""
+    with open(output_file, "a", encoding="utf-8") as f:
+        for output in outputs:
+            f.write(json.dumps(output, ensure_ascii=False) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量评分任务队列")
+    parser.add_argument("--queue", default=QUEUE_FILE)
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--follow", action="store_true", help="持续监听队列文件中追加的新任务")
+    parser.add_argument("--processes", type=int, default=PROCESSES, help="工作进程数（0 为线程池）")
+    args = parser.parse_args()
+
+    driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+    pool, shared_name = None, None
+    if args.processes > 0:
+        from shared_arrays import publish_scoring_data
+
+        shared_name = f"batch_{os.getpid()}"
+        publish_scoring_data(driver, shared_name)
+        pool = ProcessPoolExecutor(max_workers=args.processes, initializer=init_worker, initargs=(shared_name,))
+    scorer = ReliabilityScorer(driver)  # 多进程时只在父进程中预热SD表与TopK案例
+
+    offset = 0
+    try:
+        while True:
+            jobs, offset = read_jobs(args.queue, offset)
+            if jobs:
+                outputs = run_jobs(scorer, jobs, args.workers, pool)
+                write_results(args.output, outputs)
+                print(f"已将 {len(outputs)} 个任务的结果写入 {args.output}")
+            if not args.follow:
+                break
+            time.sleep(POLL_INTERVAL)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if pool is not None:
+            pool.shutdown()
+            from shared_arrays import release
+            release(shared_name)
+        driver.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+端到端基准测试：在若干规模的合成图谱上依次运行流水线各阶段并计时
+  导入 -> 规则匹配 -> 评估 -> SD -> CSSM -> FSCM -> RIS参数扫描
+结果写入JSON，便于跟踪吞吐量与规模扩展性。
+
+  python benchmark/run_benchmark.py --sizes 10000 50000 --backend memory --output benchmark_results.json
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from graph_backend import GraphDatabase, GRAPH_URI_ENV, load_memory_graph
+from graph_snapshot import graph_fingerprint
+from rule_match_cache import RULE_MATCH_CACHE_DIR
+from sd_store import load_sd_table
+from sqlite_backend import load_graph
+from pair_store import read_pairs
+from synthetic_graph import generate, TARGET_RELATION
+
+# ============ 配置区域 ============
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+TASK_TEMPLATE = "concept_worksfor"  # 各任务文件夹脚本相同，取其一作为被测代码
+WORK_DIR = "bench_data"
+OUTPUT_FILE = "benchmark_results.json"
+RULE_TOP = 3
+
+SIGMA_GRID = np.round(np.arange(0.2, 2.01, 0.2), 2)
+MIU_GRID = np.round(np.arange(0.2, 2.01, 0.2), 2)
+THETA_GRID = np.round(np.arange(0.0, 1.01, 0.05), 2)
+
+
+def load_stage(name, size):
+    """加载任务脚本模块；每个规模单独加载一份，保证缓存互不影响"""
+    path = os.path.join(REPO_DIR, TASK_TEMPLATE, f"{name}.py")
+    spec = importlib.util.spec_from_file_location(f"bench_{size}_{name}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@contextlib.contextmanager
+def stage(results, name, verbose=False):
+    """计时一个阶段；items 由调用方填入处理量"""
+    record = {"items": None}
+    start = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        if not verbose:
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+        yield record
+    record["seconds"] = time.perf_counter() - start
+    if record["items"]:
+        record["items_per_second"] = record["items"] / record["seconds"] if record["seconds"] else None
+    results[name] = record
+    print(f"  {name:<14} {record['seconds']:8.3f}s  items={record['items']}")
+
+
+def ris_sweep(adjustment, indicators):
+    """
+    在 sigma/miu/theta 网格上统计低于阈值的FP/TP比例，
+    返回 (评估的组合数, FP比例与TP比例之差最大的组合)
+    """
+    cssm = np.array([c for c, _, _ in indicators])
+    fscm = np.array([f for _, f, _ in indicators])
+    fp = np.array([p for _, _, p in indicators]) == 1
+    combos = 0
+    best = None
+    for sigma in SIGMA_GRID:
+        for miu in MIU_GRID:
+            ris = np.array([adjustment.RIS(c, f, sigma, miu) for c, f in zip(cssm, fscm)])
+            for theta in THETA_GRID:
+                below = ris <= theta
+                fp_ratio = float(below[fp].mean()) if fp.any() else 0.0
+                tp_ratio = float(below[~fp].mean()) if (~fp).any() else 0.0
+                combos += 1
+                if best is None or fp_ratio - tp_ratio > best["fp_ratio"] - best["tp_ratio"]:
+                    best = {"sigma": float(sigma), "miu": float(miu), "theta": float(theta),
+                            "fp_ratio": fp_ratio, "tp_ratio": tp_ratio}
+    return combos, best
+
+
+def run_size(triple_num, backend, work_dir, seed, verbose=False):
+    """在一个规模上运行全部阶段"""
+    out_dir = os.path.abspath(os.path.join(work_dir, f"size_{triple_num}"))
+    print(f"规模 {triple_num}：生成合成图谱到 {out_dir}")
+    stats = generate(out_dir, triple_num, seed=seed)
+    task_dir = stats["task_dir"]
+    stages = {}
+
+    with stage(stages, "import", verbose) as record:
+        if backend == "sqlite":
+            db_file = os.path.join(out_dir, "graph.db")
+            if os.path.exists(db_file):
+                os.remove(db_file)
+            load_graph([os.path.join(out_dir, "graph.txt")], db_file)
+            uri = f"sqlite://{db_file}"
+        else:
+            load_memory_graph(out_dir)
+            uri = f"memory://{out_dir}"
+        record["items"] = stats["triples"]
+    os.environ[GRAPH_URI_ENV] = uri
+
+    rule_matching = load_stage("rule_matching", triple_num)
+    evaluation = load_stage("evaluation", triple_num)
+    indicator = load_stage("indicator_calculation", triple_num)
+    adjustment = load_stage("parameter_adjustment", triple_num)
+    indicator.EMBEDDINGS_FILE = os.path.join(out_dir, "entity_embeddings.pkl")
+
+    # 各阶段从冷缓存开始：清除同一合成图谱上次运行留下的规则匹配缓存与SD表
+    driver = GraphDatabase.driver(uri)
+    fingerprint = graph_fingerprint(driver)
+    driver.close()
+    shutil.rmtree(os.path.join(RULE_MATCH_CACHE_DIR, fingerprint[:16]), ignore_errors=True)
+    sd_cache_dir = os.path.join(task_dir, indicator.SD_CACHE_DIR)
+    shutil.rmtree(sd_cache_dir, ignore_errors=True)
+
+    cwd = os.getcwd()
+    os.chdir(task_dir)
+    try:
+        with stage(stages, "rule_matching", verbose) as record:
+            rule_matching.main(RULE_TOP)
+            record["items"] = len(read_pairs(rule_matching.OUTPUT_PAIRS_FILE))
+
+        with stage(stages, "evaluation", verbose) as record:
+            evaluation.main()
+            test_table = read_pairs(indicator.PREDICTED_PAIRS_FILE)
+            record["items"] = len(test_table)
+
+        driver = GraphDatabase.driver(uri)
+        with stage(stages, "SD", verbose) as record:
+            # 与 indicator_calculation.main 相同的路径：SD表持久化、规则匹配缓存与 SD_MODE
+            top_cases = indicator.prepare_top_cases(driver, TARGET_RELATION, indicator.RULES_FILE, indicator.topk,
+                                                    cache_dir=sd_cache_dir, fingerprint=fingerprint)
+            sd_table = load_sd_table(sd_cache_dir, TARGET_RELATION, indicator.RULES_FILE, fingerprint)
+            record["items"] = len(sd_table["case_sds"])
+        stages["SD"]["top_cases"] = len(top_cases)
+        stages["SD"]["sd_mode"] = indicator.SD_MODE
+
+        pairs = test_table.pairs()
+        with stage(stages, "CSSM", verbose) as record:
+            cssm_list = [indicator.CSSM(driver, pair, top_cases) for pair in pairs]
+            record["items"] = len(pairs)
+
+        with stage(stages, "FSCM", verbose) as record:
+            if indicator.FSCM_MODE == "vectorized":
+                fscm_list = indicator.FSCM_batch(driver, pairs)
+            else:
+                fscm_list = [indicator.FSCM(driver, h, t) for h, t in pairs]
+            record["items"] = len(pairs)
+        driver.close()
+
+        indicators = [(c, f, fp) for c, f, fp in zip(cssm_list, fscm_list, test_table["fp"].tolist())]
+        with stage(stages, "RIS_sweep", verbose) as record:
+            record["items"], best = ris_sweep(adjustment, indicators)
+        stages["RIS_sweep"]["best"] = best
+    finally:
+        os.chdir(cwd)
+
+    stats.pop("task_dir")
+    return {"size": triple_num, "graph": stats, "stages": stages}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流水线端到端基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5000, 20000, 50000], help="背景三元组数")
+    parser.add_argument("--backend", choices=["memory", "sqlite"], default="memory")
+    parser.add_argument("--work-dir", default=WORK_DIR)
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="保留各阶段自身的输出")
+    args = parser.parse_args()
+
+    runs = [run_size(size, args.backend, args.work_dir, args.seed, args.verbose) for size in args.sizes]
+    report = {
+        "backend": args.backend,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "runs": runs,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"基准测试结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+合成NELL风格图谱生成器（用于基准测试）
+  - 实体名形如 concept_<类型>_<名称>，头/尾实体按幂律（Zipf）权重抽取，度数呈长尾分布
+  - 关系名形如 concept:<名称>，每条三元组同时写入其 _inv 反向关系
+  - 目标关系的三元组由若干条隐含规则链生成，并输出对应的规则文件、标签文件与实体嵌入
+
+输出目录结构：
+  <out_dir>/graph.txt
+  <out_dir>/entity_embeddings.pkl
+  <out_dir>/concept_<target>/path_stats-20240124.txt
+  <out_dir>/concept_<target>/sort_test.pairs
+
+  python benchmark/synthetic_graph.py --out bench_data --triples 50000
+"""
+
+import argparse
+import os
+import pickle
+
+import numpy as np
+
+# ============ 配置区域 ============
+ENTITY_TYPES = [
+    "athlete", "sportsteam", "sport", "sportsleague", "stadiumoreventvenue", "city", "country",
+    "company", "ceo", "person", "university", "organization", "politician", "writer", "book",
+    "musician", "album", "website", "product", "award",
+]
+TARGET_RELATION = "concept:benchmarktarget"
+RULES_FILE = "path_stats-20240124.txt"
+LABEL_FILE = "sort_test.pairs"
+
+ALPHA = 0.9  # 幂律指数，越大度数分布越偏
+RELATION_NUM = 200  # 基础关系数（加上 _inv 共 2 倍）
+RULE_NUM = 8  # 生成目标关系的隐含规则链数
+EMBEDDING_DIM = 50
+
+
+def zipf_weights(n, alpha):
+    weights = 1.0 / np.arange(1, n + 1) ** alpha
+    return weights / weights.sum()
+
+
+def walk_chain(out_edges, start, chain, rng):
+    """沿关系链随机游走一次，走不通时返回None"""
+    node = start
+    for rel in chain:
+        tails = out_edges.get((node, rel))
+        if not tails:
+            return None
+        node = tails[rng.integers(len(tails))]
+    return node
+
+
+def generate(out_dir, triple_num, entity_num=None, seed=0):
+    """生成合成图谱及配套文件，返回统计信息"""
+    rng = np.random.default_rng(seed)
+    entity_num = entity_num or max(triple_num // 4, 100)
+
+    entities = [f"concept_{ENTITY_TYPES[i % len(ENTITY_TYPES)]}_e{i}" for i in range(entity_num)]
+    relations = [f"concept:relation{i}" for i in range(RELATION_NUM)]
+
+    # 1. 背景三元组：实体与关系都按幂律抽取（打乱后避免类型与度数相关）
+    entity_rank = rng.permutation(entity_num)
+    entity_p = zipf_weights(entity_num, ALPHA)[entity_rank]
+    relation_p = zipf_weights(RELATION_NUM, ALPHA)
+    heads = rng.choice(entity_num, size=triple_num, p=entity_p)
+    tails = rng.choice(entity_num, size=triple_num, p=entity_p)
+    rels = rng.choice(RELATION_NUM, size=triple_num, p=relation_p)
+    keep = heads != tails
+    triples = set(zip(heads[keep].tolist(), rels[keep].tolist(), tails[keep].tolist()))
+
+    out_edges = {}
+    for h, r, t in triples:
+        out_edges.setdefault((h, r), []).append(t)
+
+    # 2. 目标关系：由隐含规则链生成，部分留作测试标签
+    rule_chains = []
+    for _ in range(RULE_NUM):
+        length = int(rng.integers(1, 4))
+        rule_chains.append([int(r) for r in rng.choice(min(RELATION_NUM, 30), size=length)])
+
+    target_pairs = {}
+    starts = rng.choice(entity_num, size=triple_num // 5, p=entity_p)
+    for i, start in enumerate(starts):
+        chain_idx = i % RULE_NUM
+        end = walk_chain(out_edges, int(start), rule_chains[chain_idx], rng)
+        if end is not None and end != start:
+            target_pairs.setdefault((int(start), end), chain_idx)
+
+    pair_list = list(target_pairs)
+    rng.shuffle(pair_list)
+    split = int(len(pair_list) * 0.7)
+    train_pairs, test_pairs = pair_list[:split], pair_list[split:]
+
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, "graph.txt"), "w", encoding="utf-8") as f:
+        for h, r, t in triples:
+            f.write(f"{entities[h]}\t{relations[r]}\t{entities[t]}\n")
+            f.write(f"{entities[t]}\t{relations[r]}_inv\t{entities[h]}\n")
+        for h, t in train_pairs:
+            f.write(f"{entities[h]}\t{TARGET_RELATION}\t{entities[t]}\n")
+            f.write(f"{entities[t]}\t{TARGET_RELATION}_inv\t{entities[h]}\n")
+
+    # 3. 规则文件：链 \t 频次 \t 各跳置信度
+    task_dir = os.path.join(out_dir, "concept_" + TARGET_RELATION.split(":")[1])
+    os.makedirs(task_dir, exist_ok=True)
+    freqs = [0] * RULE_NUM
+    for chain_idx in target_pairs.values():
+        freqs[chain_idx] += 1
+    with open(os.path.join(task_dir, RULES_FILE), "w", encoding="utf-8") as f:
+        for chain_idx in sorted(range(RULE_NUM), key=lambda i: -freqs[i]):
+            chain = rule_chains[chain_idx]
+            f.write(" -> ".join(relations[r] for r in chain) + f"\t{max(freqs[chain_idx], 1)}\t"
+                    + ",".join("1.0" for _ in chain) + "\n")
+
+    # 4. 标签文件：测试正例，规则可推出但标为负例的假阳性，以及随机负例
+    with open(os.path.join(task_dir, LABEL_FILE), "w", encoding="utf-8") as f:
+        for i, (h, t) in enumerate(test_pairs):
+            label = "-" if i % 4 == 0 else "+"
+            f.write(f"thing${entities[h]},thing${entities[t]}: {label}\n")
+        for h, t in rng.integers(entity_num, size=(len(test_pairs), 2)).tolist():
+            f.write(f"thing${entities[h]},thing${entities[t]}: -\n")
+
+    # 5. 实体嵌入
+    vectors = rng.standard_normal((entity_num, EMBEDDING_DIM))
+    embeddings = {entities[i]: vectors[i].tolist() for i in range(entity_num)}
+    with open(os.path.join(out_dir, "entity_embeddings.pkl"), "wb") as f:
+        pickle.dump(embeddings, f)
+
+    return {
+        "entities": entity_num,
+        "relations": 2 * RELATION_NUM + 2,
+        "triples": 2 * (len(triples) + len(train_pairs)),
+        "target_triples": len(train_pairs),
+        "labelled_pairs": 2 * len(test_pairs),
+        "task_dir": task_dir,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成合成NELL风格图谱")
+    parser.add_argument("--out", default="bench_data")
+    parser.add_argument("--triples", type=int, default=50000, help="背景三元组数（不含 _inv）")
+    parser.add_argument("--entities", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    stats = generate(args.out, args.triples, args.entities, args.seed)
+    print(f"已生成合成图谱: {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from neo4j import GraphDatabase
+from graph_backend import GraphDatabase
 
 # ============ 配置区域 ============
 NEO4J_URI = "bolt://localhost:7687"
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+案例近邻索引（仅依赖 NumPy）：每个案例 (头, 尾) 的向量为 [头嵌入/‖头嵌入‖, 尾嵌入/‖尾嵌入‖]，
+两个实体对向量的内积即头、尾实体余弦之和，与 SS 中 HES + TES 的排序一致；
+为每个预测实体对检索最相似的 k 个高SD案例，CSSM 的代价不再随并列案例数增长
+  IVF：球面 k-means 把案例聚为 NLIST 个簇，查询时只在与查询最接近的 NPROBE 个簇内精确计算内积
+  案例数不超过 BRUTE_FORCE_SIZE 时不聚类，直接对全部案例计算（结果精确）
+
+  评估召回率：python case_index.py --embeddings entity_embeddings.pkl --cases 20000 --k 20
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+# ============ 配置区域 ============
+NLIST = None  # 簇数，None 为 √案例数
+NPROBE = 16  # 查询时探查的簇数（越大召回率越高，可用下面的命令评估）
+KMEANS_ITERS = 10
+BRUTE_FORCE_SIZE = 2048  # 案例数不超过该值时直接整体计算
+SEED = 0
+
+
+def unit_rows(matrix):
+    """逐行归一化，零向量保持为0"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+def dict_vectors(embeddings, names):
+    """从 {实体名: 向量} 字典批量取嵌入，无嵌入的实体为零向量"""
+    dim = len(next(iter(embeddings.values()))) if embeddings else 0
+    zeros = np.zeros(dim, dtype=np.float32)
+    return np.array([embeddings.get(n, zeros) for n in names], dtype=np.float32).reshape(len(names), dim)
+
+
+def pair_matrix(vectors, pairs):
+    """
+    实体对 -> 拼接的单位化头/尾嵌入（float32）
+    vectors(names) 返回一批实体的嵌入矩阵（如 QuantizedEmbeddings.vectors 或 dict_vectors 的偏函数）
+    """
+    pairs = list(pairs)
+    heads = unit_rows(np.asarray(vectors([h for h, _ in pairs]), dtype=np.float32))
+    tails = unit_rows(np.asarray(vectors([t for _, t in pairs]), dtype=np.float32))
+    return np.hstack([heads, tails])
+
+
+def kmeans(data, nlist, iters=KMEANS_ITERS, seed=SEED):
+    """球面 k-means：按内积分配，质心归一化；空簇保留上一轮的质心。返回 (质心, 各行所属簇)"""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), nlist, replace=False)].copy()
+    assign = np.zeros(len(data), dtype=np.int64)
+    for _ in range(iters):
+        assign = np.argmax(data @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+        filled = np.bincount(assign, minlength=nlist) > 0
+        centroids[filled] = unit_rows(sums[filled])
+    return centroids, np.argmax(data @ centroids.T, axis=1)
+
+
+class CaseIndex:
+    """案例向量上的 IVF 索引，search 返回每个查询内积最大的 k 个案例下标"""
+
+    def __init__(self, matrix, nlist=NLIST, seed=SEED):
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        n = len(self.matrix)
+        self.centroids = None
+        if n > BRUTE_FORCE_SIZE:
+            nlist = min(nlist or int(np.sqrt(n)), n)
+            self.centroids, assign = kmeans(self.matrix, nlist, seed=seed)
+            # 倒排表：按簇排序的案例下标，簇 c 为 order[ptr[c]:ptr[c+1]]
+            self.order = np.argsort(assign, kind="stable")
+            self.ptr = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))])
+
+    def __len__(self):
+        return len(self.matrix)
+
+    def candidates(self, query, nprobe):
+        """与查询最接近的 nprobe 个簇内的案例下标"""
+        if self.centroids is None:
+            return np.arange(len(self.matrix))
+        scores = self.centroids @ query
+        probe = np.argsort(-scores)[:nprobe]
+        return np.concatenate([self.order[self.ptr[c]:self.ptr[c + 1]] for c in probe])
+
+    def search(self, queries, k, nprobe=NPROBE):
+        """返回 (下标, 内积)，形状均为 (查询数, k)；候选不足 k 个时下标以 -1 补齐"""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for i, query in enumerate(queries):
+            cand = self.candidates(query, nprobe)
+            if not len(cand):
+                continue
+            cand_scores = self.matrix[cand] @ query
+            top = np.argpartition(-cand_scores, k - 1)[:k] if len(cand) > k else np.arange(len(cand))
+            # 按内积降序，相同内积按案例下标（即原SD排序）
+            top = top[np.lexsort((cand[top], -cand_scores[top]))]
+            indices[i, :len(top)] = cand[top]
+            scores[i, :len(top)] = cand_scores[top]
+        return indices, scores
+
+
+def build_case_index(vectors, cases, nlist=NLIST):
+    """由案例实体对列表构建索引（下标与 cases 对齐）"""
+    return CaseIndex(pair_matrix(vectors, cases), nlist)
+
+
+def main():
+    from functools import partial
+
+    from embedding_store import EMBEDDINGS_FILE, load_embeddings
+
+    parser = argparse.ArgumentParser(description="以随机实体对评估案例近邻索引的召回率与查询耗时")
+    parser.add_argument("--embeddings", default=EMBEDDINGS_FILE)
+    parser.add_argument("--cases", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--nprobe", type=int, default=NPROBE)
+    args = parser.parse_args()
+
+    embeddings = load_embeddings(args.embeddings)
+    names = list(embeddings)
+    rng = np.random.default_rng(SEED)
+    cases = [tuple(p) for p in rng.choice(names, (args.cases, 2))]
+    queries = [tuple(p) for p in rng.choice(names, (args.queries, 2))]
+    vectors = partial(dict_vectors, embeddings)
+
+    start = time.perf_counter()
+    index = build_case_index(vectors, cases)
+    built = time.perf_counter() - start
+    query_matrix = pair_matrix(vectors, queries)
+    start = time.perf_counter()
+    found, _ = index.search(query_matrix, args.k, args.nprobe)
+    searched = time.perf_counter() - start
+    exact = np.argsort(-(query_matrix @ index.matrix.T), axis=1)[:, :args.k]
+    recall = np.mean([len(set(f) & set(e)) / args.k for f, e in zip(found.tolist(), exact.tolist())])
+    print(f"{args.cases} 个案例，构建 {built:.2f}s，{args.queries} 次查询 {searched:.3f}s，"
+          f"top{args.k} 召回率 {recall:.3f}（nprobe={args.nprobe}）")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,14 @@
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.lines import Line2D
+import os
+import sys
 
-INPUT_FILE = "indicators_output.txt"
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from profiling import run_stage
+from pair_store import read_pairs, write_pairs
+
+INPUT_FILE = "indicators_output.npz"  # 无二进制结果时读取 indicators_output.txt
 
 sigma = 1.8
 miu = 0.8
@@ -64,34 +70,28 @@ def plot_ris_distribution(indicators, sigma, miu, theta):
     plt.savefig(f'./experiment_results/RIS_distribution_{sigma}_{miu}_{theta}.png', dpi=300, bbox_inches='tight')
     plt.close()
 
+def main():
+    table = read_pairs(INPUT_FILE, "indicators")
+    table.rows["ris"] = RIS(table["cssm"], table["fscm"], sigma, miu)
+    is_fp = table["fp"] == 1
+    below = table["ris"] <= theta
+    tp_sum, fp_sum = int((~is_fp).sum()), int(is_fp.sum())
+    tp_cnt, fp_cnt = int((below & ~is_fp).sum()), int((below & is_fp).sum())
+    indicators = list(zip(table.pairs(), table["cssm"].tolist(), table["fscm"].tolist(),
+                          table["ris"].tolist(), table["fp"].tolist()))
+
+    tp_ratio = (tp_cnt / tp_sum) * 100
+    fp_ratio = (fp_cnt / fp_sum) * 100
+    print(f"{fp_ratio:.1f}%的假阳性结果低于阈值{theta}，{tp_ratio:.1f}%的真阳性结果低于阈值{theta}")
+    plot_ris_distribution(indicators, sigma, miu, theta)
+
+    # 按RIS降序（稳定排序，与 sorted(..., reverse=True) 的并列顺序一致）
+    order = np.argsort(-table["ris"], kind="stable")
+    for (h, t), cssm, fscm, ris, fp in (indicators[i] for i in order):
+        print(f"\n预测对: {h}->{t} | CSSM={cssm:.2f} | FSCM={fscm:.2f} | RIS={ris:.2f} | 是否为假阳性结果: {fp}")
+    ris_table = table.take(order)
+    ris_table.kind = "ris"
+    write_pairs(f'./experiment_results/RIS_{sigma}_{miu}.npz', ris_table)
+
 if __name__ == '__main__':
-    tp_sum, fp_sum = 0, 0
-    tp_cnt, fp_cnt = 0, 0
-    indicators = []
-    with open(INPUT_FILE, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
-        for line in lines:
-            h, t, cssm, fscm, fp = line.strip().split('\t')
-            cssm, fscm, fp = float(cssm), float(fscm), int(fp)
-            ris = RIS(cssm, fscm, sigma, miu)
-            indicators.append(((h, t), cssm, fscm, ris, fp))
-            if fp == 1:
-                fp_sum += 1
-            else:
-                tp_sum += 1
-            if ris <= theta:
-                if fp == 1:
-                    fp_cnt += 1
-                else:
-                    tp_cnt += 1
-
-        tp_ratio = (tp_cnt / tp_sum) * 100
-        fp_ratio = (fp_cnt / fp_sum) * 100
-        print(f"{fp_ratio:.1f}%的假阳性结果低于阈值{theta}，{tp_ratio:.1f}%的真阳性结果低于阈值{theta}")
-        plot_ris_distribution(indicators, sigma, miu, theta)
-
-        sorted_indicators = sorted(indicators, key=lambda x: x[-2], reverse=True)
-        with open(f'./experiment_results/RIS_{sigma}_{miu}.txt', 'w', encoding="utf-8") as f:
-            for (h, t), cssm, fscm, ris, fp in sorted_indicators:
-                print(f"\n预测对: {h}->{t} | CSSM={cssm:.2f} | FSCM={fscm:.2f} | RIS={ris:.2f} | 是否为假阳性结果: {fp}")
-                f.write(f"{h}\t{t}\t{cssm:.2f}\t{fscm:.2f}\t{ris:.2f}\t{fp}\n")
\ No newline at end of file
+    run_stage("parameter_adjustment", main)
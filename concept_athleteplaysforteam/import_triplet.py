@@ -5,7 +5,12 @@
 读取 graph.txt 并将 (头实体, 关系, 尾实体) 导入 Neo4j
 """
 
-from neo4j import GraphDatabase
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from graph_backend import GraphDatabase
+from graph_snapshot import GRAPH_MANIFEST_FILE, scan_manifest, write_manifest
 
 # ============ 配置区域 ============
 NEO4J_URI = "bolt://localhost:7687"
@@ -78,6 +83,11 @@ def main():
                 print(f"已成功插入了 {total} 条三元组信息。")
 
     print(f"成功插入了 {total} 条三元组信息。")
+
+    # 3. 扫描导入后的整个图谱，更新快照清单
+    manifest = scan_manifest(driver, [GRAPH_FILE])
+    write_manifest(manifest)
+    print(f"快照清单已写入 {GRAPH_MANIFEST_FILE}，指纹 {manifest['fingerprint'][:12]}")
     driver.close()
     print("导入完成。")
 
@@ -2,14 +2,28 @@
 # -*- coding: utf-8 -*-
 
 import re
-from neo4j import GraphDatabase
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from graph_backend import GraphDatabase
+from graph_snapshot import graph_fingerprint, is_fresh, write_stamp
+from pair_store import PairAppender, PairTable, write_pairs
+from profiling import run_stage
+from rule_match_cache import RuleMatchCache
 
 NEO4J_URI = "bolt://localhost:7687"
 NEO4J_USER = "neo4j"
 NEO4J_PASSWORD = "neo4jDIONG"
 
 PATH_STATS_FILE = "path_stats-20240124.txt"  # 规则文件
-OUTPUT_PAIRS_FILE = "predicted_pairs.txt"
+OUTPUT_PAIRS_FILE = "predicted_pairs.npz"  # 二进制列式结果（pair_store.py），TEXT_EXPORT 时同时写出 predicted_pairs.txt
+MATCH_MODE = "full"  # 匹配模式："full" 返回整个节点并排序后写出；"stream" 只返回实体名，边匹配边以整数编码去重（优先于 USE_RULE_MATCH_CACHE）
+FETCH_SIZE = 10000  # stream 模式下每批从服务端拉取的记录数
+USE_RULE_MATCH_CACHE = True  # 按 (图谱指纹, 关系链) 缓存匹配结果，图谱不变时不再重复匹配（MATCH_MODE 为 "full" 时使用）
+REUSE_OUTPUTS = True  # 图谱指纹、规则文件与 top 均与输出戳记（predicted_pairs.npz.stamp）一致时直接复用已有输出
 
 
 def parse_rule_line(line):
@@ -27,7 +41,7 @@ def parse_rule_line(line):
     }
 
 
-def create_cypher_for_chain(relation_chain):
+def create_cypher_for_chain(relation_chain, names_only=False):
     """
     给定关系链(例如 ["r1", "r2", "r3"]),
     生成用于匹配的 Cypher 语句, 以获取 (a, b)，其中:
@@ -36,6 +50,8 @@ def create_cypher_for_chain(relation_chain):
     示例输出:
       MATCH (a)-[:RELATION {name:'r1'}]->(n1)-[:RELATION {name:'r2'}]->(n2)-[:RELATION {name:'r3'}]->(b)
       RETURN a, b
+    names_only=True 时只返回去重后的实体名：
+      RETURN DISTINCT a.name AS a_name, b.name AS b_name
     """
 
     # 为了在 Cypher 中引用不同节点，用 a, n1, n2, ..., b
@@ -61,13 +77,46 @@ def create_cypher_for_chain(relation_chain):
     for seg in match_parts:
         match_str +=  seg
 
+    if names_only:
+        return_str = "RETURN DISTINCT a.name AS a_name, b.name AS b_name"
+    else:
+        return_str = "RETURN a, b"
+
     cypher = f"""
     MATCH {match_str}
-    RETURN a, b
+    {return_str}
     """
     return cypher
 
 
+def stream_matches(driver, top_rules, output_file):
+    """
+    流式匹配：逐条读取实体名并立即追加写出，不物化查询结果。
+    实体名映射为整数编号，已见实体对以 (头编号 << 32) | 尾编号 的整数存放在集合中去重，
+    新实体对的编号按块追加到临时文件（pair_store.PairAppender），全部规则匹配完后转换为二进制结果。
+    """
+    seen = set()
+
+    with driver.session(fetch_size=FETCH_SIZE) as session, PairAppender(output_file) as out:
+        for rule in top_rules:
+            cypher = create_cypher_for_chain(rule["relations"], names_only=True)
+            new_pairs = 0
+            for rec in session.run(cypher):
+                a_name, b_name = rec["a_name"], rec["b_name"]
+                if not a_name or not b_name:
+                    continue
+                a_id = out.entity_id(a_name)
+                b_id = out.entity_id(b_name)
+                key = (a_id << 32) | b_id
+                if key in seen:
+                    continue
+                seen.add(key)
+                out.append(a_id, b_id)
+                new_pairs += 1
+            print(f"规则 {' -> '.join(rule['relations'])} 新增实体对 {new_pairs} 个")
+        return out.finish()
+
+
 def main(top=3):
     driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
 
@@ -118,6 +167,35 @@ def main(top=3):
     print(f"总规则数: {len(rule_list)}, 选取 top{top}置信度规则进行匹配(含并列): {len(top_rules)}条")
     print(top_rules)
 
+    fingerprint = graph_fingerprint(driver)
+    stamp_inputs, stamp_params = [PATH_STATS_FILE], {"top": top}
+    if REUSE_OUTPUTS and is_fresh(OUTPUT_PAIRS_FILE, fingerprint, stamp_inputs, stamp_params):
+        driver.close()
+        print(f"图谱与规则均未变化，复用已有的 {OUTPUT_PAIRS_FILE} 。")
+        return
+
+    if MATCH_MODE == "stream":
+        # ====== 2/3. 流式匹配并写出 ======
+        pair_num = stream_matches(driver, top_rules, OUTPUT_PAIRS_FILE)
+        driver.close()
+        print(f"匹配得到实体对数量: {pair_num}")
+        write_stamp(OUTPUT_PAIRS_FILE, fingerprint, stamp_inputs, stamp_params)
+        print(f"已将实体对保存到 {OUTPUT_PAIRS_FILE} 。")
+        return
+
+    if USE_RULE_MATCH_CACHE:
+        # ====== 2/3. 读取规则匹配缓存（未缓存的规则链匹配后写入缓存）并写出 ======
+        cache = RuleMatchCache(driver, fingerprint)
+        codes = np.unique(np.concatenate([cache.match(rule["relations"]) for rule in top_rules]
+                                         + [np.empty(0, dtype=np.int64)]))
+        driver.close()
+        print(f"匹配得到实体对数量: {len(codes)}")
+        # 编码顺序即实体名顺序，输出与 full 模式一致
+        write_pairs(OUTPUT_PAIRS_FILE, PairTable.from_pairs("pairs", cache.decode(codes)))
+        write_stamp(OUTPUT_PAIRS_FILE, fingerprint, stamp_inputs, stamp_params)
+        print(f"已将实体对保存到 {OUTPUT_PAIRS_FILE} 。")
+        return
+
     # ====== 2. 在图中对每条规则做匹配，收集 (a,b) 对 ======
     predicted_pairs = set()  # 存放 (headName, tailName)
 
@@ -144,12 +222,11 @@ def main(top=3):
     print(f"匹配得到实体对数量: {len(predicted_pairs)}")
 
     # ====== 3. 将 predicted_pairs 写入文件 ======
-    with open(OUTPUT_PAIRS_FILE, "w", encoding="utf-8") as f:
-        for (h, t) in sorted(predicted_pairs):
-            f.write(f"{h}\t{t}\n")
+    write_pairs(OUTPUT_PAIRS_FILE, PairTable.from_pairs("pairs", sorted(predicted_pairs)))
+    write_stamp(OUTPUT_PAIRS_FILE, fingerprint, stamp_inputs, stamp_params)
 
     print(f"已将实体对保存到 {OUTPUT_PAIRS_FILE} 。")
 
 
 if __name__ == "__main__":
-    main(3)
+    run_stage("rule_matching", main, 3)
@@ -2,7 +2,14 @@
 # -*- coding: utf-8 -*-
 
 import re
-from neo4j import GraphDatabase
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from graph_backend import GraphDatabase
+from graph_snapshot import graph_fingerprint
+from rule_match_cache import RuleMatchCache
+from profiling import run_stage
 import matplotlib.pyplot as plt
 import numpy as np
 from itertools import accumulate
@@ -13,6 +20,7 @@ NEO4J_USER = "neo4j"
 NEO4J_PASSWORD = "neo4jDIONG"
 PATH_STATS_FILE = "path_stats-20240124.txt"  # 规则文件
 LABEL_FILE = "sort_test.pairs"  # 标签文件
+USE_RULE_MATCH_CACHE = True  # 按 (图谱指纹, 关系链) 缓存匹配结果，图谱不变时不再重复匹配
 
 
 def parse_rule_line(line):
@@ -113,20 +121,25 @@ def main():
     x_labels = []
 
     # 4. 逐步添加规则组
+    cache = RuleMatchCache(driver, graph_fingerprint(driver)) if USE_RULE_MATCH_CACHE else None
     predicted_pairs = set()
     for i, count in enumerate(accumulated_counts):
         # 获取当前组所有规则
         current_group = rule_groups[i]
 
         # 匹配当前组规则
-        with driver.session() as session:
+        if cache is not None:
             for rule in current_group:
-                cypher = create_cypher_for_chain(rule[0])
-                result = session.run(cypher)
-                for rec in result:
-                    h = rec["a"]["name"]
-                    t = rec["b"]["name"]
-                    predicted_pairs.add((h, t))
+                predicted_pairs.update(cache.decode(cache.match(rule[0])))
+        else:
+            with driver.session() as session:
+                for rule in current_group:
+                    cypher = create_cypher_for_chain(rule[0])
+                    result = session.run(cypher)
+                    for rec in result:
+                        h = rec["a"]["name"]
+                        t = rec["b"]["name"]
+                        predicted_pairs.add((h, t))
 
         # 计算评估指标
         TP, FP, precision, recall, f1, fp_rate = evaluate_predictions(predicted_pairs, label_dict)
@@ -209,4 +222,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    run_stage("variation", main)
\ No newline at end of file
@@ -1,13 +1,28 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from neo4j import GraphDatabase
 from tqdm import tqdm
-import pickle
+import random
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.lines import Line2D
+import json
 import os
+import sys
+from statistics import NormalDist
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from graph_backend import GraphDatabase, Query, Neo4jError
+from path_store import build_path_buffers, AV_ART_batch
+from graph_snapshot import graph_fingerprint, is_fresh, stamp_status, write_stamp
+from sd_store import TopCases, load_sd_table, new_sd_table, save_sd_table, top_cases_key
+from rule_match_cache import RuleMatchCache
+from embedding_store import EMBEDDINGS_FILE, cssm_report, load_embeddings, load_quantized
+from case_index import build_case_index, dict_vectors, pair_matrix
+from pair_store import PairTable, pair_file, read_pairs, write_pairs
+import instrumentation
+from profiling import run_stage
+import memory_monitor
 
 # ============ 配置区域 ============
 NEO4J_URI = "bolt://localhost:7687"
@@ -15,17 +30,41 @@ NEO4J_USER = "neo4j"
 NEO4J_PASSWORD = "neo4jDIONG"
 
 RULES_FILE = "path_stats-20240124.txt"  # 规则文件
-PREDICTED_PAIRS_FILE = "test_pairs.txt"
-OUTPUT_FILE = "indicators_output.txt"
+PREDICTED_PAIRS_FILE = "test_pairs.npz"  # 无二进制结果时读取 test_pairs.txt
+OUTPUT_FILE = "indicators_output.npz"  # 二进制列式结果（pair_store.py），TEXT_EXPORT 时同时写出 indicators_output.txt
+SD_CACHE_DIR = "sd_cache"  # SD表与TopK案例的持久化目录
+INSTRUMENT_FILE = "instrumentation_summary.json"  # 各阶段耗时、查询/行/路径计数与缓存命中率汇总
+TRACE_FILE = None  # 逐实体对明细（JSONL），None 表示不输出
+REUSE_OUTPUTS = True  # 图谱指纹、输入文件与参数均与输出戳记（indicators_output.npz.stamp）一致时直接复用已有输出
 
 PATH_CACHE = {}
+SIGNATURE_CACHE = {}
 ENTITY_PROP_CACHE = {}
+ESTIMATED_PAIRS = set() # 路径经抽样得到（AV/ART为估计值）的实体对
+CASE_INDEX_CACHE = {} # {id(top_cases): (top_cases, CaseIndex)}，保留 top_cases 的引用以免 id 被复用；TopK案例重新载入时整体清空
+memory_monitor.register_caches(globals(), ["PATH_CACHE", "SIGNATURE_CACHE", "ENTITY_PROP_CACHE", "CASE_INDEX_CACHE"])
 
 I_MAX = 2000 # 实体最大连接度数
 R = 100 # 图谱总关系数
 topk = 3
-
-
+PS_MODE = "paths" # PS计算模式："paths" 物化全部路径；"count" 仅按关系序列聚合计数
+PATH_BUDGET = 10000 # 单个实体对最多物化的路径数，超出后改为抽样估计
+PATH_SAMPLE_SIZE = 1000 # 抽样估计时的路径样本数
+PATH_TIME_LIMIT = 60 # 单条路径查询的时间上限（秒）
+PATH_SEED = 0 # 路径抽样的随机种子（与实体对一起决定样本，重复运行结果一致）
+FSCM_MODE = "loop" # FSCM计算模式："loop" 逐路径循环；"vectorized" 展平路径后整批向量化计算
+EMBEDDING_DTYPE = "float64" # HES/TES所用嵌入精度："float64" 原始嵌入字典；"float16" / "int8" 内存映射的量化嵌入（embedding_store.py）
+EMBEDDING_REPORT_FILE = "embedding_quantization.json" # 量化嵌入时CSSM与全精度之差的报告（需加载全精度嵌入），None 表示不输出
+CASE_NEIGHBORS = None # 每个预测三元组只与头/尾嵌入最相似的k个TopK案例计算SS（case_index.py 近邻索引），None 表示全部TopK案例
+TIE_CAP = None # 每个SD并列组最多保留的案例数，超出时按实体分层抽样（保留案例按组大小加权），None 表示不限制
+TIE_SEED = 0 # 并列组抽样的随机种子
+SD_MODE = "exact" # SD计算模式："exact" 计算全部案例；"sampled" 由随机样本估计第topk个SD取值的下界，只对可能进入TopK的案例计算精确SD
+SD_SAMPLE_SIZE = 2000 # sampled 模式的样本数，案例数不超过该值时仍全部计算
+SD_CONFIDENCE = 0.95 # 样本中SD不低于阈值的案例占比的置信水平（用于估计需要精确计算的案例数）
+SD_SEED = 0 # 抽样的随机种子
+
+
+@instrumentation.timed("find_cases")
 def find_cases(driver, relation):
     """找到和预测三元组有相同关系的三元组"""
     case_pairs = set()  # 存放 (headName, tailName)
@@ -83,13 +122,21 @@ def generate_cypher_query(rule_chain):
     RETURN COUNT(*) > 0 AS exists
     """
 
-def SD(driver, case_pair, rules_list):
-    """计算支持度分数"""
+@instrumentation.timed("SD")
+def SD(driver, case_pair, rules_list, match_cache=None):
+    """计算支持度分数；match_cache 中已有某规则链的匹配结果时直接查表，不再查询图谱"""
     h_name, t_name = case_pair
     matched_confs = []
 
     with driver.session() as session:
         for rule in rules_list[:10]:
+            codes = match_cache.get(rule["rule"]) if match_cache is not None else None
+            instrumentation.cache_lookup("RULE_MATCH_CACHE", codes is not None)
+            if codes is not None:
+                if match_cache.contains(codes, h_name, t_name):
+                    matched_confs.append(rule["conf"])
+                continue
+
             # 生成动态Cypher查询
             cypher = generate_cypher_query(rule["rule"])
 
@@ -120,21 +167,146 @@ def get_entity_similarity(embeddings, entity1, entity2):
     cos = cosine_similarity(vec1, vec2)
     return (cos + 1) / 2
 
-def get_paths_between(driver, h_name, t_name, max_depth=3):
-    """获取头尾实体间的所有非环路径"""
+def is_timeout(error):
+    """判断Neo4j异常是否为事务超时"""
+    return "TransactionTimedOut" in (getattr(error, "code", None) or "")
+
+def build_path_pattern(depth, rel_chain=None):
+    """构造定长非环路径的MATCH模式与节点互异条件，rel_chain给定时约束每一跳的关系名"""
+    nodes = ["h"] + [f"m{i}" for i in range(depth - 1)] + ["t"]
+    rels = [f"r{i}" for i in range(depth)]
+
+    pattern = f"({nodes[0]})"
+    for i in range(depth):
+        if rel_chain:
+            pattern += f"-[{rels[i]}:RELATION {{name: '{rel_chain[i]}'}}]->({nodes[i + 1]})"
+        else:
+            pattern += f"-[{rels[i]}:RELATION]->({nodes[i + 1]})"
+
+    conditions = []
+    for i in range(len(nodes)):
+        for j in range(i + 1, len(nodes)):
+            conditions.append(f"{nodes[i]} <> {nodes[j]}")
+
+    return pattern, " AND ".join(conditions), rels
+
+def generate_count_query(depth):
+    """生成定长路径按关系序列聚合计数的Cypher查询（节点两两不同，即非环路径）"""
+    pattern, condition, rels = build_path_pattern(depth)
+    return f"""
+    MATCH (h:Entity {{name: $h_name}}), (t:Entity {{name: $t_name}})
+    MATCH {pattern}
+    WHERE {condition}
+    RETURN [{', '.join(r + '.name' for r in rels)}] AS rels, COUNT(*) AS cnt
+    """
+
+def generate_sample_query(rel_chain):
+    """生成在指定关系序列的路径中抽取 $limit 条的Cypher查询：按由 $seed 与节点id算出的伪随机键排序，同一图谱上结果可复现"""
+    pattern, condition, _ = build_path_pattern(len(rel_chain), rel_chain)
+    return f"""
+    MATCH (h:Entity {{name: $h_name}}), (t:Entity {{name: $t_name}})
+    MATCH path = {pattern}
+    WHERE {condition}
+    WITH path, reduce(key = $seed, n IN nodes(path) | (key * 1103515245 + id(n)) % 2147483648) AS sample_key
+    ORDER BY sample_key LIMIT $limit
+    RETURN nodes(path) AS nodes, relationships(path) AS rels
+    """
+
+def count_signatures(paths):
+    """按关系序列汇总已物化的路径"""
+    signatures = {}
+    for p in paths:
+        signatures[p["path_str"]] = signatures.get(p["path_str"], 0) + 1
+    return signatures
+
+def get_path_signatures(driver, h_name, t_name, max_depth=3, fallback_paths=None):
+    """
+    按关系序列统计头尾实体间的非环路径数，返回 {关系序列: 路径数}（不物化路径）
+    计数查询超时时改为汇总 fallback_paths、PATH_CACHE 中的路径或在 PATH_BUDGET 内枚举的路径，并把实体对标记为估计值
+    """
     cache_key = (h_name, t_name)
-    if cache_key in PATH_CACHE:
-        return PATH_CACHE[cache_key].copy()
+    instrumentation.cache_lookup("SIGNATURE_CACHE", cache_key in SIGNATURE_CACHE)
+    if cache_key in SIGNATURE_CACHE:
+        return SIGNATURE_CACHE[cache_key]
+
+    signatures = {}
+    if cache_key in PATH_CACHE and cache_key not in ESTIMATED_PAIRS:
+        # 已物化过的路径直接汇总，无需再查询
+        signatures = count_signatures(PATH_CACHE[cache_key])
+    else:
+        try:
+            with driver.session() as session:
+                for depth in range(1, max_depth + 1):
+                    query = Query(generate_count_query(depth), timeout=PATH_TIME_LIMIT)
+                    result = session.run(query, h_name=h_name, t_name=t_name)
+                    for record in result:
+                        path_str = "->".join(record["rels"])
+                        signatures[path_str] = signatures.get(path_str, 0) + record["cnt"]
+        except Neo4jError as e:
+            if not is_timeout(e):
+                raise
+            print(f"{h_name} -> {t_name} 路径计数超时，改为按预算内的路径估计")
+            paths = fallback_paths if fallback_paths is not None else PATH_CACHE.get(cache_key)
+            if paths is None:
+                paths = []
+                try:
+                    enumerate_paths(driver, h_name, t_name, max_depth, PATH_BUDGET, paths)
+                except Neo4jError as e:
+                    if not is_timeout(e):
+                        raise
+            signatures = count_signatures(paths)
+            if cache_key not in ESTIMATED_PAIRS:
+                ESTIMATED_PAIRS.add(cache_key)
+                instrumentation.count("pairs_estimated")
+
+    SIGNATURE_CACHE[cache_key] = signatures
+    memory_monitor.maybe_evict()
+    return signatures
+
+def sample_paths_between(driver, h_name, t_name, sample_size, max_depth=3, fallback_paths=None):
+    """
+    均匀路径抽样（不放回）：从全部 N 条路径的编号中无放回抽取 sample_size 个，按关系序列的路径数区间落入各层，
+    再在每个关系序列内抽取相应条数。每条路径被抽中的概率均为 sample_size/N，各层名额不超过其路径数、
+    总数等于 min(sample_size, N)，因此样本上的AV/ART均值是全体路径均值的无偏估计。
+    """
+    signatures = get_path_signatures(driver, h_name, t_name, max_depth, fallback_paths)
+    if not signatures:
+        return []
+
+    path_strs = sorted(signatures)  # 固定顺序，使分配只取决于种子
+    bounds = np.cumsum([signatures[s] for s in path_strs])
+    total = int(bounds[-1])
+    rng = random.Random(f"{PATH_SEED}:{h_name}:{t_name}")
+    picks = rng.sample(range(total), min(sample_size, total))
+    counts = np.bincount(np.searchsorted(bounds, picks, side="right"), minlength=len(path_strs))
+    allocation = {path_str: int(num) for path_str, num in zip(path_strs, counts) if num}
 
     paths = []
+    with driver.session() as session:
+        for path_str, num in allocation.items():
+            rel_chain = path_str.split("->")
+            query = Query(generate_sample_query(rel_chain), timeout=PATH_TIME_LIMIT)
+            result = session.run(query, h_name=h_name, t_name=t_name, limit=num, seed=PATH_SEED)
+            for record in result:
+                paths.append({
+                    "nodes": [node["name"] for node in record["nodes"]],
+                    "rels": rel_chain,
+                    "path_str": path_str
+                })
+    instrumentation.count("paths_sampled", len(paths))
+    return paths
+
+def enumerate_paths(driver, h_name, t_name, max_depth, limit, paths):
+    """枚举头尾实体间至多 limit 条非环路径并追加到 paths（超时抛出时 paths 保留已取回的部分）"""
     query = """
     MATCH path = (h:Entity {name: $h_name})-[*1..%d]->(t:Entity {name: $t_name})
     WHERE all(n IN nodes(path) WHERE single(x IN nodes(path) WHERE x = n))
     RETURN nodes(path) AS nodes, relationships(path) AS rels
+    LIMIT $limit
     """ % max_depth
 
     with driver.session() as session:
-        result = session.run(query, h_name=h_name, t_name=t_name)
+        result = session.run(Query(query, timeout=PATH_TIME_LIMIT), h_name=h_name, t_name=t_name, limit=limit)
         for record in result:
             node_names = [node["name"] for node in record["nodes"]]
             rel_names = [rel["name"] for rel in record["rels"]]
@@ -144,11 +316,62 @@ def get_paths_between(driver, h_name, t_name, max_depth=3):
                 "path_str": "->".join(rel_names)
             })
 
+@instrumentation.timed("get_paths_between")
+def get_paths_between(driver, h_name, t_name, max_depth=3):
+    """获取头尾实体间的所有非环路径（超出路径预算或时间上限时改为均匀抽样）"""
+    cache_key = (h_name, t_name)
+    instrumentation.cache_lookup("PATH_CACHE", cache_key in PATH_CACHE)
+    if cache_key in PATH_CACHE:
+        return PATH_CACHE[cache_key].copy()
+
+    paths = []
+    exceeded = False
+    try:
+        enumerate_paths(driver, h_name, t_name, max_depth, PATH_BUDGET + 1, paths)
+        exceeded = len(paths) > PATH_BUDGET
+    except Neo4jError as e:
+        if not is_timeout(e):
+            raise
+        exceeded = True
+    instrumentation.count("paths_enumerated", len(paths))
+
+    if exceeded:
+        print(f"{h_name} -> {t_name} 路径数超出预算，改为抽样 {PATH_SAMPLE_SIZE} 条路径估计")
+        ESTIMATED_PAIRS.add(cache_key)
+        instrumentation.count("pairs_estimated")
+        try:
+            paths = sample_paths_between(driver, h_name, t_name, PATH_SAMPLE_SIZE, max_depth,
+                                         fallback_paths=paths[:PATH_BUDGET])
+        except Neo4jError as e:
+            if not is_timeout(e):
+                raise
+            # 抽样查询同样超时，只能退化为已取回的前 PATH_BUDGET 条路径
+            paths = paths[:PATH_BUDGET]
+            SIGNATURE_CACHE[cache_key] = count_signatures(paths)
+
     PATH_CACHE[cache_key] = paths
+    memory_monitor.maybe_evict()
     return paths
 
+def PS_count(driver, pred_pair, case_pair):
+    """计算路径相似度（计数模式）：分子为共有关系序列数，分母为预测对的路径总数"""
+    pred_h, pred_t = pred_pair
+    case_h, case_t = case_pair
+
+    pred_signatures = get_path_signatures(driver, pred_h, pred_t)
+    pred_path_num = sum(pred_signatures.values())
+    if not pred_path_num:
+        return 0.0
+
+    case_signatures = get_path_signatures(driver, case_h, case_t)
+    intersection = len(pred_signatures.keys() & case_signatures.keys())
+    return intersection / pred_path_num
+
 def PS(driver, pred_pair, case_pair):
     """计算路径相似度"""
+    if PS_MODE == "count":
+        return PS_count(driver, pred_pair, case_pair)
+
     pred_h, pred_t = pred_pair
     case_h, case_t = case_pair
 
@@ -160,27 +383,76 @@ def PS(driver, pred_pair, case_pair):
     # 获取案例对路径
     case_paths = [p["path_str"] for p in get_paths_between(driver, case_h, case_t)]
 
+    # 抽样得到的路径不完整，改用按关系序列聚合的精确计数
+    if (pred_h, pred_t) in ESTIMATED_PAIRS or (case_h, case_t) in ESTIMATED_PAIRS:
+        return PS_count(driver, pred_pair, case_pair)
+
     # 计算交集比例
     intersection = len(set(pred_paths) & set(case_paths))
     # print(f"预测三元组子图路径数：{len(pred_paths)}，案例三元组子图路径数：{len(case_paths)}，相同路径数：{intersection}")
     return intersection / len(pred_paths)
 
-def SS(driver, pred_pair, case_pair):
-    """计算子图相似度"""
-    # 加载嵌入字典
-    with open('../entity_embeddings.pkl', 'rb') as f:
-        entity_embeddings = pickle.load(f)
-
+def entity_similarities(embeddings, name, names):
+    """一个实体与一批实体的嵌入相似度 (cos + 1) / 2（整批计算），与 get_entity_similarity 语义一致"""
+    result = np.zeros(len(names), dtype=np.float64)
+    vec = embeddings.get(name, None)
+    found = [i for i, n in enumerate(names) if n in embeddings]
+    if vec is None or not found:
+        return result
+    vec = np.asarray(vec, dtype=np.float64)
+    matrix = np.array([embeddings[names[i]] for i in found], dtype=np.float64).reshape(len(found), -1)
+    norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(vec)
+    cos = np.divide(matrix @ vec, norms, out=np.zeros(len(found)), where=norms > 0)
+    result[found] = (cos + 1) / 2
+    return result
+
+def case_similarities(pred_pair, case_pairs):
+    """预测三元组与一批案例的头/尾实体嵌入相似度（整批计算）：量化嵌入在量化行上计算，float64 在原始嵌入上计算"""
+    heads, tails = [h for h, _ in case_pairs], [t for _, t in case_pairs]
+    if EMBEDDING_DTYPE != "float64":
+        store = load_quantized(EMBEDDING_DTYPE, EMBEDDINGS_FILE)
+        return store.similarity([pred_pair[0]] * len(case_pairs), heads), store.similarity([pred_pair[1]] * len(case_pairs), tails)
+    entity_embeddings = load_embeddings(EMBEDDINGS_FILE)
+    return entity_similarities(entity_embeddings, pred_pair[0], heads), entity_similarities(entity_embeddings, pred_pair[1], tails)
+
+def embedding_vectors(names):
+    """一批实体的嵌入矩阵（与 EMBEDDING_DTYPE 一致），无嵌入的实体为零向量"""
+    if EMBEDDING_DTYPE != "float64":
+        return load_quantized(EMBEDDING_DTYPE, EMBEDDINGS_FILE).vectors(names)
+    return dict_vectors(load_embeddings(EMBEDDINGS_FILE), names)
+
+def nearest_cases(pred_pair, top_cases):
+    """
+    按头/尾嵌入相似度检索与预测三元组最相似的 CASE_NEIGHBORS 个TopK案例（保持原SD排序），
+    返回带对应 weights（TIE_CAP 抽样权重，旧版SD表中的列表为1）的 TopCases
+    """
+    if not CASE_NEIGHBORS or len(top_cases) <= CASE_NEIGHBORS:
+        return top_cases
+    cached = CASE_INDEX_CACHE.get(id(top_cases))
+    if cached is None:
+        cached = CASE_INDEX_CACHE[id(top_cases)] = (top_cases, build_case_index(embedding_vectors, [case for case, _ in top_cases]))
+        memory_monitor.maybe_evict()
+    index = cached[1]
+    found, _ = index.search(pair_matrix(embedding_vectors, [pred_pair]), CASE_NEIGHBORS)
+    chosen = [i for i in sorted(found[0].tolist()) if i >= 0]
+    weights = getattr(top_cases, "weights", None)
+    return TopCases([top_cases[i] for i in chosen], [weights[i] for i in chosen] if weights is not None else None)
+
+def SS(driver, pred_pair, case_pair, hes=None, tes=None):
+    """计算子图相似度（hes/tes 可由调用方批量算好后传入）"""
     # 分解实体对
     pred_h, pred_t = pred_pair
     case_h, case_t = case_pair
 
-    # 计算头实体相似度
-    hes = get_entity_similarity(entity_embeddings, pred_h, case_h)
-    # print(f"HES:{hes}")
-    # 计算尾实体相似度
-    tes = get_entity_similarity(entity_embeddings, pred_t, case_t)
-    # print(f"TES:{tes}")
+    if hes is None or tes is None:
+        # 加载嵌入字典（进程内只加载一次）
+        entity_embeddings = load_embeddings(EMBEDDINGS_FILE)
+        # 计算头实体相似度
+        hes = get_entity_similarity(entity_embeddings, pred_h, case_h)
+        # print(f"HES:{hes}")
+        # 计算尾实体相似度
+        tes = get_entity_similarity(entity_embeddings, pred_t, case_t)
+        # print(f"TES:{tes}")
     # 计算路径相似度
     ps = PS(driver, pred_pair, case_pair)
     # print(f"PS:{ps}")
@@ -188,45 +460,158 @@ def SS(driver, pred_pair, case_pair):
     # 返回平均分
     return (hes + tes + ps) / 3
 
-def get_top_cases(case_sd_list, topk=3):
-    """获取TopK案例（含并列排名）"""
-    if not case_sd_list:
-        return []
-
-    # 按SD降序排序
-    sorted_cases = sorted(case_sd_list, key=lambda x: x[1], reverse=True)
-
-    top_cases = []
-    current_rank = 1
-    prev_sd = None
-
-    for (case, sd) in sorted_cases:
-        if prev_sd is None:
-            prev_sd = sd
-        elif sd != prev_sd:
-            current_rank = current_rank + 1
-            prev_sd = sd
-        if current_rank > topk:
-            break
-        top_cases.append((case, sd))
-
-    return top_cases
-
+def stratified_sample(cases, cap, seed=0):
+    """
+    从一个SD并列组中分层抽样 cap 个案例（保持原顺序）：以去重后实体较少的一侧（头或尾）的实体为层，
+    各层按大小成比例分配名额（最大余数法），使样本覆盖组内的主要实体
+    """
+    side = 0 if len({h for h, _ in cases}) <= len({t for _, t in cases}) else 1
+    strata = {}
+    for case in cases:
+        strata.setdefault(case[side], []).append(case)
+    quotas = {key: cap * len(members) / len(cases) for key, members in strata.items()}
+    alloc = {key: int(quota) for key, quota in quotas.items()}
+    for key in sorted(quotas, key=lambda k: (alloc[k] - quotas[k], k))[:cap - sum(alloc.values())]:
+        alloc[key] += 1
+    rng = random.Random(seed)
+    chosen = set()
+    for key in sorted(strata):
+        chosen.update(rng.sample(strata[key], alloc[key]))
+    return [case for case in cases if case in chosen]
+
+@instrumentation.timed("top_cases")
+def get_top_cases(case_sd_list, topk=3, tie_cap=None, tie_seed=None):
+    """
+    获取TopK案例（含并列排名）：保留SD值位于前topk个不同取值的全部案例，按SD降序（同SD按实体对排序，
+    结果与 case_sd_list 的顺序无关，抽样SD与全部计算、各次运行得到相同的TopK）；
+    tie_cap 给出时，超过该数目的并列组以 tie_seed（缺省为 TIE_SEED）分层抽样为 tie_cap 个，保留案例的权重为 组大小/tie_cap
+    """
+    tie_seed = TIE_SEED if tie_seed is None else tie_seed
+    if not case_sd_list or topk < 1:
+        return TopCases()
+
+    sds = np.array([sd for _, sd in case_sd_list], dtype=np.float64)
+    levels = np.unique(sds)[::-1][:topk]
+    keep = np.flatnonzero(sds >= levels[-1])
+    order = np.array(sorted(keep.tolist(), key=lambda i: (-sds[i], case_sd_list[i][0])), dtype=np.int64)
+
+    top_cases, weights = [], []
+    bounds = np.flatnonzero(np.diff(sds[order])) + 1
+    for group in np.split(order, bounds):
+        cases = [case_sd_list[i] for i in group.tolist()]
+        if tie_cap and len(cases) > tie_cap:
+            sampled = stratified_sample([case for case, _ in cases], tie_cap, tie_seed)
+            print(f"SD={cases[0][1]} 的 {len(cases)} 个并列案例分层抽样为 {tie_cap} 个")
+            top_cases.extend((case, cases[0][1]) for case in sampled)
+            weights.extend([len(cases) / tie_cap] * tie_cap)
+        else:
+            top_cases.extend(cases)
+            weights.extend([1.0] * len(cases))
+    return TopCases(top_cases, weights)
+
+def wilson_interval(hits, n, confidence=SD_CONFIDENCE):
+    """二项比例的 Wilson 置信区间"""
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    p = hits / n
+    denom = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denom
+    half = z * np.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denom
+    return max(0.0, center - half), min(1.0, center + half)
+
+@instrumentation.timed("SD_sampled")
+def sampled_case_sds(driver, case_pairs, rules_list, match_cache, topk):
+    """
+    抽样SD：随机抽取 SD_SAMPLE_SIZE 个案例计算精确SD，样本中第topk个不同SD取值 threshold 是全体第topk个取值的下界
+    （样本的取值是全体取值的子集）；SD为所匹配规则置信度的均值，不超过其中最大的置信度，
+    因此只有匹配了置信度≥threshold的规则的案例才可能进入TopK，只对这些案例计算精确SD（规则链整体匹配，不逐案例查询）。
+    返回 (样本与候选案例的SD列表, 抽样信息)；得到的TopK与全部计算时一致
+    """
+    case_pairs = sorted(case_pairs)
+    sample = random.Random(SD_SEED).sample(case_pairs, SD_SAMPLE_SIZE)
+    sds = {case_pair: SD(driver, case_pair, rules_list, match_cache)
+           for case_pair in tqdm(sample, desc="计算样本案例SD值")}
+    levels = sorted(set(sds.values()), reverse=True)
+    # 样本中不足topk个取值时无法给出下界，退化为全部计算
+    threshold = levels[topk - 1] if len(levels) >= topk else 0.0
+    hits = sum(sd >= threshold for sd in sds.values())
+    low, high = wilson_interval(hits, len(sample))
+    print(f"样本中第{topk}个SD取值为 {threshold:.4f}（全体的下界），SD≥该值的案例占 {hits / len(sample):.2%}，"
+          f"{SD_CONFIDENCE:.0%}置信区间 [{low:.2%}, {high:.2%}]，约 {low * len(case_pairs):.0f}~{high * len(case_pairs):.0f} 个案例")
+
+    if threshold > 0:
+        codes = np.array([c for c in (match_cache.encode(h, t) for h, t in case_pairs) if c is not None], dtype=np.int64)
+        matched = np.zeros(len(codes), dtype=bool)
+        for rule in rules_list[:10]:  # 与 SD 一致，只看前10条规则
+            if rule["conf"] >= threshold - 1e-12:  # 容许均值计算的舍入误差
+                matched |= np.isin(codes, match_cache.match(rule["rule"]))
+        candidates = match_cache.decode(codes[matched])
+    else:
+        candidates = case_pairs
+    candidates = [case_pair for case_pair in candidates if case_pair not in sds]
+    print(f"规则置信度筛选后对 {len(candidates)} 个候选案例计算精确SD（共 {len(case_pairs)} 个案例）")
+    for case_pair in tqdm(candidates, desc="计算候选案例SD值"):
+        sds[case_pair] = SD(driver, case_pair, rules_list, match_cache)
+
+    sampling = {"topk": topk, "cases": len(case_pairs), "sample_size": len(sample), "threshold": threshold,
+                "above_threshold": [hits / len(sample), low, high], "computed": len(sds)}
+    return list(sds.items()), sampling
+
+def prepare_top_cases(driver, relation, rules_file, topk, cache_dir=SD_CACHE_DIR, fingerprint=None):
+    """读取持久化的SD表与TopK案例，缺失时计算并保存"""
+    fingerprint = fingerprint or graph_fingerprint(driver)
+    sd_table = load_sd_table(cache_dir, relation, rules_file, fingerprint)
+    if sd_table is not None and sd_table.get("sampling") and topk > sd_table["sampling"]["topk"]:
+        print(f"已有SD表按 topk={sd_table['sampling']['topk']} 抽样筛选，不含 topk={topk} 所需的案例，重新计算")
+        sd_table = None
+    if sd_table is None:
+        case_pairs = find_cases(driver, relation)
+        print(f"找到 {len(case_pairs)} 个案例对")
+
+        rules_list = rules_preprocessing(rules_file)
+        match_cache = RuleMatchCache(driver, fingerprint)
+        sampling = None
+        if SD_MODE == "sampled" and len(case_pairs) > SD_SAMPLE_SIZE:
+            SDs, sampling = sampled_case_sds(driver, case_pairs, rules_list, match_cache, topk)
+        else:
+            SDs = []
+            for case_pair in tqdm(case_pairs, desc="计算案例三元组SD值"):
+                sd = SD(driver, case_pair, rules_list, match_cache)
+                SDs.append((case_pair, sd))
+        sd_table = new_sd_table(relation, rules_file, fingerprint, SDs, sampling)
+        save_sd_table(cache_dir, sd_table)
+    else:
+        print(f"已加载SD表，共 {len(sd_table['case_sds'])} 个案例对")
+
+    key = top_cases_key(topk, TIE_CAP, TIE_SEED)
+    if key not in sd_table["top_cases"]:
+        sd_table["top_cases"][key] = get_top_cases(sd_table["case_sds"], topk, TIE_CAP, TIE_SEED)
+        save_sd_table(cache_dir, sd_table)
+    return sd_table["top_cases"][key]
+
+@instrumentation.timed("CSSM")
 def CSSM(driver, pred_pair, top_cases):
-    cssm = 0
-    idx = 0
-    for case_pair, sd in top_cases:
-        # print(f"案例三元组{idx}:")
-        ss = SS(driver, pred_pair, case_pair)
-        # print(f"SS:{ss}")
-        cssm += sd * ss
-        idx += 1
+    """
+    案例子图相似度 Σ 权重·SD·SS / Σ 权重：全部案例的HES/TES整批计算，按SD并列组的权重一次性聚合；
+    未抽样时权重均为1，即 Σ SD·SS / 案例数
+    """
+    selected = nearest_cases(pred_pair, top_cases)
+    if not selected:
+        return 0
+    # 旧版SD表中的列表（无 weights）按均值计
+    weights = getattr(selected, "weights", None)
+    weights = np.ones(len(selected)) if weights is None else np.asarray(weights, dtype=np.float64)
+    case_pairs = [case for case, _ in selected]
+    sds = np.array([sd for _, sd in selected], dtype=np.float64)
 
-    return cssm / len(top_cases) if top_cases else 0
+    hes, tes = case_similarities(pred_pair, case_pairs)
+    ps = np.array([PS(driver, pred_pair, case_pair) for case_pair in case_pairs], dtype=np.float64)
+    ss = (hes + tes + ps) / 3
+    return float(weights @ (sds * ss) / weights.sum())
 
 
 def get_entity_degree_and_relation_type(session, entity_name):
     """获取实体连接度数和不同关系类型数（带缓存）"""
+    instrumentation.cache_lookup("ENTITY_PROP_CACHE", entity_name in ENTITY_PROP_CACHE)
     if entity_name in ENTITY_PROP_CACHE:
         return ENTITY_PROP_CACHE[entity_name]
 
@@ -251,7 +636,7 @@ def AV_ART(driver, h_name, t_name):
     av_sum, art_sum = 0, 0
 
     with driver.session() as session:
-        paths = PATH_CACHE[(h_name, t_name)]
+        paths = get_paths_between(driver, h_name, t_name)
         if not paths:
             return 0.0, 0.0
 
@@ -281,62 +666,133 @@ def AV_ART(driver, h_name, t_name):
     print(f"AV: {av} ART: {art}")
     return av, art
 
+@instrumentation.timed("FSCM")
 def FSCM(driver, h_name, t_name):
     av, art = AV_ART(driver, h_name, t_name)
     return (av + art) / 2
 
+def fetch_entity_props(driver, entity_names):
+    """批量查询实体连接度数和关系类型数，补全 ENTITY_PROP_CACHE，返回 {实体: 属性}"""
+    props = {name: ENTITY_PROP_CACHE[name] for name in entity_names if name in ENTITY_PROP_CACHE}
+    missing = [name for name in entity_names if name not in props]
+    instrumentation.cache_lookup("ENTITY_PROP_CACHE", True, len(props))
+    instrumentation.cache_lookup("ENTITY_PROP_CACHE", False, len(missing))
+    if not missing:
+        return props
 
-if __name__ == "__main__":
-    driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+    query = """
+    UNWIND $names AS name
+    MATCH (n:Entity {name: name})-[r:RELATION]-()
+    RETURN 
+      name,
+      COUNT(r) AS degree,
+      COUNT(DISTINCT r.name) AS relation_types
+    """
+
+    with driver.session() as session:
+        result = session.run(query, names=missing)
+        for record in result:
+            props[record["name"]] = {
+                "degree": record["degree"] or 0,
+                "relation_types": record["relation_types"] or 0
+            }
+    # 没有任何关系的实体不会出现在结果中
+    for name in missing:
+        props.setdefault(name, {"degree": 0, "relation_types": 0})
+        ENTITY_PROP_CACHE[name] = props[name]
+    # 返回本次结果，缓存随后被淘汰也不影响调用方
+    return props
+
+@instrumentation.timed("FSCM_batch")
+def FSCM_batch(driver, pairs):
+    """向量化计算一批实体对的FSCM，返回与 pairs 顺序一致的列表"""
+    buffers = build_path_buffers([(pair, get_paths_between(driver, pair[0], pair[1])) for pair in pairs])
+    props = fetch_entity_props(driver, buffers["entities"])
+
+    degrees = np.array([props[name]["degree"] for name in buffers["entities"]], dtype=np.float64)
+    types = np.array([props[name]["relation_types"] for name in buffers["entities"]], dtype=np.float64)
+    av, art = AV_ART_batch(buffers, degrees, types, I_MAX, R)
+    return list((av + art) / 2)
+
+
+def main():
+    driver = instrumentation.instrument_driver(GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD)))
     relation = ':'.join(os.path.basename(os.getcwd()).split('_'))
     print(f"relation: {relation}")
-    predicted_pairs = []
-    with open(PREDICTED_PAIRS_FILE, 'r', encoding="utf-8") as f:
-        lines = f.readlines()
-        for line in lines:
-            h, t, fp = line.strip().split('\t')
-            predicted_pairs.append({'pair': (h, t), 'fp': fp})
-
-    case_pairs = find_cases(driver, relation)
-    print(f"找到 {len(case_pairs)} 个案例对")
-
-    SDs =[]
-    for case_pair in tqdm(case_pairs, desc="计算案例三元组SD值"):
-        sd = SD(driver, case_pair, rules_preprocessing(RULES_FILE))
-        SDs.append((case_pair, sd))
-
-    # # 按SD值降序输出结果
-    # sorted_results = sorted(SDs, key=lambda x: x[1], reverse=True)
-    # for case_pair, sd in sorted_results:
-    #     print(f"{case_pair[0]} -> {case_pair[1]} : {sd:.4f}")
-
-    # test_pred_pair = predicted_pairs[0]
-    # test_case_pair = list(case_pairs)[0]
-    # print(f"测试预测三元组：{test_pred_pair}\t测试案例三元组：{test_case_pair}")
-    # ss = SS(driver, test_pred_pair, test_case_pair)
-    # print(f"SS值：{ss}")
-
-    top_cases = get_top_cases(SDs, topk)
+
+    fingerprint = graph_fingerprint(driver)
+    stamp_inputs = [pair_file(PREDICTED_PAIRS_FILE), RULES_FILE, EMBEDDINGS_FILE]
+    stamp_params = {"relation": relation, "topk": topk, "I_MAX": I_MAX, "R": R, "PS_MODE": PS_MODE,
+                    "PATH_BUDGET": PATH_BUDGET, "PATH_SAMPLE_SIZE": PATH_SAMPLE_SIZE, "PATH_SEED": PATH_SEED,
+                    "PATH_TIME_LIMIT": PATH_TIME_LIMIT, "FSCM_MODE": FSCM_MODE, "EMBEDDING_DTYPE": EMBEDDING_DTYPE,
+                    "CASE_NEIGHBORS": CASE_NEIGHBORS, "TIE_CAP": TIE_CAP}
+    if TIE_CAP:
+        stamp_params["TIE_SEED"] = TIE_SEED  # 决定保留哪些并列案例，只在限制并列组时影响结果
+    if REUSE_OUTPUTS and is_fresh(OUTPUT_FILE, fingerprint, stamp_inputs, stamp_params):
+        driver.close()
+        print(f"图谱、输入文件与参数均未变化，复用已有的 {OUTPUT_FILE}")
+        return
+    for path in (stamp_inputs[0], EMBEDDINGS_FILE):
+        if stamp_status(path, fingerprint) == "stale":
+            print(f"警告：{path} 基于另一版本的图谱计算，请重新生成")
+
+    test_table = read_pairs(PREDICTED_PAIRS_FILE, "labels")
+    predicted_pairs = [{'pair': pair, 'fp': fp} for pair, fp in zip(test_table.pairs(), test_table["fp"].tolist())]
+
+    with memory_monitor.stage("top_cases"):
+        top_cases = prepare_top_cases(driver, relation, RULES_FILE, topk, fingerprint=fingerprint)
     print(f"选取Top {topk} SD值共 {len(top_cases)} 个案例对")
+    if len(top_cases) < sum(getattr(top_cases, "weights", ())):
+        print(f"并列组抽样后的案例代表全部 {sum(top_cases.weights):.0f} 个TopK案例")
+
+    if FSCM_MODE == "vectorized":
+        with memory_monitor.stage("FSCM_batch"):
+            fscm_list = FSCM_batch(driver, [p['pair'] for p in predicted_pairs])
 
     indicators = []
     cnt = 0
-    for pred_pair in tqdm(predicted_pairs, desc="计算预测三元组可靠性分数"):
-        pair = pred_pair['pair']
-        fp = int(pred_pair['fp'])
-        print(f"预测三元组{cnt}:")
-        cssm = CSSM(driver, pair, top_cases)
-        print(f"CSSM: {cssm}")
-        fscm = FSCM(driver, pair[0], pair[1])
-        print(f"FSCM: {fscm}")
-        indicators.append((pair, cssm, fscm, fp))
-        cnt += 1
+    with memory_monitor.stage("scoring"):
+        for pred_pair in tqdm(predicted_pairs, desc="计算预测三元组可靠性分数"):
+            pair = pred_pair['pair']
+            fp = int(pred_pair['fp'])
+            print(f"预测三元组{cnt}:")
+            with instrumentation.trace_pair(pair, fp=fp):
+                cssm = CSSM(driver, pair, top_cases)
+                print(f"CSSM: {cssm}")
+                fscm = fscm_list[cnt] if FSCM_MODE == "vectorized" else FSCM(driver, pair[0], pair[1])
+                print(f"FSCM: {fscm}")
+            indicators.append((pair, cssm, fscm, fp))
+            cnt += 1
 
     tp_sum, fp_sum = 0, 0
     tp_cnt, fp_cnt = 0, 0
     # sorted_indicators = sorted(indicators, key=lambda x: x[-2], reverse=True)
-    with open(OUTPUT_FILE, 'w', encoding="utf-8") as f:
-        for (h, t), cssm, fscm, fp in indicators:
-            # print(f"\n预测对: {h}->{t} | CSSM={cssm:.4f} | FSCM={fscm:.4f} | 是否为假阳性结果: {fp}")
-            f.write(f"{h}\t{t}\t{cssm}\t{fscm}\t{fp}\n")
-    driver.close()
\ No newline at end of file
+    # estimated 列标记FSCM是否为路径抽样得到的估计值
+    write_pairs(OUTPUT_FILE, PairTable.from_pairs("indicators", [pair for pair, _, _, _ in indicators],
+                                                  cssm=[cssm for _, cssm, _, _ in indicators],
+                                                  fscm=[fscm for _, _, fscm, _ in indicators],
+                                                  fp=[fp for _, _, _, fp in indicators],
+                                                  estimated=[pair in ESTIMATED_PAIRS for pair, _, _, _ in indicators]))
+    write_stamp(OUTPUT_FILE, fingerprint, stamp_inputs, stamp_params)
+    print(f"共 {sum((p['pair'] in ESTIMATED_PAIRS) for p in predicted_pairs)} 个预测三元组的FSCM为抽样估计值")
+
+    if EMBEDDING_DTYPE != "float64" and EMBEDDING_REPORT_FILE:
+        report = cssm_report(load_embeddings(EMBEDDINGS_FILE), load_quantized(EMBEDDING_DTYPE, EMBEDDINGS_FILE),
+                             [p['pair'] for p in predicted_pairs], top_cases, select=nearest_cases)
+        with open(EMBEDDING_REPORT_FILE, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        if "cssm_abs_error" in report:
+            print(f"{EMBEDDING_DTYPE} 量化嵌入的CSSM与全精度之差：平均 {report['cssm_abs_error']['mean']:.2e}，"
+                  f"最大 {report['cssm_abs_error']['max']:.2e}（见 {EMBEDDING_REPORT_FILE}）")
+
+    instrumentation.dump(INSTRUMENT_FILE, relation=relation, pairs=len(predicted_pairs),
+                         ps_mode=PS_MODE, fscm_mode=FSCM_MODE)
+    print(f"阶段耗时与计数汇总已写入 {INSTRUMENT_FILE}")
+    if TRACE_FILE:
+        instrumentation.write_trace(TRACE_FILE)
+        print(f"逐实体对明细已写入 {TRACE_FILE}")
+    driver.close()
+
+
+if __name__ == "__main__":
+    run_stage("indicator_calculation", main)
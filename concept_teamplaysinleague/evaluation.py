@@ -1,17 +1,22 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from graph_snapshot import stamp_fingerprint, write_stamp
+from pair_store import PairTable, pair_file, read_pairs, write_pairs
+from profiling import run_stage
+
 def main():
-    predicted_file = "predicted_pairs.txt"
+    predicted_file = "predicted_pairs.npz"
     sort_test_file = "sort_test.pairs"
+    output_file = "test_pairs.npz"
 
-    # 1. 读取predicted_pairs
-    predicted_pairs = set()
-    with open(predicted_file, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            h, t = line.split("\t")
-            predicted_pairs.add((h, t))
+    # 1. 读取predicted_pairs（无二进制结果时读取 predicted_pairs.txt）
+    predicted_pairs = set(read_pairs(predicted_file, "pairs").pairs())
+    predicted_file = pair_file(predicted_file)
 
     # 2. 读取sort_test.pairs 并解析标签
     #    格式例如: "thing$concept astronaut mail,thing$concept bank site: -"
@@ -48,9 +53,10 @@ def main():
                 FN += 1
             else:
                 TN += 1
-    with open("test_pairs.txt", "w", encoding="utf-8") as f:
-        for(pair, isFP) in test_pairs:
-            f.write(f"{pair[0]}\t{pair[1]}\t{isFP}\n")
+    write_pairs(output_file, PairTable.from_pairs("labels", [pair for pair, _ in test_pairs],
+                                                  fp=[isFP for _, isFP in test_pairs]))
+    # 不查询图谱，沿用 predicted_pairs 计算时的图谱指纹
+    write_stamp(output_file, stamp_fingerprint(predicted_file), [predicted_file, sort_test_file])
 
 
     # 4. 计算指标
@@ -68,4 +74,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    run_stage("evaluation", main)
@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+实体嵌入加载：同一进程内只反序列化一次 entity_embeddings.pkl
+量化嵌入：由 entity_embeddings.pkl（或 entity2vec.bern + entity2id.txt）派生 float16 / int8（逐行缩放因子）矩阵，
+以内存映射加载，各工作进程共享同一份页缓存；余弦相似度直接在量化行上批量计算
+  <QUANTIZED_DIR>/<源文件名>.<精度>.names.npy      排序后的实体名（与 id_dict 相同的布局）
+  <QUANTIZED_DIR>/<源文件名>.<精度>.ids.npy        与 names 对齐的行号
+  <QUANTIZED_DIR>/<源文件名>.<精度>.rows.npy       量化后的嵌入矩阵
+  <QUANTIZED_DIR>/<源文件名>.<精度>.scales.npy     逐行缩放因子（原向量 ≈ 行 × 缩放因子，float16 为1）
+  <QUANTIZED_DIR>/<源文件名>.<精度>.inv_norms.npy  量化行范数的倒数（零向量为0）
+  <QUANTIZED_DIR>/<源文件名>.<精度>.meta.json      源文件大小与修改时间，源文件变化后自动重建
+
+  预先构建并报告相似度误差：python embedding_store.py [--source entity_embeddings.pkl] [--dtypes float16 int8]
+"""
+
+import argparse
+import json
+import os
+import pickle
+
+import numpy as np
+
+from id_dict import ENTITY2ID_FILE, IdDict, load_id_dict, source_meta
+
+# ============ 配置区域 ============
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+EMBEDDINGS_FILE = os.path.join(ROOT_DIR, "entity_embeddings.pkl")
+ENTITY2VEC_FILE = os.path.join(ROOT_DIR, "entity2vec.bern")
+QUANTIZED_DIR = os.path.join(ROOT_DIR, "embedding_cache")
+QUANTIZED_DTYPES = ("float16", "int8")
+REPORT_SAMPLE_SIZE = 100000  # 命令行报告中抽样比较的实体对数
+
+_EMBEDDINGS = {}  # {文件绝对路径: 嵌入字典}
+_QUANTIZED = {}  # {(源文件绝对路径, 精度): (源文件元数据, QuantizedEmbeddings)}
+
+
+def load_embeddings(path=EMBEDDINGS_FILE):
+    """加载实体嵌入字典（带进程内缓存）"""
+    path = os.path.abspath(path)
+    if path not in _EMBEDDINGS:
+        with open(path, "rb") as f:
+            _EMBEDDINGS[path] = pickle.load(f)
+    return _EMBEDDINGS[path]
+
+
+# ---------- 量化嵌入 ----------
+def read_embedding_matrix(source):
+    """读取全精度嵌入：.pkl 为 {实体名: 向量}；否则为 entity2vec 格式（第 i 行对应 entity2id 文件中的第 i 个实体）"""
+    if source.endswith(".pkl"):
+        with open(source, "rb") as f:
+            embeddings = pickle.load(f)  # 不放入 _EMBEDDINGS，构建完即释放
+        return list(embeddings), np.array(list(embeddings.values()), dtype=np.float64).reshape(len(embeddings), -1)
+    matrix = np.loadtxt(source, dtype=np.float64, ndmin=2)
+    return load_id_dict(ENTITY2ID_FILE).file_order_names()[:len(matrix)], matrix
+
+
+def quantize(matrix, dtype):
+    """全精度矩阵 -> (量化行, 逐行缩放因子)"""
+    if dtype == "float16":
+        return matrix.astype(np.float16), np.ones(len(matrix), dtype=np.float32)
+    if dtype == "int8":
+        scales = np.abs(matrix).max(axis=1, initial=0.0) / 127
+        scales[scales == 0] = 1.0
+        return np.rint(matrix / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    raise ValueError(f"不支持的嵌入精度: {dtype}")
+
+
+def quantized_paths(source, dtype, cache_dir=QUANTIZED_DIR):
+    base = os.path.join(cache_dir, f"{os.path.basename(source)}.{dtype}")
+    keys = ("names", "ids", "rows", "scales", "inv_norms")
+    return {key: f"{base}.{key}.npy" for key in keys}, f"{base}.meta.json"
+
+
+def quantized_arrays(source, dtype):
+    """由全精度嵌入计算量化嵌入的各数组，返回 ({数组名: 数组}, 维数)"""
+    names, matrix = read_embedding_matrix(source)
+    rows, scales = quantize(matrix, dtype)
+    norms = np.linalg.norm(rows.astype(np.float64), axis=1)
+    inv_norms = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0).astype(np.float32)
+    encoded = np.char.encode(np.asarray(names, dtype=str), "utf-8") if names else np.array([], dtype="S1")
+    order = np.argsort(encoded, kind="stable")
+    arrays = {"names": encoded[order], "ids": order.astype(np.int64), "rows": rows, "scales": scales,
+              "inv_norms": inv_norms}
+    return arrays, int(matrix.shape[1])
+
+
+def build_quantized(source, dtype, cache_dir=QUANTIZED_DIR):
+    """由全精度嵌入构建量化嵌入文件"""
+    arrays, dim = quantized_arrays(source, dtype)
+    os.makedirs(cache_dir, exist_ok=True)
+    paths, meta_path = quantized_paths(source, dtype, cache_dir)
+    for key, array in arrays.items():
+        tmp_path = f"{paths[key]}.{os.getpid()}.tmp.npy"
+        np.save(tmp_path, array)
+        os.replace(tmp_path, paths[key])
+    tmp_path = f"{meta_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(dict(source_meta(source), dtype=dtype, count=len(arrays["rows"]), dim=dim),
+                  f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, meta_path)
+
+
+class QuantizedEmbeddings:
+    """量化嵌入矩阵，按实体名批量计算 (cos + 1) / 2 相似度"""
+
+    def __init__(self, dtype, names, ids, rows, scales, inv_norms):
+        self.dtype = dtype
+        self.ids = IdDict(names, ids, np.arange(len(ids)))  # 实体名 -> 行号
+        self.rows = rows
+        self.scales = scales
+        self.inv_norms = inv_norms
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def nbytes(self):
+        return self.rows.nbytes + self.scales.nbytes + self.inv_norms.nbytes
+
+    def vectors(self, names):
+        """批量取反量化后的嵌入（float32），无嵌入的实体为零向量"""
+        idx = self.ids.lookup(names)
+        result = np.zeros((len(idx), self.rows.shape[1]), dtype=np.float32)
+        found = idx >= 0
+        result[found] = self.rows[idx[found]].astype(np.float32) * self.scales[idx[found], None]
+        return result
+
+    def similarity(self, names1, names2):
+        """
+        逐对计算实体嵌入相似度 (cos + 1) / 2，与 get_entity_similarity 语义一致：
+        任一实体无嵌入时为0，零向量的余弦按0计。int8 的逐行缩放因子在余弦中相互抵消，直接用量化行计算
+        """
+        idx1, idx2 = self.ids.lookup(names1), self.ids.lookup(names2)
+        found = (idx1 >= 0) & (idx2 >= 0)
+        result = np.zeros(len(idx1), dtype=np.float64)
+        if found.any():
+            i1, i2 = idx1[found], idx2[found]
+            # int8 乘积之和在 float32 中精确（50维时远小于 2^24）
+            dots = np.einsum("ij,ij->i", self.rows[i1].astype(np.float32), self.rows[i2].astype(np.float32))
+            cos = dots.astype(np.float64) * self.inv_norms[i1] * self.inv_norms[i2]
+            result[found] = (cos + 1) / 2
+        return result
+
+
+def load_quantized(dtype, source=EMBEDDINGS_FILE, cache_dir=QUANTIZED_DIR):
+    """加载量化嵌入（内存映射，带进程内缓存）；缺失或源文件变化时重新构建"""
+    source = os.path.abspath(source)
+    key, current = (source, dtype), source_meta(source)
+    if key in _QUANTIZED and _QUANTIZED[key][0] == current:
+        return _QUANTIZED[key][1]
+
+    paths, meta_path = quantized_paths(source, dtype, cache_dir)
+    meta = None
+    if os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    if (meta is None or any(meta.get(k) != v for k, v in current.items())
+            or not all(os.path.exists(p) for p in paths.values())):
+        build_quantized(source, dtype, cache_dir)
+    store = QuantizedEmbeddings(dtype, *(np.load(paths[k], mmap_mode="r")
+                                         for k in ("names", "ids", "rows", "scales", "inv_norms")))
+    _QUANTIZED[key] = (current, store)
+    return store
+
+
+def register_quantized(store, source=EMBEDDINGS_FILE):
+    """登记由其他途径得到的量化嵌入（如 shared_arrays 发布的共享数组），此后 load_quantized 直接返回它"""
+    source = os.path.abspath(source)
+    _QUANTIZED[(source, store.dtype)] = (source_meta(source), store)
+
+
+def full_similarity(embeddings, names1, names2):
+    """全精度 (cos + 1) / 2（逐对，用于与量化结果比较）"""
+    result = np.zeros(len(names1), dtype=np.float64)
+    for i, (a, b) in enumerate(zip(names1, names2)):
+        vec1, vec2 = embeddings.get(a), embeddings.get(b)
+        if vec1 is None or vec2 is None:
+            continue
+        vec1, vec2 = np.asarray(vec1, dtype=np.float64), np.asarray(vec2, dtype=np.float64)
+        norm = np.linalg.norm(vec1) * np.linalg.norm(vec2)
+        result[i] = ((np.dot(vec1, vec2) / norm if norm else 0.0) + 1) / 2
+    return result
+
+
+def cssm_report(embeddings, store, pred_pairs, top_cases, select=None):
+    """
+    量化嵌入对CSSM的影响：CSSM = Σ w·sd·(HES + TES + PS) / 3 / Σ w，PS与精度无关，
+    因此CSSM之差只来自 HES/TES，无需重新查询路径即可精确得到。
+    与 indicator_calculation.CSSM 一致：select(pred_pair, top_cases) 给出各预测三元组实际参与计算的案例
+    （如 CASE_NEIGHBORS 的近邻子集），按其 weights（TIE_CAP 抽样权重）加权，无 weights 的列表按均值计
+    """
+    if not pred_pairs or not top_cases:
+        return {"dtype": store.dtype, "pairs": len(pred_pairs), "cases": len(top_cases)}
+    delta_cssm, delta_sim, case_num = [], [], 0
+    for h, t in pred_pairs:
+        cases = select((h, t), top_cases) if select is not None else top_cases
+        if not cases:
+            delta_cssm.append(0.0)
+            continue
+        weights = getattr(cases, "weights", None)
+        weights = np.ones(len(cases)) if weights is None else np.asarray(weights, dtype=np.float64)
+        sds = np.array([sd for _, sd in cases], dtype=np.float64)
+        case_heads = [case_h for (case_h, _), _ in cases]
+        case_tails = [case_t for (_, case_t), _ in cases]
+        delta_hes = store.similarity([h] * len(cases), case_heads) - full_similarity(embeddings, [h] * len(cases), case_heads)
+        delta_tes = store.similarity([t] * len(cases), case_tails) - full_similarity(embeddings, [t] * len(cases), case_tails)
+        delta_cssm.append(float(weights @ ((delta_hes + delta_tes) * sds) / 3 / weights.sum()))
+        delta_sim.append(np.abs(np.concatenate([delta_hes, delta_tes])))
+        case_num += len(cases)
+    delta_cssm = np.abs(np.array(delta_cssm))
+    delta_sim = np.concatenate(delta_sim) if delta_sim else np.zeros(1)
+    return {
+        "dtype": store.dtype,
+        "pairs": len(pred_pairs),
+        "cases": len(top_cases),
+        "cases_per_pair": case_num / len(pred_pairs),
+        "embedding_bytes": int(store.nbytes),
+        "similarity_abs_error": {"mean": float(delta_sim.mean()), "max": float(delta_sim.max())},
+        "cssm_abs_error": {"mean": float(delta_cssm.mean()), "max": float(delta_cssm.max())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="构建量化嵌入并报告与全精度的相似度误差")
+    parser.add_argument("--source", default=EMBEDDINGS_FILE if os.path.exists(EMBEDDINGS_FILE) else ENTITY2VEC_FILE,
+                        help="entity_embeddings.pkl 或 entity2vec.bern")
+    parser.add_argument("--dtypes", nargs="+", default=list(QUANTIZED_DTYPES), choices=QUANTIZED_DTYPES)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    names, matrix = read_embedding_matrix(args.source)
+    embeddings = dict(zip(names, matrix))
+    rng = np.random.default_rng(args.seed)
+    sample = rng.integers(len(names), size=(min(REPORT_SAMPLE_SIZE, len(names) ** 2), 2))
+    names1, names2 = [names[i] for i in sample[:, 0]], [names[i] for i in sample[:, 1]]
+    full = full_similarity(embeddings, names1, names2)
+    print(f"{args.source}: {len(names)} 个实体，{matrix.shape[1]} 维，全精度 {matrix.nbytes / 2 ** 20:.2f} MB")
+    for dtype in args.dtypes:
+        store = load_quantized(dtype, args.source)
+        error = np.abs(store.similarity(names1, names2) - full)
+        print(f"  {dtype}: {store.nbytes / 2 ** 20:.2f} MB，抽样 {len(error)} 对相似度误差 "
+              f"平均 {error.mean():.2e}，最大 {error.max():.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,8 @@
 import struct
 import pickle
 import numpy as np
+from graph_snapshot import GRAPH_MANIFEST_FILE, load_manifest, write_stamp
+from id_dict import load_id_dict
 
 # ============ 配置区域 ============
 ENTITY2ID_FILE = "entity2id.txt"
@@ -12,21 +14,12 @@ OUTPUT_FILE = "entity_embeddings.pkl"  # 输出字典文件
 
 
 def parse_entity2vec():
-    """解析实体到向量的映射文件"""
-    entities = []
-    with open(ENTITY2ID_FILE, "r", encoding="utf-8") as f:
-        lines = f.readlines()
-        for line in lines[1:]:
-            parts = line.strip().split("\t")
-            entity = parts[0]
-            entities.append(entity)
-    embeddings = {}
-    with open(ENTITY2VEC_FILE, "r", encoding="utf-8") as f:
-        lines = f.readlines()
-        for i, line in enumerate(lines):
-            vector = [float(x) for x in line.strip().split("\t")]
-            embeddings[entities[i]] = vector
-    return embeddings
+    """解析实体到向量的映射文件（entity2vec 第 i 行对应 entity2id 文件中的第 i 个实体）"""
+    entities = load_id_dict(ENTITY2ID_FILE).file_order_names()
+    vectors = np.loadtxt(ENTITY2VEC_FILE, dtype=np.float64, ndmin=2)  # 行尾可能带制表符，按空白分隔
+    if len(vectors) > len(entities):
+        raise ValueError(f"{ENTITY2VEC_FILE} 有 {len(vectors)} 行，多于 {ENTITY2ID_FILE} 中的 {len(entities)} 个实体")
+    return dict(zip(entities, vectors.tolist()))
 
 
 def main():
@@ -42,6 +35,13 @@ def main():
         pickle.dump(embeddings, f)
     print(f"\n已保存嵌入字典到 {OUTPUT_FILE}")
 
+    # 以导入脚本写出的快照清单中的图谱指纹为嵌入打戳记（嵌入应在当前图谱上训练），图谱变化后各阶段据此提示嵌入已过期
+    manifest = load_manifest()
+    if manifest is not None:
+        write_stamp(OUTPUT_FILE, manifest["fingerprint"], [ENTITY2ID_FILE, ENTITY2VEC_FILE])
+    else:
+        print(f"警告：未找到 {GRAPH_MANIFEST_FILE}，不为 {OUTPUT_FILE} 打戳记（可先运行 graph_snapshot.py --write）")
+
     # 验证示例
     test_entity = next(iter(embeddings.keys()))
     print(f"\n示例验证 - 实体: '{test_entity}'")
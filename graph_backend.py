@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+图后端选择：各脚本统一通过 GraphDatabase.driver(NEO4J_URI, auth=...) 获取驱动，
+按URI（或环境变量 KGFP_GRAPH_URI，优先级更高）选择后端：
+  - bolt://... / neo4j://...      Neo4j 官方驱动
+  - memory://<graph.txt或目录>     进程内内存图（目录下递归查找 graph.txt）
+  - sqlite://<数据库文件>          sqlite_backend 建好的SQLite库（只读）
+  - shared://<名字>                shared_arrays 发布到共享内存的 CSR 图（只读，多进程零拷贝挂载）
+设置环境变量 KGFP_QUERY_LOG 时返回的驱动会记录查询日志（见 query_log.py）。
+"""
+
+import os
+
+from local_driver import LocalDriver, MemoryGraph, Neo4jError, find_graph_files
+from query_log import wrap_driver
+
+GRAPH_URI_ENV = "KGFP_GRAPH_URI"
+
+try:
+    from neo4j import Query
+except ImportError:
+    # 未安装 neo4j 时只能使用本地后端，提供同名替代以便脚本照常导入
+    class Query:
+        def __init__(self, text, metadata=None, timeout=None):
+            self.text = text
+            self.metadata = metadata
+            self.timeout = timeout
+
+_MEMORY_GRAPHS = {}  # {路径: MemoryGraph}，同一进程内的多个驱动共享同一份内存图
+
+
+def load_memory_graph(path):
+    """加载（或取出已加载的）内存图"""
+    path = os.path.abspath(path or ".")
+    if path not in _MEMORY_GRAPHS:
+        graph_files = find_graph_files(path)
+        print(f"内存图：从 {len(graph_files)} 个 graph.txt 文件加载三元组")
+        _MEMORY_GRAPHS[path] = MemoryGraph.from_files(graph_files)
+    return _MEMORY_GRAPHS[path]
+
+
+class GraphDatabase:
+    """与 neo4j.GraphDatabase 同名同用法的驱动工厂"""
+
+    @staticmethod
+    def driver(uri, auth=None, **config):
+        uri = os.environ.get(GRAPH_URI_ENV) or uri
+        # 本地后端不支持 PROFILE，只记录耗时与行数
+        if uri.startswith("memory://"):
+            return wrap_driver(LocalDriver(load_memory_graph(uri[len("memory://"):])), profile=False)
+        if uri.startswith("sqlite://"):
+            from sqlite_backend import SqliteGraph
+            return wrap_driver(LocalDriver(SqliteGraph(uri[len("sqlite://"):])), profile=False)
+        if uri.startswith("shared://"):
+            from shared_arrays import attach_graph
+            return wrap_driver(LocalDriver(attach_graph(uri[len("shared://"):])), profile=False)
+
+        from neo4j import GraphDatabase as Neo4jGraphDatabase
+        return wrap_driver(Neo4jGraphDatabase.driver(uri, auth=auth, **config))
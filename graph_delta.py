@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+图谱增量更新：把增删三元组的差量文件应用到 Neo4j（或评分服务进程内的内存图），
+就地更新快照清单中的内容哈希与各关系三元组数，并只失效受影响的缓存：
+  - 路径/关系序列缓存（PATH_CACHE、SIGNATURE_CACHE、ESTIMATED_PAIRS）：删除头尾实体都落在受影响区域的实体对
+  - 实体度数/关系类型数（ENTITY_PROP_CACHE）：就地刷新变更边端点的条目
+  - 案例近邻索引（CASE_INDEX_CACHE）：TopK案例随SD表迁移重新载入，整体清空
+  - 规则匹配缓存：不含变更关系的规则链迁移到新指纹下，其余下次使用时重新匹配
+  - SD表：只重算受影响区域内的案例对（以及新增/删除的案例），TopK案例据此重排
+
+受影响区域：深度 ≤ MAX_DEPTH 的有向路径/规则链 h -> ... -> u -> v -> ... -> t 经过变更边 (u, v) 时，
+h 最多经 MAX_DEPTH-1 跳到达 u，v 最多经 MAX_DEPTH-1 跳到达 t，
+因此只有头实体在 u 的逆向邻域、尾实体在 v 的正向邻域内的实体对可能受影响。
+经过删除边的旧路径只存在于删除前的图谱中（可能同时经过多条删除边），其区域在应用差量之前计算；
+经过新增边的路径在应用之后计算，两者取并集。
+
+差量文件每行一个三元组，以 + / - 开头表示新增/删除：
+  +\t头实体\t关系\t尾实体
+  -\t头实体\t关系\t尾实体
+
+  python graph_delta.py delta.txt [--depth 3]
+"""
+
+import argparse
+import os
+import time
+
+from graph_backend import GraphDatabase
+from graph_snapshot import (GRAPH_MANIFEST_FILE, entity_count, graph_fingerprint, load_manifest, scan_manifest,
+                            update_manifest, write_manifest)
+from rule_match_cache import migrate as migrate_rule_match_cache
+from scoring_service import ROOT_DIR, load_task_module, task_dir
+from sd_store import load_sd_table, new_sd_table, save_sd_table, split_top_cases_key
+
+# ============ 配置区域 ============
+NEO4J_URI = "bolt://localhost:7687"
+NEO4J_USER = "neo4j"
+NEO4J_PASSWORD = "neo4jDIONG"
+
+MAX_DEPTH = 3  # 路径与规则链的最大深度
+MAX_AFFECTED = 200000  # 受影响区域超过该实体数时（经过枢纽实体）不再逐对判断，直接清空相关缓存
+BATCH_SIZE = 1000  # 每条 UNWIND / IN 查询携带的三元组或实体数
+
+EXISTS_QUERY = """
+UNWIND $rows AS row
+OPTIONAL MATCH (h:Entity {name: row.h})-[rel:RELATION {name: row.r}]->(t:Entity {name: row.t})
+RETURN row.h AS h, row.r AS r, row.t AS t, COUNT(rel) > 0 AS exists
+"""
+ADD_QUERY = """
+UNWIND $rows AS row
+MERGE (h:Entity {name: row.h})
+MERGE (t:Entity {name: row.t})
+MERGE (h)-[:RELATION {name: row.r}]->(t)
+"""
+REMOVE_QUERY = """
+UNWIND $rows AS row
+MATCH (h:Entity {name: row.h})-[rel:RELATION {name: row.r}]->(t:Entity {name: row.t})
+DELETE rel
+"""
+SUCCESSORS_QUERY = "MATCH (n:Entity)-[:RELATION]->(m:Entity) WHERE n.name IN $names RETURN DISTINCT m.name AS name"
+PREDECESSORS_QUERY = "MATCH (m:Entity)-[:RELATION]->(n:Entity) WHERE n.name IN $names RETURN DISTINCT m.name AS name"
+ENTITY_PROPS_QUERY = """
+UNWIND $names AS name
+MATCH (n:Entity {name: name})-[r:RELATION]-()
+RETURN
+  name,
+  COUNT(r) AS degree,
+  COUNT(DISTINCT r.name) AS relation_types
+"""
+
+
+def read_delta(delta_file):
+    """读取差量文件，返回 [(操作, 头实体, 关系, 尾实体)]"""
+    delta = []
+    with open(delta_file, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            parts = line.split("\t")
+            if len(parts) < 4 or parts[0] not in ("+", "-"):
+                print(f"格式错误: {line}")
+                continue
+            delta.append(tuple(parts[:4]))
+    return delta
+
+
+def batches(items, size=BATCH_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def apply_delta(driver, delta):
+    """
+    应用差量（同一三元组多次出现时以最后一次为准），返回实际发生变化的三元组
+    {"added": [(h, r, t)], "removed": [(h, r, t)]}：已存在的新增与不存在的删除被忽略
+    """
+    ops = {}
+    for op, h, r, t in delta:
+        ops[(h, r, t)] = op
+
+    graph = getattr(driver, "graph", None)
+    if graph is not None:
+        # 进程内的本地图直接修改，MemoryGraph 同时增量维护自身的快照清单
+        if not hasattr(graph, "add_triple"):
+            raise NotImplementedError("该图后端为只读，请使用对应的建库脚本重新导入")
+        added = [triple for triple, op in ops.items() if op == "+" and graph.add_triple(*triple)]
+        removed = [triple for triple, op in ops.items() if op == "-" and graph.remove_triple(*triple)]
+        return {"added": added, "removed": removed}
+
+    manifest = load_manifest()
+    if manifest is not None and graph_fingerprint(driver) != manifest["fingerprint"]:
+        manifest = None  # 清单与在线图谱不一致，更新后重新扫描
+
+    added, removed = [], []
+    with driver.session() as session:
+        for batch in batches(ops.items()):
+            rows = [{"h": h, "r": r, "t": t} for (h, r, t), _ in batch]
+            exists = {(rec["h"], rec["r"], rec["t"]): rec["exists"] for rec in session.run(EXISTS_QUERY, rows=rows)}
+            added += [triple for triple, op in batch if op == "+" and not exists[triple]]
+            removed += [triple for triple, op in batch if op == "-" and exists[triple]]
+        for batch in batches(added):
+            session.run(ADD_QUERY, rows=[{"h": h, "r": r, "t": t} for h, r, t in batch]).consume()
+        for batch in batches(removed):
+            session.run(REMOVE_QUERY, rows=[{"h": h, "r": r, "t": t} for h, r, t in batch]).consume()
+
+    if manifest is not None:
+        manifest = update_manifest(manifest, added, removed, entity_count(driver))
+    else:
+        print("没有可用的快照清单，扫描整个图谱重新生成")
+        manifest = scan_manifest(driver)
+    write_manifest(manifest)
+    return {"added": added, "removed": removed}
+
+
+def reachable(driver, seeds, steps, reverse=False):
+    """沿出边（reverse 时沿入边）最多走 steps 跳可达的实体（含起点），超过 MAX_AFFECTED 时返回None"""
+    query = PREDECESSORS_QUERY if reverse else SUCCESSORS_QUERY
+    seen = set(seeds)
+    frontier = set(seeds)
+    with driver.session() as session:
+        for _ in range(steps):
+            found = set()
+            for batch in batches(frontier):
+                found.update(record["name"] for record in session.run(query, names=batch))
+            frontier = found - seen
+            seen |= frontier
+            if len(seen) > MAX_AFFECTED:
+                return None
+            if not frontier:
+                break
+    return seen
+
+
+def affected_region(driver, edges, depth=MAX_DEPTH):
+    """
+    受影响区域 (头实体集合, 尾实体集合)：在 driver 当前的图谱上，实体对 (h, t) 间深度 ≤ depth 的路径可能经过 edges 中的边，
+    当且仅当 h 在头实体集合中且 t 在尾实体集合中。区域过大时返回 (None, None)，表示全部受影响
+    """
+    if not edges:
+        return set(), set()
+    heads = reachable(driver, {h for h, _, _ in edges}, depth - 1, reverse=True)
+    tails = reachable(driver, {t for _, _, t in edges}, depth - 1) if heads is not None else None
+    if heads is None or tails is None:
+        return None, None
+    return heads, tails
+
+
+def merge_regions(*regions):
+    """受影响区域的并集（头、尾集合分别取并集，是各区域之并的超集）"""
+    if any(heads is None for heads, _ in regions):
+        return None, None
+    return set().union(*(heads for heads, _ in regions)), set().union(*(tails for _, tails in regions))
+
+
+def in_region(pair, region):
+    heads, tails = region
+    return heads is None or (pair[0] in heads and pair[1] in tails)
+
+
+def invalidate_caches(driver, caches, changes, region):
+    """失效进程内缓存，caches 为 {"PATH_CACHE": ..., "SIGNATURE_CACHE": ..., ...}，返回各缓存删除/刷新的条目数"""
+    stats = {}
+    for name in ("PATH_CACHE", "SIGNATURE_CACHE", "ESTIMATED_PAIRS"):
+        cache = caches.get(name)
+        if cache is None:
+            continue
+        stale = [pair for pair in cache if in_region(pair, region)]
+        for pair in stale:
+            if isinstance(cache, set):
+                cache.discard(pair)
+            else:
+                del cache[pair]
+        stats[name] = len(stale)
+
+    # 实体的度数与关系类型数只取决于与其相连的边，只需刷新变更边的端点
+    props_cache = caches.get("ENTITY_PROP_CACHE")
+    if props_cache is not None:
+        endpoints = {n for h, _, t in changes["added"] + changes["removed"] for n in (h, t) if n in props_cache}
+        with driver.session() as session:
+            for batch in batches(endpoints):
+                fresh = {rec["name"]: {"degree": rec["degree"] or 0, "relation_types": rec["relation_types"] or 0}
+                         for rec in session.run(ENTITY_PROPS_QUERY, names=batch)}
+                for name in batch:
+                    props_cache[name] = fresh.get(name, {"degree": 0, "relation_types": 0})
+        stats["ENTITY_PROP_CACHE"] = len(endpoints)
+
+    # 案例近邻索引按TopK案例列表构建，差量后TopK案例重新载入，旧索引整体清空
+    case_indexes = caches.get("CASE_INDEX_CACHE")
+    if case_indexes is not None:
+        stats["CASE_INDEX_CACHE"] = len(case_indexes)
+        case_indexes.clear()
+    return stats
+
+
+def task_relations():
+    """根目录下全部任务文件夹对应的关系"""
+    return sorted(":".join(name.split("_", 1)) for name in os.listdir(ROOT_DIR)
+                  if name.startswith("concept_") and os.path.isdir(os.path.join(ROOT_DIR, name)))
+
+
+def migrate_sd_table(driver, indicator, relation, old_fp, new_fp, changes, region):
+    """
+    把旧指纹下的SD表迁移到新指纹：删除不再存在的案例，计算新增案例，
+    规则涉及变更关系时重算受影响区域内的案例；返回重算的案例数，没有旧表时返回None
+    """
+    rules_file = os.path.join(task_dir(relation), indicator.RULES_FILE)
+    cache_dir = os.path.join(task_dir(relation), indicator.SD_CACHE_DIR)
+    table = load_sd_table(cache_dir, relation, rules_file, old_fp)
+    if table is None or table.get("sampling"):
+        return None  # 抽样筛选的部分SD表不含阈值以下的案例，变更后无法增量维护，下次使用时重新计算
+
+    rules_list = indicator.rules_preprocessing(rules_file)
+    changed_relations = {r for _, r, _ in changes["added"] + changes["removed"]}
+    case_sds = dict(table["case_sds"])
+    for h, r, t in changes["removed"]:
+        if r == relation:
+            case_sds.pop((h, t), None)
+    recompute = {(h, t) for h, r, t in changes["added"] if r == relation and (h, t) not in case_sds}
+    if changed_relations & {rel for rule in rules_list for rel in rule["rule"]}:
+        recompute |= {pair for pair in case_sds if in_region(pair, region)}
+
+    match_cache = indicator.RuleMatchCache(driver, new_fp)
+    for pair in recompute:
+        case_sds[pair] = indicator.SD(driver, pair, rules_list, match_cache)
+
+    new_table = new_sd_table(relation, rules_file, new_fp, case_sds.items())
+    for key in table["top_cases"]:
+        new_table["top_cases"][key] = indicator.get_top_cases(new_table["case_sds"], *split_top_cases_key(key))
+    save_sd_table(cache_dir, new_table)
+    return len(recompute)
+
+
+def update_graph(driver, delta, caches=None, relations=None, depth=MAX_DEPTH):
+    """
+    应用差量并增量维护各级缓存，返回汇总信息。
+    caches 为进程内缓存（评分服务传入其共享缓存），relations 为需要迁移SD表的关系（缺省为全部任务文件夹）
+    """
+    start = time.perf_counter()
+    old_fp = graph_fingerprint(driver)
+    # 删除边在应用差量后不复存在，须在删除前的图谱上计算经过它们的旧路径的区域（不存在的删除只会让区域偏大）
+    last_ops = {(h, r, t): op for op, h, r, t in delta}
+    removed_region = affected_region(driver, [triple for triple, op in last_ops.items() if op == "-"], depth)
+    changes = apply_delta(driver, delta)
+    summary = {"added": len(changes["added"]), "removed": len(changes["removed"]), "old_fingerprint": old_fp}
+    if not changes["added"] and not changes["removed"]:
+        summary["new_fingerprint"] = old_fp
+        return summary
+
+    new_fp = graph_fingerprint(driver)
+    region = merge_regions(removed_region, affected_region(driver, changes["added"], depth))
+    summary.update(new_fingerprint=new_fp,
+                   affected_heads=None if region[0] is None else len(region[0]),
+                   affected_tails=None if region[1] is None else len(region[1]))
+    if caches is not None:
+        summary["caches"] = invalidate_caches(driver, caches, changes, region)
+
+    # 先迁移规则匹配缓存（规则链取自各任务的规则文件），SD重算时即可直接查表
+    changed_relations = {r for _, r, _ in changes["added"] + changes["removed"]}
+    indicators = {relation: load_task_module(relation, "indicator_calculation")
+                  for relation in (task_relations() if relations is None else relations)}
+    chains = [rule["rule"] for relation, indicator in indicators.items()
+              for rule in indicator.rules_preprocessing(os.path.join(task_dir(relation), indicator.RULES_FILE))]
+    kept, dropped = migrate_rule_match_cache(driver, old_fp, new_fp, chains, changed_relations)
+    summary["rule_match_cache"] = {"migrated": kept, "dropped": dropped}
+
+    summary["sd_recomputed"] = {}
+    for relation, indicator in indicators.items():
+        recomputed = migrate_sd_table(driver, indicator, relation, old_fp, new_fp, changes, region)
+        if recomputed is not None:
+            summary["sd_recomputed"][relation] = recomputed
+    summary["seconds"] = time.perf_counter() - start
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="将增删三元组的差量文件应用到图谱并增量维护缓存")
+    parser.add_argument("delta_file")
+    parser.add_argument("--depth", type=int, default=MAX_DEPTH, help="路径与规则链的最大深度")
+    args = parser.parse_args()
+
+    driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+    if getattr(driver, "graph", None) is not None:
+        # 本地图从 graph.txt 加载，命令行进程退出后修改即丢失，缓存却已迁移到新指纹
+        print("本地图后端的增量更新只在进程内生效，请通过评分服务的 POST /delta 使用")
+        return
+
+    delta = read_delta(args.delta_file)
+    print(f"差量文件共 {len(delta)} 条")
+    summary = update_graph(driver, delta, depth=args.depth)
+    driver.close()
+
+    print(f"新增 {summary['added']} 条、删除 {summary['removed']} 条三元组，"
+          f"图谱指纹 {summary['old_fingerprint'][:12]} -> {summary['new_fingerprint'][:12]}")
+    if "rule_match_cache" in summary:
+        print(f"受影响区域：头实体 {summary['affected_heads']} 个，尾实体 {summary['affected_tails']} 个（None 表示全部）")
+        print(f"规则匹配缓存：迁移 {summary['rule_match_cache']['migrated']} 条规则链，"
+              f"丢弃 {summary['rule_match_cache']['dropped']} 条")
+        for relation, recomputed in summary["sd_recomputed"].items():
+            print(f"SD表 {relation}：重算 {recomputed} 个案例对")
+        print(f"快照清单已更新 {GRAPH_MANIFEST_FILE}，耗时 {summary['seconds']:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+图谱指纹与快照清单：用于判断缓存/派生结果是否基于同一份图谱计算
+  - 快照清单（manifest）：由导入脚本在导入后写出，记录去重三元组的内容哈希与各关系的三元组数。
+    内容哈希为各三元组摘要的模 2^128 求和，与导入顺序、重复行无关，增删三元组时直接增减（update_manifest）
+      Neo4j：导入脚本写出 GRAPH_MANIFEST_FILE
+      SQLite：sqlite_backend.load_graph 写入库内 manifest 表
+      内存图：加载时由 MemoryGraph.manifest() 计算
+  - 戳记（stamp）：派生结果旁的 <文件>.stamp，记录计算时的图谱指纹、输入文件哈希与参数，
+    三者均未变化时阶段可直接复用已有结果
+
+  查看当前指纹与各输出的状态：python graph_snapshot.py [--uri URI] [文件 ...]
+  为旧图谱补写清单：        python graph_snapshot.py --write
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+
+# ============ 配置区域 ============
+NEO4J_URI = "bolt://localhost:7687"
+NEO4J_USER = "neo4j"
+NEO4J_PASSWORD = "neo4jDIONG"
+GRAPH_MANIFEST_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "graph_manifest.json")
+STAMP_SUFFIX = ".stamp"
+STAMPED_OUTPUTS = ["predicted_pairs.npz", "test_pairs.npz", "indicators_output.npz"]  # 命令行缺省检查的输出
+
+HASH_MOD = 1 << 128
+TRIPLES_QUERY = "MATCH (h:Entity)-[r:RELATION]->(t:Entity) RETURN h.name AS h, r.name AS r, t.name AS t"
+
+
+def file_hash(path):
+    """计算文件内容的SHA1"""
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def relation_counts(driver):
+    """统计图谱中每种关系的三元组数"""
+    query = """
+    MATCH ()-[r:RELATION]->()
+    RETURN r.name AS name, COUNT(*) AS cnt
+    """
+    counts = {}
+    with driver.session() as session:
+        for record in session.run(query):
+            counts[record["name"]] = record["cnt"]
+    return counts
+
+
+def entity_count(driver):
+    with driver.session() as session:
+        return session.run("MATCH (n:Entity) RETURN COUNT(n) AS cnt").single()["cnt"]
+
+
+def count_fingerprint(entity_num, counts):
+    """根据实体数与各关系的三元组数计算图谱指纹（无快照清单时使用）"""
+    sha1 = hashlib.sha1(f"entities\t{entity_num}\n".encode("utf-8"))
+    for name, cnt in sorted(counts.items()):
+        sha1.update(f"{name}\t{cnt}\n".encode("utf-8"))
+    return sha1.hexdigest()
+
+
+# ---------- 快照清单 ----------
+def triple_digest(h, r, t):
+    """单个三元组的128位摘要"""
+    return int.from_bytes(hashlib.sha1(f"{h}\t{r}\t{t}".encode("utf-8")).digest()[:16], "big")
+
+
+def manifest_fingerprint(content_hash, entity_num, counts):
+    sha1 = hashlib.sha1(f"triples\t{content_hash}\nentities\t{entity_num}\n".encode("utf-8"))
+    for name, cnt in sorted(counts.items()):
+        sha1.update(f"{name}\t{cnt}\n".encode("utf-8"))
+    return sha1.hexdigest()
+
+
+def build_manifest(triples, entity_num=None, sources=()):
+    """
+    由去重后的 (头实体, 关系, 尾实体) 构造快照清单。
+    entity_num 缺省时取三元组中出现的实体数（图中存在孤立实体时应显式传入）。
+    """
+    total = 0
+    counts = {}
+    entities = set() if entity_num is None else None
+    for h, r, t in triples:
+        total = (total + triple_digest(h, r, t)) % HASH_MOD
+        counts[r] = counts.get(r, 0) + 1
+        if entities is not None:
+            entities.add(h)
+            entities.add(t)
+    if entities is not None:
+        entity_num = len(entities)
+    return new_manifest(total, entity_num, counts, sources)
+
+
+def new_manifest(content_hash, entity_num, counts, sources=()):
+    content_hash = f"{content_hash:032x}"
+    return {
+        "fingerprint": manifest_fingerprint(content_hash, entity_num, counts),
+        "content_hash": content_hash,
+        "triple_num": sum(counts.values()),
+        "entity_num": entity_num,
+        "relation_counts": dict(sorted(counts.items())),
+        "sources": {os.path.abspath(p): file_hash(p) for p in sources},
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def update_manifest(manifest, added=(), removed=(), entity_num=None):
+    """
+    按增删的三元组（均为实际发生变化的三元组）增量更新快照清单，无需重新扫描图谱。
+    entity_num 为更新后的实体数，缺省时保持不变。
+    """
+    total = int(manifest["content_hash"], 16)
+    counts = dict(manifest["relation_counts"])
+    for h, r, t in added:
+        total += triple_digest(h, r, t)
+        counts[r] = counts.get(r, 0) + 1
+    for h, r, t in removed:
+        total -= triple_digest(h, r, t)
+        counts[r] -= 1
+        if not counts[r]:
+            del counts[r]
+    if entity_num is None:
+        entity_num = manifest["entity_num"]
+    content_hash = f"{total % HASH_MOD:032x}"
+    return dict(manifest,
+                fingerprint=manifest_fingerprint(content_hash, entity_num, counts),
+                content_hash=content_hash,
+                triple_num=sum(counts.values()),
+                entity_num=entity_num,
+                relation_counts=dict(sorted(counts.items())),
+                updated=time.strftime("%Y-%m-%d %H:%M:%S"))
+
+
+def load_manifest(path=GRAPH_MANIFEST_FILE):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_manifest(manifest, path=GRAPH_MANIFEST_FILE):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def scan_manifest(driver, sources=()):
+    """扫描图谱中的全部三元组构造快照清单（导入脚本在导入结束后调用）"""
+    graph = getattr(driver, "graph", None)
+    if graph is not None and hasattr(graph, "build_manifest"):
+        return graph.build_manifest(sources)
+    entity_num = entity_count(driver)
+    with driver.session(fetch_size=10000) as session:
+        triples = ((rec["h"], rec["r"], rec["t"]) for rec in session.run(TRIPLES_QUERY))
+        return build_manifest(triples, entity_num, sources)
+
+
+def driver_manifest(driver):
+    """驱动对应图谱的快照清单：本地后端由图对象提供，Neo4j 读取 GRAPH_MANIFEST_FILE"""
+    graph = getattr(driver, "graph", None)
+    if graph is not None:
+        return graph.manifest() if hasattr(graph, "manifest") else None
+    return load_manifest()
+
+
+def graph_fingerprint(driver):
+    """
+    图谱指纹：优先使用快照清单中的内容指纹，并以实体数与各关系三元组数核对清单与在线图谱一致；
+    无清单或核对不一致（导入后图谱被其他途径修改）时退化为按计数计算的指纹
+    """
+    entity_num = entity_count(driver)
+    counts = relation_counts(driver)
+    manifest = driver_manifest(driver)
+    if manifest is not None:
+        if manifest["entity_num"] == entity_num and manifest["relation_counts"] == counts:
+            return manifest["fingerprint"]
+        print("图谱快照清单与当前图谱的实体数/关系计数不一致，改用计数指纹（请重新导入或运行 graph_snapshot.py --write）")
+    return count_fingerprint(entity_num, counts)
+
+
+# ---------- 输出戳记 ----------
+def stamp_file(path):
+    return f"{path}{STAMP_SUFFIX}"
+
+
+def new_stamp(fingerprint, inputs=(), params=None):
+    return {
+        "graph_fingerprint": fingerprint,
+        "inputs": {os.path.basename(p): file_hash(p) for p in inputs},
+        "params": params or {},
+    }
+
+
+def write_stamp(path, fingerprint, inputs=(), params=None):
+    """为输出文件写出戳记：图谱指纹、输入文件哈希与参数"""
+    stamp = new_stamp(fingerprint, inputs, params)
+    stamp["output"] = file_hash(path)
+    stamp["created"] = time.strftime("%Y-%m-%d %H:%M:%S")
+    with open(stamp_file(path), "w", encoding="utf-8") as f:
+        json.dump(stamp, f, ensure_ascii=False, indent=2)
+    return stamp
+
+
+def read_stamp(path):
+    if not os.path.exists(stamp_file(path)):
+        return None
+    with open(stamp_file(path), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def stamp_fingerprint(path):
+    """输出文件计算时的图谱指纹，无戳记时返回None"""
+    stamp = read_stamp(path)
+    return stamp["graph_fingerprint"] if stamp else None
+
+
+def is_fresh(path, fingerprint, inputs=(), params=None):
+    """输出存在、未被改动，且其图谱指纹、输入文件与参数均与当前一致"""
+    stamp = read_stamp(path)
+    if stamp is None or not os.path.exists(path) or any(not os.path.exists(p) for p in inputs):
+        return False
+    expected = new_stamp(fingerprint, inputs, params)
+    # 经 JSON 往返后参数中的元组会变成列表，按 JSON 形式比较
+    return (stamp.get("output") == file_hash(path)
+            and all(stamp.get(k) == json.loads(json.dumps(v)) for k, v in expected.items()))
+
+
+def stamp_status(path, fingerprint):
+    """"fresh" / "stale" / "unstamped" / "missing"（只比较图谱指纹）"""
+    if not os.path.exists(path):
+        return "missing"
+    stamped = stamp_fingerprint(path)
+    if stamped is None:
+        return "unstamped"
+    return "fresh" if stamped == fingerprint else "stale"
+
+
+def main():
+    from graph_backend import GraphDatabase
+
+    parser = argparse.ArgumentParser(description="图谱快照清单与输出戳记")
+    parser.add_argument("files", nargs="*", default=STAMPED_OUTPUTS, help="检查戳记的输出文件")
+    parser.add_argument("--uri", default=NEO4J_URI)
+    parser.add_argument("--write", action="store_true", help="扫描当前图谱并写出快照清单（Neo4j）")
+    args = parser.parse_args()
+
+    driver = GraphDatabase.driver(args.uri, auth=(NEO4J_USER, NEO4J_PASSWORD))
+    if args.write:
+        manifest = scan_manifest(driver)
+        write_manifest(manifest)
+        print(f"已写出快照清单 {GRAPH_MANIFEST_FILE}：{manifest['triple_num']} 条三元组，"
+              f"{manifest['entity_num']} 个实体，指纹 {manifest['fingerprint'][:12]}")
+    fingerprint = graph_fingerprint(driver)
+    driver.close()
+
+    print(f"当前图谱指纹: {fingerprint}")
+    for path in args.files:
+        print(f"  {path}: {stamp_status(path, fingerprint)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+实体/关系编号表：entity2id.txt / relation2id.txt 首次使用时解析一次，保存为排序后的定长名字数组与对应编号，
+之后以内存映射加载；名字 -> 编号通过 searchsorted 对整批名字（或整个实体对文件）向量化完成
+  <ID_DICT_CACHE_DIR>/<文件名>.names.npy   按字节序排序的名字（UTF-8 定长字节串）
+  <ID_DICT_CACHE_DIR>/<文件名>.ids.npy     与 names 对齐的编号
+  <ID_DICT_CACHE_DIR>/<文件名>.order.npy   源文件中各行的编号（保留文件顺序，entity2vec 的行与之对应）
+  <ID_DICT_CACHE_DIR>/<文件名>.meta.json   源文件大小与修改时间，源文件变化后自动重建
+
+  预先构建：python id_dict.py [entity2id.txt relation2id.txt]
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+# ============ 配置区域 ============
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+ENTITY2ID_FILE = os.path.join(ROOT_DIR, "entity2id.txt")
+RELATION2ID_FILE = os.path.join(ROOT_DIR, "relation2id.txt")
+ID_DICT_CACHE_DIR = os.path.join(ROOT_DIR, "id_dict_cache")
+
+_ID_DICTS = {}  # {源文件绝对路径: IdDict}
+
+
+def source_meta(path):
+    st = os.stat(path)
+    return {"source": os.path.abspath(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def cache_paths(path, cache_dir=ID_DICT_CACHE_DIR):
+    base = os.path.join(cache_dir, os.path.basename(path))
+    return {key: f"{base}.{key}.npy" for key in ("names", "ids", "order")}, f"{base}.meta.json"
+
+
+def read_id_file(path):
+    """解析编号文件（首行为条目数，其后每行 名字\\t编号），返回 (名字字节串数组, 编号数组)，均为文件顺序"""
+    with open(path, "rb") as f:
+        f.readline()
+        rows = np.loadtxt(f, dtype=np.bytes_, delimiter="\t", comments=None, ndmin=2, encoding="bytes")
+    if rows.shape[0] == 0:
+        return np.array([], dtype="S1"), np.array([], dtype=np.int64)
+    return rows[:, 0].copy(), rows[:, 1].astype(np.int64)
+
+
+def build_id_dict(path, cache_dir=ID_DICT_CACHE_DIR):
+    """解析编号文件并写出排序后的二进制形式"""
+    names, ids = read_id_file(path)
+    order = np.argsort(names, kind="stable")
+    sorted_names = names[order]
+    if len(sorted_names) > 1 and (sorted_names[1:] == sorted_names[:-1]).any():
+        dup = sorted_names[1:][sorted_names[1:] == sorted_names[:-1]][0].decode("utf-8")
+        raise ValueError(f"{path} 中存在重复名字: {dup}")
+
+    os.makedirs(cache_dir, exist_ok=True)
+    paths, meta_path = cache_paths(path, cache_dir)
+    for key, array in (("names", sorted_names), ("ids", ids[order]), ("order", ids)):
+        tmp_path = f"{paths[key]}.{os.getpid()}.tmp.npy"
+        np.save(tmp_path, array)
+        os.replace(tmp_path, paths[key])
+    # 元数据最后写出，作为缓存完整的标志
+    tmp_path = f"{meta_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(dict(source_meta(path), count=int(len(ids))), f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, meta_path)
+
+
+class IdDict:
+    """名字 <-> 编号的双向映射，名字按字节序排序存放，查找为 searchsorted"""
+
+    def __init__(self, names, ids, order):
+        self.names = names  # 排序后的名字
+        self.ids = ids      # 与 names 对齐的编号
+        self.order = order  # 文件顺序的编号
+        self._by_id = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return self.get(name) >= 0
+
+    def lookup(self, names):
+        """批量 名字 -> 编号（str / bytes 均可），不存在的名字为 -1"""
+        query = np.asarray(names)
+        if query.dtype.kind == "U":
+            query = np.char.encode(query, "utf-8")
+        elif query.dtype.kind != "S":
+            query = np.asarray([n.encode("utf-8") if isinstance(n, str) else n for n in query.ravel()],
+                               dtype=np.bytes_).reshape(query.shape)
+        result = np.full(query.shape, -1, dtype=np.int64)
+        if not len(self.names) or not query.size:
+            return result
+        # 长于定长宽度的名字截断后可能与已有名字相同，先排除
+        width = self.names.dtype.itemsize
+        fits = np.char.str_len(query) <= width if query.dtype.itemsize > width else np.ones(query.shape, bool)
+        query = query.astype(self.names.dtype)
+        pos = np.minimum(np.searchsorted(self.names, query), len(self.names) - 1)
+        found = fits & (self.names[pos] == query)
+        result[found] = self.ids[pos[found]]
+        return result
+
+    def get(self, name, default=-1):
+        """单个名字的编号"""
+        idx = int(self.lookup([name])[0])
+        return idx if idx >= 0 else default
+
+    @property
+    def by_id(self):
+        """按编号索引的名字数组（字节串，编号不连续处为空）"""
+        if self._by_id is None:
+            by_id = np.zeros(int(self.ids.max()) + 1 if len(self.ids) else 0, dtype=self.names.dtype)
+            by_id[self.ids] = self.names
+            self._by_id = by_id
+        return self._by_id
+
+    def decode(self, ids):
+        """批量 编号 -> 名字（str 列表）"""
+        return np.char.decode(self.by_id[np.asarray(ids, dtype=np.int64)], "utf-8").tolist()
+
+    def file_order_names(self):
+        """源文件顺序的名字列表"""
+        return self.decode(self.order)
+
+    def pair_ids(self, pair_file, columns=(0, 1), delimiter="\t"):
+        """把实体对文件的名字列整体转换为编号，返回 (行数, 列数) 的 int64 数组，不存在的名字为 -1"""
+        rows = np.loadtxt(pair_file, dtype=np.bytes_, delimiter=delimiter, comments=None,
+                          usecols=columns, ndmin=2, encoding="bytes")
+        return self.lookup(rows)
+
+
+def load_id_dict(path, cache_dir=ID_DICT_CACHE_DIR):
+    """加载编号表（带进程内缓存）；二进制缓存缺失或源文件变化时重新构建"""
+    path = os.path.abspath(path)
+    paths, meta_path = cache_paths(path, cache_dir)
+    meta = None
+    if os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    current = source_meta(path)
+    stale = (meta is None or any(meta.get(k) != v for k, v in current.items())
+             or not all(os.path.exists(p) for p in paths.values()))
+
+    cached = _ID_DICTS.get(path)
+    if cached is not None and not stale:
+        return cached
+    if stale:
+        build_id_dict(path, cache_dir)
+    id_dict = IdDict(*(np.load(paths[key], mmap_mode="r") for key in ("names", "ids", "order")))
+    _ID_DICTS[path] = id_dict
+    return id_dict
+
+
+def load_entity_ids(path=ENTITY2ID_FILE):
+    return load_id_dict(path)
+
+
+def load_relation_ids(path=RELATION2ID_FILE):
+    return load_id_dict(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="构建实体/关系编号表的二进制缓存")
+    parser.add_argument("files", nargs="*", default=[ENTITY2ID_FILE, RELATION2ID_FILE])
+    args = parser.parse_args()
+    for path in args.files:
+        start = time.perf_counter()
+        build_id_dict(path)
+        built = time.perf_counter() - start
+        _ID_DICTS.pop(os.path.abspath(path), None)
+        start = time.perf_counter()
+        id_dict = load_id_dict(path)
+        print(f"{path}: {len(id_dict)} 个名字，构建 {built:.2f}s，内存映射加载 {time.perf_counter() - start:.3f}s，"
+              f"名字宽度 {id_dict.names.dtype.itemsize} 字节")
+
+
+if __name__ == "__main__":
+    main()
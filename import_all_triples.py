@@ -2,7 +2,8 @@
 # -*- coding: utf-8 -*-
 
 import os
-from neo4j import GraphDatabase
+from graph_backend import GraphDatabase
+from graph_snapshot import GRAPH_MANIFEST_FILE, scan_manifest, write_manifest
 
 # ============ 配置区域 ============
 NEO4J_URI = "bolt://localhost:7687"
@@ -82,6 +83,12 @@ def main():
             print(f"\n正在处理文件 [{idx + 1}/{len(graph_files)}]: {graph_path}")
             import_graph_file(session, graph_path)
 
+    # 4. 写出图谱快照清单（去重三元组的内容哈希与各关系计数），供各阶段判断缓存/输出是否过期
+    manifest = scan_manifest(driver, graph_files)
+    write_manifest(manifest)
+    print(f"\n快照清单已写入 {GRAPH_MANIFEST_FILE}：{manifest['triple_num']} 条三元组，"
+          f"{manifest['entity_num']} 个实体，指纹 {manifest['fingerprint'][:12]}")
+
     driver.close()
     print("\n全部导入完成")
 
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+运行埋点：命名阶段计时、计数器与缓存命中统计
+  - timed(name)：装饰器，累计函数的调用次数与耗时（嵌套阶段的耗时是包含关系，不互斥）
+  - count(name, n)：累加计数器，例如 queries / rows / paths_enumerated
+  - cache_lookup(cache, hit)：记录缓存命中或未命中
+  - instrument_driver(driver)：包装驱动，自动统计发出的查询数与返回的行数
+  - trace_pair(pair)：记录单个实体对期间各阶段耗时与计数器增量（逐实体对明细）
+运行结束时 dump() 写出JSON汇总，write_trace() 写出JSONL明细。
+"""
+
+import contextlib
+import functools
+import json
+import threading
+import time
+
+ENABLED = True
+
+_LOCK = threading.Lock()
+_SPANS = {}  # {阶段名: {"calls": 调用次数, "seconds": 累计耗时}}
+_COUNTERS = {}  # {计数器名: 值}
+_TRACE = []  # 逐实体对明细
+
+
+def reset():
+    """清空全部统计"""
+    with _LOCK:
+        _SPANS.clear()
+        _COUNTERS.clear()
+        _TRACE.clear()
+
+
+def record_span(name, seconds):
+    with _LOCK:
+        span = _SPANS.setdefault(name, {"calls": 0, "seconds": 0.0})
+        span["calls"] += 1
+        span["seconds"] += seconds
+
+
+@contextlib.contextmanager
+def span(name):
+    """计时一个命名阶段"""
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - start)
+
+
+def timed(name):
+    """装饰器：以 name 为阶段名计时函数的每次调用"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record_span(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def count(name, n=1):
+    """累加计数器"""
+    if not ENABLED:
+        return
+    with _LOCK:
+        _COUNTERS[name] = _COUNTERS.get(name, 0) + n
+
+
+def cache_lookup(cache_name, hit, n=1):
+    """记录缓存命中（hit=True）或未命中"""
+    count(f"{cache_name}.{'hits' if hit else 'misses'}", n)
+
+
+class InstrumentedResult:
+    """包装查询结果，统计实际取回的行数"""
+
+    def __init__(self, result):
+        self._result = result
+
+    def __iter__(self):
+        # 本地计数，迭代结束（含提前中断）时一次性累加，避免逐行加锁
+        n = 0
+        try:
+            for record in self._result:
+                n += 1
+                yield record
+        finally:
+            count("rows", n)
+
+    def single(self, *args, **kwargs):
+        record = self._result.single(*args, **kwargs)
+        if record is not None:
+            count("rows")
+        return record
+
+    def data(self, *args, **kwargs):
+        rows = self._result.data(*args, **kwargs)
+        count("rows", len(rows))
+        return rows
+
+    def __getattr__(self, name):
+        return getattr(self._result, name)
+
+
+class InstrumentedSession:
+    """包装会话，统计发出的查询数"""
+
+    def __init__(self, session):
+        self._session = session
+
+    def run(self, query, parameters=None, **kwargs):
+        count("queries")
+        return InstrumentedResult(self._session.run(query, parameters, **kwargs))
+
+    def __enter__(self):
+        self._session.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._session.__exit__(*exc)
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+
+class InstrumentedDriver:
+    """包装驱动，使其会话自动统计查询数与返回行数"""
+
+    def __init__(self, driver):
+        self._driver = driver
+
+    def session(self, *args, **kwargs):
+        return InstrumentedSession(self._driver.session(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._driver, name)
+
+
+def instrument_driver(driver):
+    return InstrumentedDriver(driver) if ENABLED else driver
+
+
+def snapshot():
+    """当前各阶段耗时与计数器的副本"""
+    with _LOCK:
+        spans = {name: dict(s) for name, s in _SPANS.items()}
+        counters = dict(_COUNTERS)
+    return spans, counters
+
+
+@contextlib.contextmanager
+def trace_pair(pair, **fields):
+    """
+    记录一个实体对期间的阶段耗时与计数器增量。
+    增量由前后快照相减得到，因此只适用于逐对串行计算的场景。
+    """
+    if not ENABLED:
+        yield
+        return
+    spans_before, counters_before = snapshot()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        spans_after, counters_after = snapshot()
+        entry = {"head": pair[0], "tail": pair[1], "seconds": elapsed, **fields}
+        entry["spans"] = {
+            name: s["seconds"] - spans_before.get(name, {}).get("seconds", 0.0)
+            for name, s in spans_after.items()
+            if s["calls"] != spans_before.get(name, {}).get("calls", 0)
+        }
+        entry["counters"] = {
+            name: value - counters_before.get(name, 0)
+            for name, value in counters_after.items()
+            if value != counters_before.get(name, 0)
+        }
+        with _LOCK:
+            _TRACE.append(entry)
+
+
+def summary(**extra):
+    """汇总各阶段耗时、计数器与缓存命中率"""
+    spans, counters = snapshot()
+    caches = {}
+    for name, value in counters.items():
+        cache_name, _, kind = name.rpartition(".")
+        if kind in ("hits", "misses"):
+            caches.setdefault(cache_name, {"hits": 0, "misses": 0})[kind] = value
+    for stats in caches.values():
+        total = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / total if total else None
+
+    return {
+        **extra,
+        "spans": {
+            name: {**s, "mean_ms": s["seconds"] / s["calls"] * 1000 if s["calls"] else None}
+            for name, s in sorted(spans.items(), key=lambda item: -item[1]["seconds"])
+        },
+        "counters": {name: value for name, value in sorted(counters.items())
+                     if name.rpartition(".")[2] not in ("hits", "misses")},
+        "caches": caches,
+    }
+
+
+def dump(path, **extra):
+    """写出JSON汇总"""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(summary(**extra), f, ensure_ascii=False, indent=2)
+
+
+def write_trace(path):
+    """写出逐实体对明细（JSONL）"""
+    with _LOCK:
+        entries = list(_TRACE)
+    with open(path, "w", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
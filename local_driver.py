@@ -0,0 +1,467 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+本地Neo4j替身驱动：在进程内图上实现本项目实际发出的各类Cypher查询，
+用于基准测试、性能分析与无数据库环境下的离线运行。
+
+  - MemoryGraph：内存图（邻接表），接口与 sqlite_backend.SqliteGraph 一致
+  - LocalDriver / LocalSession：与 neo4j 驱动相同的 session().run() 用法，
+    按查询形态分派到图后端的对应方法；遇到不认识的查询直接报错，不做猜测
+
+通过 graph_backend.GraphDatabase.driver("memory://...") 或 "sqlite://..." 选用。
+"""
+
+import itertools
+import os
+import random
+import re
+import time
+
+import graph_snapshot
+
+try:
+    from neo4j.exceptions import Neo4jError
+except ImportError:
+    # 未安装 neo4j 时提供同名替代，超时判断只依赖 code 属性
+    class Neo4jError(Exception):
+        code = None
+
+
+class LocalTimeout(Neo4jError):
+    """查询超出 Query(timeout=...) 的时间上限，code 与 Neo4j 的事务超时一致"""
+    code = "Neo.ClientError.Transaction.TransactionTimedOut"
+
+
+class MemoryGraph:
+    """内存图：out_edges[h][r] = {t}，in_edges[t][r] = {h}"""
+
+    def __init__(self):
+        self.out_edges = {}
+        self.in_edges = {}
+        self.relation_heads = {}  # {r: {h}}
+        self.relation_sizes = {}  # {r: 三元组数}
+        self.sources = []  # 加载的 graph.txt
+        self._manifest = None
+
+    @classmethod
+    def from_files(cls, graph_files):
+        graph = cls()
+        graph.sources = list(graph_files)
+        for graph_file in graph_files:
+            with open(graph_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.strip().split("\t")
+                    if len(parts) < 3:
+                        continue
+                    graph.add_triple(parts[0], parts[1], parts[2])
+        return graph
+
+    def add_triple(self, h, r, t):
+        """添加三元组（已存在时不重复添加，与 MERGE 一致），返回是否新增"""
+        tails = self.out_edges.setdefault(h, {}).setdefault(r, set())
+        if t in tails:
+            return False
+        tails.add(t)
+        self.in_edges.setdefault(t, {}).setdefault(r, set()).add(h)
+        self.out_edges.setdefault(t, {})
+        self.in_edges.setdefault(h, {})
+        self.relation_heads.setdefault(r, set()).add(h)
+        self.relation_sizes[r] = self.relation_sizes.get(r, 0) + 1
+        if self._manifest is not None:
+            self._manifest = graph_snapshot.update_manifest(self._manifest, added=[(h, r, t)],
+                                                            entity_num=len(self.out_edges))
+        return True
+
+    def remove_triple(self, h, r, t):
+        """删除三元组，返回是否存在（实体节点保留，与只删除关系的 DELETE 一致）"""
+        tails = self.out_edges.get(h, {}).get(r)
+        if not tails or t not in tails:
+            return False
+        tails.discard(t)
+        if not tails:
+            del self.out_edges[h][r]
+            self.relation_heads[r].discard(h)
+        heads = self.in_edges[t][r]
+        heads.discard(h)
+        if not heads:
+            del self.in_edges[t][r]
+        self.relation_sizes[r] -= 1
+        if not self.relation_sizes[r]:
+            del self.relation_sizes[r]
+            del self.relation_heads[r]
+        if self._manifest is not None:
+            self._manifest = graph_snapshot.update_manifest(self._manifest, removed=[(h, r, t)])
+        return True
+
+    def triples(self):
+        """全部 (头实体名, 关系名, 尾实体名)"""
+        return ((h, r, t) for h, rels in self.out_edges.items() for r, tails in rels.items() for t in tails)
+
+    # ---------- 快照清单 ----------
+    def build_manifest(self, sources=None):
+        return graph_snapshot.build_manifest(self.triples(), len(self.out_edges),
+                                             self.sources if sources is None else sources)
+
+    def manifest(self):
+        """当前图谱的快照清单（首次使用时计算，此后随增删三元组增量更新）"""
+        if self._manifest is None:
+            self._manifest = self.build_manifest()
+        return self._manifest
+
+    # ---------- 规则链 ----------
+    def _chain_ends(self, start, rel_chain):
+        """从 start 出发沿规则链可达的终点集合（同名关系重复时保证不重复使用同一条边）"""
+        if len(set(rel_chain)) == len(rel_chain):
+            frontier = {start}
+            for r in rel_chain:
+                frontier = {m for n in frontier for m in self.out_edges.get(n, {}).get(r, ())}
+                if not frontier:
+                    break
+            return frontier
+
+        ends = set()
+
+        def walk(node, depth, used):
+            if depth == len(rel_chain):
+                ends.add(node)
+                return
+            for m in self.out_edges.get(node, {}).get(rel_chain[depth], ()):
+                edge = (node, rel_chain[depth], m)
+                if edge not in used:
+                    walk(m, depth + 1, used | {edge})
+
+        walk(start, 0, frozenset())
+        return ends
+
+    def match_chain(self, rel_chain):
+        """匹配规则链，返回全部 (起点名, 终点名)"""
+        pairs = set()
+        for a in self.relation_heads.get(rel_chain[0], ()):
+            for b in self._chain_ends(a, rel_chain):
+                pairs.add((a, b))
+        return pairs
+
+    def chain_exists(self, rel_chain, h_name, t_name):
+        """判断 h 与 t 之间是否存在满足规则链的路径"""
+        if h_name not in self.out_edges:
+            return False
+        return t_name in self._chain_ends(h_name, rel_chain)
+
+    def relation_pairs(self, rel_name):
+        """某关系的全部 (头实体名, 尾实体名)"""
+        return {(h, t) for h in self.relation_heads.get(rel_name, ()) for t in self.out_edges[h][rel_name]}
+
+    # ---------- 非环路径 ----------
+    def _walk(self, h, t, max_depth, min_depth=1, rel_chain=None):
+        """深度优先枚举 h 到 t 的非环路径（节点两两不同），生成 (节点列表, 关系列表)"""
+        if h not in self.out_edges or t not in self.in_edges or h == t:
+            return
+        # 能一步到达 t 的节点，用于剪枝倒数第二跳
+        pre_t = {n for heads in self.in_edges[t].values() for n in heads}
+        nodes, rels = [h], []
+
+        def expand(node):
+            depth = len(rels)
+            out = self.out_edges.get(node, {})
+            hop_rels = [rel_chain[depth]] if rel_chain else list(out)
+            if min_depth <= depth + 1 <= max_depth:
+                for r in hop_rels:
+                    if t in out.get(r, ()):
+                        yield nodes + [t], rels + [r]
+            if depth + 1 >= max_depth:
+                return
+            for r in hop_rels:
+                for m in out.get(r, ()):
+                    if m == t or m in nodes or (depth + 2 == max_depth and m not in pre_t):
+                        continue
+                    nodes.append(m)
+                    rels.append(r)
+                    yield from expand(m)
+                    nodes.pop()
+                    rels.pop()
+
+        yield from expand(h)
+
+    def paths_between(self, h_name, t_name, max_depth=3, limit=None):
+        """头尾实体间深度≤max_depth的非环路径（至多 limit 条，找够即停止搜索），返回 [(节点名列表, 关系名列表), ...]"""
+        return list(itertools.islice(self._walk(h_name, t_name, max_depth), limit))
+
+    def path_signatures(self, h_name, t_name, max_depth=3, min_depth=1):
+        """按关系序列统计非环路径数，返回 {(关系名, ...): 路径数}"""
+        signatures = {}
+        for _, rels in self._walk(h_name, t_name, max_depth, min_depth):
+            key = tuple(rels)
+            signatures[key] = signatures.get(key, 0) + 1
+        return signatures
+
+    def chain_paths(self, h_name, t_name, rel_chain):
+        """头尾实体间沿指定关系序列的全部非环路径的节点列表"""
+        depth = len(rel_chain)
+        return [nodes for nodes, _ in self._walk(h_name, t_name, depth, depth, rel_chain)]
+
+    # ---------- 邻居 ----------
+    def successors(self, names):
+        """一批实体的全部出边邻居"""
+        return {t for n in names for tails in self.out_edges.get(n, {}).values() for t in tails}
+
+    def predecessors(self, names):
+        """一批实体的全部入边邻居"""
+        return {h for n in names for heads in self.in_edges.get(n, {}).values() for h in heads}
+
+    # ---------- 统计 ----------
+    def entity_props(self, name):
+        """实体的连接度数与不同关系类型数（自环只计一次）"""
+        out = self.out_edges.get(name, {})
+        inc = self.in_edges.get(name, {})
+        degree = sum(len(tails) for tails in out.values()) + sum(len(heads) for heads in inc.values())
+        degree -= sum(1 for tails in out.values() if name in tails)
+        return {"degree": degree, "relation_types": len(set(out) | set(inc))}
+
+    def max_degree(self):
+        """最高连接度数的实体及其度数"""
+        best, best_degree = None, 0
+        for name in self.out_edges:
+            degree = self.entity_props(name)["degree"]
+            if degree > best_degree:
+                best, best_degree = name, degree
+        return best, best_degree
+
+    def entity_count(self):
+        return len(self.out_edges)
+
+    def all_entities(self):
+        return list(self.out_edges)
+
+    def relation_counts(self):
+        """每种关系的三元组数"""
+        return dict(self.relation_sizes)
+
+
+class LocalNode(dict):
+    """节点/关系：与 neo4j 的 Node/Relationship 一样支持 node["name"] 与 node.get("name")"""
+
+
+class LocalRecord(dict):
+    """查询结果记录"""
+
+    def data(self):
+        return dict(self)
+
+
+class LocalResult:
+    """查询结果：可迭代，支持 single() / data() / consume()"""
+
+    def __init__(self, records):
+        self._records = list(records)
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def single(self):
+        return self._records[0] if self._records else None
+
+    def data(self):
+        return [record.data() for record in self._records]
+
+    def consume(self):
+        self._records = []
+
+
+REL_NAME_PATTERN = re.compile(r"-\[\w*:RELATION \{name: '([^']*)'\}\]->")
+REL_VAR_PATTERN = re.compile(r"-\[(r\d+):RELATION\]->")
+
+
+def nodes_and_rels(nodes, rels):
+    return {"nodes": [LocalNode(name=n) for n in nodes], "rels": [LocalNode(name=r) for r in rels]}
+
+
+class LocalSession:
+    """会话：按查询形态分派到图后端"""
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        pass
+
+    def run(self, query, parameters=None, **kwparameters):
+        text = " ".join(getattr(query, "text", query).split())
+        params = dict(parameters or {}, **kwparameters)
+        timeout = getattr(query, "timeout", None)
+        for pattern, handler in QUERY_HANDLERS:
+            if re.search(pattern, text):
+                rows = handler(self.graph, text, params)
+                if timeout is not None:
+                    rows = with_deadline(rows, time.monotonic() + timeout)
+                return LocalResult(LocalRecord(row) for row in rows)
+        raise NotImplementedError(f"本地驱动不支持的查询: {text}")
+
+
+def with_deadline(rows, deadline):
+    """逐行检查时间上限，超时抛出 LocalTimeout（在行与行之间检查，单行的计算不会被打断）"""
+    for row in rows:
+        if time.monotonic() > deadline:
+            raise LocalTimeout("查询超出时间上限")
+        yield row
+    if time.monotonic() > deadline:
+        raise LocalTimeout("查询超出时间上限")
+
+
+# ---------- 各查询形态的处理函数：handler(graph, text, params) -> 行字典的可迭代对象 ----------
+
+def _schema(graph, text, params):
+    return []
+
+
+def _merge_triple(graph, text, params):
+    if not hasattr(graph, "add_triple"):
+        raise NotImplementedError("该图后端为只读，请使用对应的建库脚本导入三元组")
+    graph.add_triple(params["h_name"], params["r_name"], params["t_name"])
+    return []
+
+
+def _find_cases(graph, text, params):
+    for h, t in graph.relation_pairs(params["relation_name"]):
+        yield {"head": h, "tail": t}
+
+
+def _chain_exists(graph, text, params):
+    rel_chain = REL_NAME_PATTERN.findall(text)
+    return [{"exists": graph.chain_exists(rel_chain, params["h_name"], params["t_name"])}]
+
+
+def _chain_match(graph, text, params):
+    rel_chain = REL_NAME_PATTERN.findall(text)
+    for a, b in graph.match_chain(rel_chain):
+        yield {"a": LocalNode(name=a), "b": LocalNode(name=b)}
+
+
+def _chain_match_names(graph, text, params):
+    rel_chain = REL_NAME_PATTERN.findall(text)
+    for a, b in graph.match_chain(rel_chain):  # match_chain 已去重，对应 RETURN DISTINCT
+        yield {"a_name": a, "b_name": b}
+
+
+def _chain_sample(graph, text, params):
+    rel_chain = REL_NAME_PATTERN.findall(text)
+    paths = sorted(graph.chain_paths(params["h_name"], params["t_name"], rel_chain))
+    # 无法复现 Neo4j 的节点id排序，改用由种子与实体对、关系序列确定的抽样（路径先排序，不受集合遍历顺序影响）
+    rng = random.Random(f"{params['seed']}:{params['h_name']}:{params['t_name']}:{'->'.join(rel_chain)}")
+    for nodes in rng.sample(paths, min(params["limit"], len(paths))):
+        yield nodes_and_rels(nodes, rel_chain)
+
+
+def _signature_count(graph, text, params):
+    depth = len(REL_VAR_PATTERN.findall(text))
+    signatures = graph.path_signatures(params["h_name"], params["t_name"], depth, depth)
+    for rels, cnt in signatures.items():
+        yield {"rels": list(rels), "cnt": cnt}
+
+
+def _paths_between(graph, text, params):
+    max_depth = int(re.search(r"\[\*1\.\.(\d+)\]", text).group(1))
+    limit = params["limit"] if "LIMIT $limit" in text else None
+    for nodes, rels in graph.paths_between(params["h_name"], params["t_name"], max_depth, limit):
+        yield nodes_and_rels(nodes, rels)
+
+
+def _successors(graph, text, params):
+    for name in graph.successors(params["names"]):
+        yield {"name": name}
+
+
+def _predecessors(graph, text, params):
+    for name in graph.predecessors(params["names"]):
+        yield {"name": name}
+
+
+def _entity_props(graph, text, params):
+    return [graph.entity_props(params["name"])]
+
+
+def _entity_props_batch(graph, text, params):
+    for name in params["names"]:
+        props = graph.entity_props(name)
+        if props["degree"]:
+            yield dict(props, name=name)
+
+
+def _max_degree(graph, text, params):
+    entity, degree = graph.max_degree()
+    return [{"entity": entity, "degree": degree}] if entity is not None else []
+
+
+def _entity_names(graph, text, params):
+    for name in graph.all_entities():
+        yield {"name": name}
+
+
+def _entity_count(graph, text, params):
+    return [{"cnt": graph.entity_count()}]
+
+
+def _relation_counts(graph, text, params):
+    for name, cnt in graph.relation_counts().items():
+        yield {"name": name, "cnt": cnt}
+
+
+# 按顺序匹配，越具体的形态越靠前
+QUERY_HANDLERS = [
+    (r"^CREATE (CONSTRAINT|INDEX)", _schema),
+    (r"^MERGE \(h:Entity \{name: \$h_name\}\)", _merge_triple),
+    (r"^MATCH \(h\)-\[r:RELATION\]->\(t\) WHERE r\.name = \$relation_name", _find_cases),
+    (r"ORDER BY sample_key LIMIT \$limit", _chain_sample),
+    (r"RETURN COUNT\(\*\) > 0 AS exists$", _chain_exists),
+    (r"RETURN a, b$", _chain_match),
+    (r"RETURN DISTINCT a\.name AS a_name, b\.name AS b_name$", _chain_match_names),
+    (r"AS rels, COUNT\(\*\) AS cnt$", _signature_count),
+    (r"^MATCH path = \(h:Entity \{name: \$h_name\}\)-\[\*1\.\.\d+\]->", _paths_between),
+    (r"^MATCH \(n:Entity\)-\[:RELATION\]->\(m:Entity\) WHERE n\.name IN \$names RETURN DISTINCT m\.name", _successors),
+    (r"^MATCH \(m:Entity\)-\[:RELATION\]->\(n:Entity\) WHERE n\.name IN \$names RETURN DISTINCT m\.name", _predecessors),
+    (r"^UNWIND \$names AS name MATCH \(n:Entity \{name: name\}\)-\[r:RELATION\]-\(\)", _entity_props_batch),
+    (r"^MATCH \(n:Entity \{name: \$name\}\)-\[r:RELATION\]-\(\)", _entity_props),
+    (r"COUNT \{ \(n\)--\(\) \} AS degree ORDER BY degree DESC LIMIT 1", _max_degree),
+    (r"^MATCH \(n:Entity\) RETURN COUNT\(n\) AS cnt$", _entity_count),
+    (r"^MATCH \(n:Entity\) RETURN n\.name AS name$", _entity_names),
+    (r"^MATCH \(\)-\[r:RELATION\]->\(\) RETURN r\.name AS name, COUNT\(\*\) AS cnt$", _relation_counts),
+]
+
+
+class LocalDriver:
+    """与 neo4j Driver 用法一致的本地驱动"""
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def session(self, **config):
+        return LocalSession(self.graph)
+
+    def verify_connectivity(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def find_graph_files(path):
+    """path 为文件时直接使用，为目录时递归查找其中的 graph.txt"""
+    if os.path.isfile(path):
+        return [path]
+    graph_files = []
+    for root, dirs, files in os.walk(path):
+        if "graph.txt" in files:
+            graph_files.append(os.path.join(root, "graph.txt"))
+    return graph_files
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+内存监控：按阶段记录RSS峰值、tracemalloc峰值与增长最多的分配位置，以及各命名缓存的大小；
+RSS超过软上限时按顺序清空可淘汰的缓存，避免进程被OOM杀掉
+  - KGFP_MEMORY_REPORT=1       开启tracemalloc，阶段结束时写出 <阶段>.memory.json
+  - KGFP_MEMORY_LIMIT_MB=<MB>  RSS软上限（缺省使用 MEMORY_SOFT_LIMIT_MB，0 表示不限制）
+"""
+
+import contextlib
+import gc
+import json
+import os
+import resource
+import threading
+import time
+import tracemalloc
+
+# ============ 配置区域 ============
+REPORT_ENV = "KGFP_MEMORY_REPORT"
+LIMIT_ENV = "KGFP_MEMORY_LIMIT_MB"
+MEMORY_SOFT_LIMIT_MB = 0  # RSS软上限（MB），0 表示不限制
+CHECK_EVERY = 10  # 每调用多少次 maybe_evict 检查一次RSS（仅在缓存未命中时调用）
+EVICTION_ORDER = ["PATH_CACHE", "SIGNATURE_CACHE", "ENTITY_PROP_CACHE", "CASE_INDEX_CACHE"]  # 超限时依次清空
+TOP_ALLOCATORS = 15
+TRACE_FRAMES = 1  # tracemalloc 记录的栈深度
+
+_LOCK = threading.Lock()
+_CACHES = []  # [(命名空间, 缓存名)]，淘汰时按名字从命名空间取出当前对象（缓存可能被整体替换）
+_SPANS = []  # 已结束阶段的记录
+_STACK = []  # 进行中的阶段
+_EVICTIONS = []
+_calls = 0
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def report_enabled():
+    return os.environ.get(REPORT_ENV, "") not in ("", "0")
+
+
+def soft_limit_mb():
+    return float(os.environ.get(LIMIT_ENV) or MEMORY_SOFT_LIMIT_MB)
+
+
+def current_rss_mb():
+    """当前RSS（MB），无 /proc 时退化为历史峰值"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE / 2 ** 20
+    except (OSError, IndexError, ValueError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    """RSS峰值（MB）：优先读取可重置的 VmHWM，否则为进程生命周期内的峰值"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def reset_peak_rss():
+    """重置 VmHWM（Linux 4.0+），失败时峰值仍为进程生命周期内的峰值"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def register_caches(namespace, names):
+    """登记命名缓存；namespace 通常为模块的 globals()"""
+    with _LOCK:
+        for name in names:
+            if not any(ns is namespace and n == name for ns, n in _CACHES):
+                _CACHES.append((namespace, name))
+
+
+def cache_sizes():
+    """各命名缓存的条目数（多个模块共享同一缓存对象时只计一次）"""
+    sizes, seen = {}, set()
+    with _LOCK:
+        caches = list(_CACHES)
+    for namespace, name in caches:
+        cache = namespace.get(name)
+        if cache is None or id(cache) in seen:
+            continue
+        seen.add(id(cache))
+        sizes[name] = sizes.get(name, 0) + len(cache)
+    return sizes
+
+
+def evict(reason=""):
+    """按 EVICTION_ORDER 依次清空缓存，直到RSS回到软上限以下"""
+    limit = soft_limit_mb()
+    rss_before = current_rss_mb()
+    cleared = []
+    for target in EVICTION_ORDER:
+        with _LOCK:
+            caches = [namespace.get(name) for namespace, name in _CACHES if name == target]
+        entries = 0
+        for cache in {id(c): c for c in caches if c}.values():
+            entries += len(cache)
+            cache.clear()
+        if entries:
+            cleared.append({"cache": target, "entries": entries})
+        gc.collect()
+        if limit and current_rss_mb() < limit:
+            break
+
+    if not cleared:
+        return None  # 缓存已空，内存被其他对象占用，只能等待或调大上限
+
+    event = {"time": time.time(), "reason": reason, "rss_before_mb": rss_before,
+             "rss_after_mb": current_rss_mb(), "cleared": cleared}
+    with _LOCK:
+        _EVICTIONS.append(event)
+    print(f"内存超过软上限 {limit:.0f}MB（RSS {rss_before:.0f}MB），已清空缓存 "
+          f"{[c['cache'] for c in cleared]}，当前RSS {event['rss_after_mb']:.0f}MB")
+    return event
+
+
+def maybe_evict():
+    """每 CHECK_EVERY 次调用检查一次RSS，超过软上限时淘汰缓存"""
+    global _calls
+    limit = soft_limit_mb()
+    if not limit:
+        return
+    _calls += 1
+    if _calls % CHECK_EVERY:
+        return
+    rss = current_rss_mb()
+    if rss > limit:
+        evict(f"rss {rss:.0f}MB > {limit:.0f}MB")
+
+
+def read_peaks():
+    traced_peak = tracemalloc.get_traced_memory()[1] / 2 ** 20 if tracemalloc.is_tracing() else None
+    return peak_rss_mb(), traced_peak
+
+
+def reset_peaks():
+    reset_peak_rss()
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+
+
+def merge_peaks(a, b):
+    """逐项取 (RSS峰值, tracemalloc峰值) 的较大值，None 表示未记录"""
+    return tuple(max(v for v in pair if v is not None) if any(v is not None for v in pair) else None
+                 for pair in zip(a, b))
+
+
+@contextlib.contextmanager
+def stage(name):
+    """
+    记录一个阶段的RSS变化、RSS/tracemalloc峰值、增长最多的分配位置与阶段结束时的缓存大小。
+    阶段可嵌套：进入子阶段前先把已有峰值并入父阶段再重置。
+    """
+    if _STACK:
+        parent = _STACK[-1]
+        parent["peaks"] = merge_peaks(parent["peaks"], read_peaks())
+    reset_peaks()
+    frame = {"name": name, "peaks": (None, None), "rss_start": current_rss_mb(), "start": time.perf_counter(),
+             "snapshot": tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None}
+    _STACK.append(frame)
+    try:
+        yield
+    finally:
+        _STACK.pop()
+        peak_rss, peak_traced = merge_peaks(frame["peaks"], read_peaks())
+        record = {
+            "stage": name,
+            "depth": len(_STACK),
+            "seconds": time.perf_counter() - frame["start"],
+            "rss_start_mb": frame["rss_start"],
+            "rss_end_mb": current_rss_mb(),
+            "rss_peak_mb": peak_rss,
+            "traced_peak_mb": peak_traced,
+            "caches": cache_sizes(),
+        }
+        if frame["snapshot"] is not None:
+            diff = tracemalloc.take_snapshot().compare_to(frame["snapshot"], "lineno")
+            record["top_allocators"] = [
+                {"location": str(stat.traceback), "size_diff_kb": stat.size_diff / 1024,
+                 "size_kb": stat.size / 1024, "count_diff": stat.count_diff}
+                for stat in diff[:TOP_ALLOCATORS]
+            ]
+        with _LOCK:
+            _SPANS.append(record)
+        if _STACK:
+            parent = _STACK[-1]
+            parent["peaks"] = merge_peaks(parent["peaks"], (peak_rss, peak_traced))
+
+
+@contextlib.contextmanager
+def track_stage(stage_name):
+    """阶段入口使用：开启报告时启动tracemalloc，结束时写出 <阶段>.memory.json"""
+    enabled = report_enabled()
+    started = False
+    if enabled and not tracemalloc.is_tracing():
+        tracemalloc.start(TRACE_FRAMES)
+        started = True
+    try:
+        with stage(stage_name):
+            yield
+    finally:
+        if enabled:
+            write_report(f"{stage_name}.memory.json")
+            print(f"[{stage_name}] 内存报告已写入 {stage_name}.memory.json")
+        if started:
+            tracemalloc.stop()
+
+
+def write_report(path):
+    with _LOCK:
+        report = {"soft_limit_mb": soft_limit_mb(), "stages": list(_SPANS), "evictions": list(_EVICTIONS)}
+    report["caches"] = cache_sizes()
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
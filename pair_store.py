@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+实体对中间结果的二进制列式存储：predicted_pairs / test_pairs / indicators_output / experiment_results/RIS_*
+由 <文件名>.npz 与旁边的 <文件名>.rows.npy 组成，各阶段不再逐行解析文本
+  names    ：该文件中出现的实体名（UTF-8 定长字节串，按字节序排序去重），实体编号即其下标
+  kind     ：文件种类，决定导出文本时的列（TEXT_COLUMNS）
+  rows_hash：行数据的哈希，行数据变化时 .npz 的内容（及据此计算的戳记）随之变化
+  rows     ：结构化数组，每行一个实体对（列见 PAIR_DTYPE，当前种类未用到的列取缺省值），
+             单独存为 .rows.npy，读取时以写时复制的内存映射打开（不复制，修改只在进程内生效）
+
+TEXT_EXPORT=True 时写出二进制的同时在旁边写出与原格式一致的制表符分隔文本（<文件名>.txt）；
+读取时二进制不存在、或文本比二进制新（手工修改或只写文本的旧工具）时读同名 .txt。
+  导出文本：python pair_store.py test_pairs.npz [indicators_output.npz ...]
+"""
+
+import argparse
+import hashlib
+import os
+
+import numpy as np
+
+# ============ 配置区域 ============
+TEXT_EXPORT = True  # 同时写出文本版本，供人工查看与外部工具使用
+CHUNK_ROWS = 100000  # 分块追加、转换与导出文本时每块的行数
+
+PAIR_DTYPE = np.dtype([
+    ("head", "<i4"),       # 头实体编号（names 下标）
+    ("tail", "<i4"),       # 尾实体编号
+    ("fp", "i1"),          # 是否为假阳性结果，-1 表示未知
+    ("estimated", "i1"),   # FSCM 是否为路径抽样得到的估计值
+    ("cssm", "<f8"),
+    ("fscm", "<f8"),
+    ("ris", "<f8"),
+])
+COLUMN_DEFAULTS = {"fp": -1, "estimated": 0, "cssm": np.nan, "fscm": np.nan, "ris": np.nan}
+
+# 各种类导出文本的列（"列名:格式"），与原有文本文件的格式一致
+TEXT_COLUMNS = {
+    "pairs": ["head", "tail"],
+    "labels": ["head", "tail", "fp"],
+    "indicators": ["head", "tail", "cssm", "fscm", "fp", "estimated"],
+    "ris": ["head", "tail", "cssm:.2f", "fscm:.2f", "ris:.2f", "fp"],
+}
+
+
+def encode_names(names):
+    """str 序列 -> UTF-8 定长字节串数组"""
+    names = np.asarray(names, dtype=str)
+    return np.char.encode(names, "utf-8") if names.size else np.array([], dtype="S1")
+
+
+def new_rows(count, **columns):
+    rows = np.zeros(count, dtype=PAIR_DTYPE)
+    for field, default in COLUMN_DEFAULTS.items():
+        rows[field] = columns[field] if field in columns else default
+    return rows
+
+
+class PairTable:
+    """一个实体对文件的内容：实体名表 + 列式行数据"""
+
+    def __init__(self, kind, names, rows):
+        if kind not in TEXT_COLUMNS:
+            raise ValueError(f"未知的实体对文件种类: {kind}")
+        self.kind = kind
+        self.names = names
+        self.rows = rows
+
+    @classmethod
+    def from_pairs(cls, kind, pairs, **columns):
+        """由 [(头实体名, 尾实体名), ...] 与各列的值构造，行顺序与 pairs 一致"""
+        pairs = list(pairs)
+        flat = encode_names([h for h, _ in pairs] + [t for _, t in pairs])
+        names, inverse = np.unique(flat, return_inverse=True)
+        rows = new_rows(len(pairs), **columns)
+        rows["head"] = inverse[:len(pairs)]
+        rows["tail"] = inverse[len(pairs):]
+        return cls(kind, names, rows)
+
+    @classmethod
+    def from_ids(cls, kind, names, heads, tails, **columns):
+        """由互不相同的实体名列表与指向其下标的头/尾编号构造（编号重排为排序后的下标）"""
+        encoded = encode_names(names)
+        order = np.argsort(encoded, kind="stable")
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        rows = new_rows(len(heads), **columns)
+        rows["head"] = rank[np.asarray(heads, dtype=np.int64)]
+        rows["tail"] = rank[np.asarray(tails, dtype=np.int64)]
+        return cls(kind, encoded[order], rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, field):
+        return self.rows[field]
+
+    def decode(self, ids):
+        return np.char.decode(self.names[np.asarray(ids)], "utf-8").tolist() if len(ids) else []
+
+    def heads(self):
+        return self.decode(self.rows["head"])
+
+    def tails(self):
+        return self.decode(self.rows["tail"])
+
+    def pairs(self):
+        """[(头实体名, 尾实体名), ...]，与行顺序一致"""
+        return list(zip(self.heads(), self.tails()))
+
+    def take(self, index):
+        """按下标（或布尔掩码）取子表，实体名表不变"""
+        return PairTable(self.kind, self.names, self.rows[index])
+
+    def text_lines(self):
+        """按 TEXT_COLUMNS 格式化的文本行"""
+        columns = []
+        for spec in TEXT_COLUMNS[self.kind]:
+            field, _, fmt = spec.partition(":")
+            if field in ("head", "tail"):
+                columns.append(self.decode(self.rows[field]))
+            else:
+                values = self.rows[field].tolist()  # 转为 Python 数值，与原先 f"{x}" 写出的文本一致
+                columns.append([format(v, fmt) if fmt else str(v) for v in values])
+        return ["\t".join(values) + "\n" for values in zip(*columns)]
+
+
+def text_path(path):
+    """二进制文件对应的文本文件路径"""
+    return f"{os.path.splitext(path)[0]}.txt"
+
+
+def rows_path(path):
+    """二进制文件对应的行数据文件路径"""
+    return f"{os.path.splitext(path)[0]}.rows.npy"
+
+
+def text_is_newer(path):
+    """文本文件存在且二进制不存在或比文本旧（write_pairs 先写文本再写二进制，正常写出时二进制不旧于文本）"""
+    text = text_path(path)
+    if not os.path.exists(text):
+        return False
+    return not os.path.exists(path) or os.stat(text).st_mtime_ns > os.stat(path).st_mtime_ns
+
+
+def pair_file(path):
+    """实际应读取的结果文件：二进制不存在或比文本旧时为对应的文本文件"""
+    return text_path(path) if text_is_newer(path) else path
+
+
+def rows_digest(rows):
+    """分块计算行数据的哈希"""
+    digest = hashlib.sha256()
+    for start in range(0, len(rows), CHUNK_ROWS):
+        digest.update(np.ascontiguousarray(rows[start:start + CHUNK_ROWS]).tobytes())
+    return digest.hexdigest()
+
+
+def write_text(table, path):
+    """分块格式化写出文本，不一次物化全部文本行"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for start in range(0, len(table), CHUNK_ROWS):
+            f.writelines(table.take(slice(start, start + CHUNK_ROWS)).text_lines())
+    os.replace(tmp_path, path)
+
+
+def write_pairs(path, table, text=None):
+    """
+    写出二进制结果（行数据与 .npz 各自原子替换，先行数据后 .npz）；
+    text（缺省为 TEXT_EXPORT）为真时先写出文本版本，使二进制的修改时间不早于文本
+    """
+    if TEXT_EXPORT if text is None else text:
+        write_text(table, text_path(path))
+    pid = os.getpid()
+    rows_file = rows_path(path)
+    with open(f"{rows_file}.{pid}.tmp", "wb") as f:
+        np.save(f, table.rows)
+    os.replace(f"{rows_file}.{pid}.tmp", rows_file)
+    with open(f"{path}.{pid}.tmp", "wb") as f:
+        np.savez(f, kind=np.array(table.kind), names=table.names, rows_hash=np.array(rows_digest(table.rows)))
+    os.replace(f"{path}.{pid}.tmp", path)
+
+
+class PairAppender:
+    """
+    边产生边写出的实体对结果：实体名在进程内编号，(头编号, 尾编号) 按块追加到临时文件，
+    内存只随实体数而不随实体对数增长；finish 时把临时文件按块转换为二进制结果（行顺序即追加顺序）
+      with PairAppender(path) as out:
+          out.append(out.entity_id(h), out.entity_id(t))
+          ...
+          out.finish()
+    """
+
+    def __init__(self, path, kind="pairs"):
+        self.path = path
+        self.kind = kind
+        self.entity_ids = {}
+        self.ids_path = f"{path}.{os.getpid()}.ids.tmp"
+        self.rows_path = f"{path}.{os.getpid()}.rows.tmp.npy"
+        self.file = open(self.ids_path, "wb")
+        self.buffer = np.empty((CHUNK_ROWS, 2), dtype="<i4")
+        self.filled = 0
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def entity_id(self, name):
+        return self.entity_ids.setdefault(name, len(self.entity_ids))
+
+    def append(self, head_id, tail_id):
+        self.buffer[self.filled] = (head_id, tail_id)
+        self.filled += 1
+        if self.filled == CHUNK_ROWS:
+            self.flush()
+
+    def flush(self):
+        self.buffer[:self.filled].tofile(self.file)
+        self.count += self.filled
+        self.filled = 0
+
+    def finish(self, text=None):
+        """转换为二进制结果（text 同 write_pairs），返回行数"""
+        self.flush()
+        self.file.close()
+        names = encode_names(list(self.entity_ids))
+        order = np.argsort(names, kind="stable")
+        rank = np.empty(len(order), dtype=np.int32)
+        rank[order] = np.arange(len(order))
+
+        # 行数据写入内存映射的临时 .npy，写出时按块读出
+        rows = np.lib.format.open_memmap(self.rows_path, mode="w+", dtype=PAIR_DTYPE, shape=(self.count,))
+        if self.count:
+            ids = np.memmap(self.ids_path, dtype="<i4", mode="r", shape=(self.count, 2))
+            for start in range(0, self.count, CHUNK_ROWS):
+                block = ids[start:start + CHUNK_ROWS]
+                chunk = new_rows(len(block))
+                chunk["head"] = rank[block[:, 0]]
+                chunk["tail"] = rank[block[:, 1]]
+                rows[start:start + len(block)] = chunk
+            del ids
+        write_pairs(self.path, PairTable(self.kind, names[order], rows), text)
+        del rows
+        self.close()
+        return self.count
+
+    def close(self):
+        """关闭并删除临时文件"""
+        self.file.close()
+        for path in (self.ids_path, self.rows_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def parse_text(path, kind):
+    """解析原格式的文本结果"""
+    fields = [spec.partition(":")[0] for spec in TEXT_COLUMNS[kind]]
+    if not os.path.getsize(path):
+        return PairTable.from_pairs(kind, [])
+    with open(path, "rb") as f:
+        cells = np.loadtxt(f, dtype=np.bytes_, delimiter="\t", comments=None, ndmin=2, encoding="bytes")
+    cells = cells[:, :len(fields)]  # 多出的列忽略，缺少的列（如旧版 indicators_output 无第6列）取缺省值
+    columns = {}
+    for i, field in enumerate(fields):
+        if field in ("head", "tail") or i >= cells.shape[1]:
+            continue
+        dtype = PAIR_DTYPE[field]
+        columns[field] = cells[:, i].astype(np.float64).astype(dtype) if dtype.kind == "f" else cells[:, i].astype(dtype)
+    pairs = list(zip(np.char.decode(cells[:, 0], "utf-8").tolist(), np.char.decode(cells[:, 1], "utf-8").tolist()))
+    return PairTable.from_pairs(kind, pairs, **columns)
+
+
+def read_pairs(path, kind=None):
+    """
+    读取结果文件：行数据以内存映射打开（不逐行解析、不复制）；
+    二进制不存在或比同名文本文件旧时解析文本，种类取 kind 或二进制中记录的种类
+    """
+    if text_is_newer(path):
+        if os.path.exists(path):
+            print(f"{text_path(path)} 比 {path} 新，读取文本版本")
+            if kind is None:
+                with np.load(path, allow_pickle=False) as data:
+                    kind = str(data["kind"])
+        if kind is None:
+            raise FileNotFoundError(path)
+        return parse_text(text_path(path), kind)
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+
+    with np.load(path, allow_pickle=False) as data:
+        stored_kind, names = str(data["kind"]), data["names"]
+        # 旧版文件的行数据存放在 .npz 内
+        rows = data["rows"] if "rows" in data.files else np.load(rows_path(path), mmap_mode="c")
+    if kind is not None and stored_kind != kind:
+        raise ValueError(f"{path} 的种类为 {stored_kind}，期望 {kind}")
+    return PairTable(stored_kind, names, rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="把二进制实体对结果导出为文本")
+    parser.add_argument("files", nargs="+")
+    args = parser.parse_args()
+    for path in args.files:
+        table = read_pairs(path)
+        write_text(table, text_path(path))
+        print(f"{path}: {len(table)} 行（{table.kind}）-> {text_path(path)}")
+
+
+if __name__ == "__main__":
+    main()
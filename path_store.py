@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+路径紧凑存储与向量化FSCM计算
+  - build_path_buffers：把若干实体对的路径（get_paths_between 的结果）展平为整数缓冲区
+  - AV_ART_batch：基于缓冲区与实体度数/关系类型数数组，一次性计算一批实体对的AV、ART
+"""
+
+import numpy as np
+
+
+def build_path_buffers(paths_by_pair, entity_index=None):
+    """
+    将 [(pair, paths), ...] 展平为紧凑缓冲区，返回字典：
+      node_ids:     所有路径节点的实体下标顺序拼接 (int64)
+      path_offsets: 第i条路径的节点位于 node_ids[path_offsets[i]:path_offsets[i+1]]
+      pair_offsets: 第j个实体对的路径位于路径序号 [pair_offsets[j], pair_offsets[j+1])
+      pairs:        实体对列表，与 pair_offsets 对应
+      entities:     实体下标 -> 实体名
+    entity_index 为可复用的 {实体名: 下标} 字典，新出现的实体会追加进去
+    """
+    if entity_index is None:
+        entity_index = {}
+
+    node_ids = []
+    path_offsets = [0]
+    pair_offsets = [0]
+    pairs = []
+    for pair, paths in paths_by_pair:
+        for path in paths:
+            for node in path["nodes"]:
+                idx = entity_index.get(node)
+                if idx is None:
+                    idx = len(entity_index)
+                    entity_index[node] = idx
+                node_ids.append(idx)
+            path_offsets.append(len(node_ids))
+        pair_offsets.append(len(path_offsets) - 1)
+        pairs.append(pair)
+
+    entities = [None] * len(entity_index)
+    for name, idx in entity_index.items():
+        entities[idx] = name
+
+    return {
+        "node_ids": np.asarray(node_ids, dtype=np.int64),
+        "path_offsets": np.asarray(path_offsets, dtype=np.int64),
+        "pair_offsets": np.asarray(pair_offsets, dtype=np.int64),
+        "pairs": pairs,
+        "entities": entities,
+    }
+
+
+def AV_ART_batch(buffers, degrees, relation_types, i_max, r):
+    """
+    向量化计算一批实体对的AV和ART
+      degrees / relation_types：按实体下标排列的度数、关系类型数数组
+    每条路径先对节点去重再求均值，实体对取其全部路径的均值，结果截断到1
+    """
+    node_ids = buffers["node_ids"]
+    path_offsets = buffers["path_offsets"]
+    pair_offsets = buffers["pair_offsets"]
+    path_num = len(path_offsets) - 1
+    pair_num = len(pair_offsets) - 1
+
+    if path_num == 0:
+        return np.zeros(pair_num), np.zeros(pair_num)
+
+    # 每个节点所属的路径序号
+    path_idx = np.repeat(np.arange(path_num), np.diff(path_offsets))
+
+    # 路径内节点去重：按 (路径, 节点) 排序后保留每段的首次出现
+    order = np.lexsort((node_ids, path_idx))
+    sorted_paths = path_idx[order]
+    sorted_nodes = node_ids[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (sorted_paths[1:] != sorted_paths[:-1]) | (sorted_nodes[1:] != sorted_nodes[:-1])
+    unique_paths = sorted_paths[first]
+    unique_nodes = sorted_nodes[first]
+
+    # 分段求和（bincount 对空段也能正确给出0）
+    degrees = np.asarray(degrees, dtype=np.float64)
+    relation_types = np.asarray(relation_types, dtype=np.float64)
+    node_cnt = np.bincount(unique_paths, minlength=path_num)
+    path_av = np.bincount(unique_paths, weights=degrees[unique_nodes] / i_max, minlength=path_num)
+    path_art = np.bincount(unique_paths, weights=relation_types[unique_nodes] / r, minlength=path_num)
+    nonempty = node_cnt > 0
+    path_av[nonempty] /= node_cnt[nonempty]
+    path_art[nonempty] /= node_cnt[nonempty]
+
+    # 按实体对求全部路径的均值
+    paths_per_pair = np.diff(pair_offsets)
+    pair_idx = np.repeat(np.arange(pair_num), paths_per_pair)
+    av = np.bincount(pair_idx, weights=path_av, minlength=pair_num)
+    art = np.bincount(pair_idx, weights=path_art, minlength=pair_num)
+    has_paths = paths_per_pair > 0
+    av[has_paths] /= paths_per_pair[has_paths]
+    art[has_paths] /= paths_per_pair[has_paths]
+
+    return np.minimum(av, 1.0), np.minimum(art, 1.0)
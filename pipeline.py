@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+流水线：把各阶段建模为声明了输入与输出的DAG，按输入内容哈希跳过已是最新的阶段，各任务文件夹并行执行
+  import_all_triples（仅Neo4j）-> 各任务文件夹：rule_matching -> evaluation -> indicator_calculation -> parameter_adjustment
+
+阶段的输入包括：阶段脚本本身、脚本直接导入的根目录模块、声明的数据文件（含上游阶段的输出），
+以及依赖图谱的阶段所用的图谱版本。输入均未变化且输出未被改动时跳过该阶段；
+上游重跑后输出内容不变时，下游同样跳过。各任务文件夹的执行记录保存在 <任务文件夹>/pipeline_state.json。
+
+  python pipeline.py [--relations concept:worksfor ...] [--stages indicator_calculation ...] [--jobs 4] [--force] [--dry-run]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from embedding_store import EMBEDDINGS_FILE
+from graph_backend import GRAPH_URI_ENV, GraphDatabase
+from graph_delta import task_relations
+from graph_snapshot import GRAPH_MANIFEST_FILE, file_hash, graph_fingerprint, load_manifest
+from local_driver import find_graph_files
+from scoring_service import ROOT_DIR, task_dir
+
+# ============ 配置区域 ============
+NEO4J_URI = "bolt://localhost:7687"
+NEO4J_USER = "neo4j"
+NEO4J_PASSWORD = "neo4jDIONG"
+STATE_FILE = "pipeline_state.json"
+JOBS = 4  # 并行执行的任务文件夹数
+
+# 各任务文件夹内的阶段：脚本为 <name>.py，输入/输出为相对任务文件夹的路径（绝对路径表示共享文件）
+STAGES = [
+    {"name": "rule_matching", "inputs": ["path_stats-20240124.txt"],
+     "outputs": ["predicted_pairs.npz"], "graph": True},
+    {"name": "evaluation", "inputs": ["predicted_pairs.npz", "sort_test.pairs"],
+     "outputs": ["test_pairs.npz"], "graph": False},
+    {"name": "indicator_calculation", "inputs": ["test_pairs.npz", "path_stats-20240124.txt", EMBEDDINGS_FILE],
+     "outputs": ["indicators_output.npz"], "graph": True},
+    # 输出文件名随 sigma/miu/theta 变化，不声明输出，只按输入判断
+    {"name": "parameter_adjustment", "inputs": ["indicators_output.npz"],
+     "outputs": [], "graph": False},
+]
+IMPORT_STAGE = {"name": "import_all_triples", "inputs": [], "outputs": [GRAPH_MANIFEST_FILE], "graph": False}
+
+IMPORT_PATTERN = re.compile(r"^\s*(?:from|import)\s+(\w+)", re.MULTILINE)
+
+_HASHES = {}  # {(路径, 大小, 修改时间): 哈希}，同一次运行中共享文件（如嵌入）只计算一次
+_HASH_LOCK = threading.Lock()
+
+
+def cached_file_hash(path):
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _HASH_LOCK:
+        if key in _HASHES:
+            return _HASHES[key]
+    digest = file_hash(path)
+    with _HASH_LOCK:
+        _HASHES[key] = digest
+    return digest
+
+
+def imported_modules(script):
+    """脚本（含函数内的延迟导入）导入的根目录模块文件"""
+    with open(script, "r", encoding="utf-8") as f:
+        names = IMPORT_PATTERN.findall(f.read())
+    paths = [os.path.join(ROOT_DIR, f"{name}.py") for name in names]
+    return {p for p in paths if os.path.exists(p)}
+
+
+def module_deps(script):
+    """脚本直接或经其他根目录模块间接导入的全部根目录模块文件"""
+    deps = set()
+    pending = [script]
+    while pending:
+        for path in imported_modules(pending.pop()) - deps:
+            deps.add(path)
+            pending.append(path)
+    deps.discard(os.path.abspath(script))
+    return sorted(deps)
+
+
+def graph_version(uri):
+    """
+    图谱版本（快速判断，不扫描图谱）：内存图为各 graph.txt 的内容哈希，
+    SQLite 与 Neo4j 为导入/增量更新时写出的快照清单指纹，无清单时退化为 graph_fingerprint
+    """
+    if uri.startswith("memory://"):
+        sha1 = hashlib.sha1()
+        for path in sorted(find_graph_files(os.path.abspath(uri[len("memory://"):] or "."))):
+            sha1.update(f"{path}\t{cached_file_hash(path)}\n".encode("utf-8"))
+        return sha1.hexdigest()
+
+    manifest = None
+    if uri.startswith("sqlite://"):
+        from sqlite_backend import SqliteGraph
+        graph = SqliteGraph(uri[len("sqlite://"):])
+        manifest = graph.manifest()
+        graph.close()
+    else:
+        manifest = load_manifest()
+    if manifest is not None:
+        return manifest["fingerprint"]
+
+    driver = GraphDatabase.driver(uri, auth=(NEO4J_USER, NEO4J_PASSWORD))
+    try:
+        return graph_fingerprint(driver)
+    finally:
+        driver.close()
+
+
+class StageRunner:
+    """在一个目录下按顺序执行阶段，读写该目录的执行记录"""
+
+    def __init__(self, label, work_dir, graph, force=False, dry_run=False):
+        self.label = label
+        self.work_dir = work_dir
+        self.graph = graph  # 无参可调用对象，首次需要时才计算图谱版本
+        self.force = force
+        self.dry_run = dry_run
+        self.state_path = os.path.join(work_dir, STATE_FILE)
+        self.state = {}
+        if os.path.exists(self.state_path):
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+
+    def path(self, name):
+        return os.path.join(self.work_dir, name)
+
+    def current_inputs(self, stage, extra_inputs=()):
+        """阶段输入的内容哈希，有输入缺失时返回缺失的路径"""
+        script = self.path(f"{stage['name']}.py")
+        paths = [script] + module_deps(script) + [self.path(p) for p in stage["inputs"]] + list(extra_inputs)
+        missing = [p for p in paths if not os.path.exists(p)]
+        if missing:
+            return None, missing
+        inputs = {os.path.relpath(p, self.work_dir): cached_file_hash(p) for p in paths}
+        if stage["graph"]:
+            inputs["<graph>"] = self.graph()
+        return inputs, []
+
+    def up_to_date(self, stage, inputs):
+        record = self.state.get(stage["name"])
+        if self.force or record is None or record["inputs"] != inputs:
+            return False
+        for output, digest in record["outputs"].items():
+            path = self.path(output)
+            if not os.path.exists(path) or cached_file_hash(path) != digest:
+                return False
+        return True
+
+    def run(self, stage, extra_inputs=(), upstream_pending=False):
+        """执行（或跳过）单个阶段，返回 "skipped" / "ran" / "pending" / "failed" / "missing" 与耗时"""
+        start = time.perf_counter()
+        inputs, missing = self.current_inputs(stage, extra_inputs)
+        if inputs is None:
+            if self.dry_run and upstream_pending:
+                return "pending", 0.0
+            print(f"[{self.label}] {stage['name']}: 缺少输入 {[os.path.relpath(p, self.work_dir) for p in missing]}")
+            return "missing", 0.0
+        if not upstream_pending and self.up_to_date(stage, inputs):
+            return "skipped", time.perf_counter() - start
+        if self.dry_run:
+            return "pending", 0.0
+
+        print(f"[{self.label}] 运行 {stage['name']}")
+        env = dict(os.environ, MPLBACKEND="Agg")  # 阶段脚本中的 plt.show() 不弹窗
+        with open(self.path(f"{stage['name']}.log"), "w", encoding="utf-8") as log:
+            proc = subprocess.run([sys.executable, f"{stage['name']}.py"], cwd=self.work_dir, env=env,
+                                  stdout=log, stderr=subprocess.STDOUT)
+        seconds = time.perf_counter() - start
+        if proc.returncode != 0:
+            print(f"[{self.label}] {stage['name']} 失败（退出码 {proc.returncode}），见 {stage['name']}.log")
+            return "failed", seconds
+
+        self.state[stage["name"]] = {
+            "inputs": inputs,
+            "outputs": {p: cached_file_hash(self.path(p)) for p in stage["outputs"] if os.path.exists(self.path(p))},
+            "seconds": seconds,
+            "finished": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.state_path)
+        return "ran", seconds
+
+
+def stage_order(stages):
+    """按 输出 -> 输入 的依赖做拓扑排序（同层保持声明顺序）"""
+    producers = {output: stage["name"] for stage in stages for output in stage["outputs"]}
+    deps = {stage["name"]: {producers[p] for p in stage["inputs"] if p in producers} for stage in stages}
+    ordered, done = [], set()
+    while len(ordered) < len(stages):
+        ready = [s for s in stages if s["name"] not in done and deps[s["name"]] <= done]
+        if not ready:
+            raise ValueError(f"阶段依赖存在环: {sorted(set(deps) - done)}")
+        for stage in ready:
+            ordered.append(stage)
+            done.add(stage["name"])
+    return ordered, deps
+
+
+def run_task(relation, stages, graph, force, dry_run):
+    """按依赖顺序执行一个任务文件夹的各阶段，上游失败或缺少输入时跳过其下游"""
+    runner = StageRunner(relation, task_dir(relation), graph, force, dry_run)
+    ordered, deps = stage_order(STAGES)
+    selected = {stage["name"] for stage in stages}
+    results = {}
+    for stage in ordered:
+        if stage["name"] not in selected:
+            continue
+        upstream = [results.get(name, ("skipped", 0))[0] for name in deps[stage["name"]]]
+        if any(status in ("failed", "missing", "blocked") for status in upstream):
+            results[stage["name"]] = ("blocked", 0.0)
+            continue
+        results[stage["name"]] = runner.run(stage, upstream_pending="pending" in upstream)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按内容哈希增量执行的阶段流水线")
+    parser.add_argument("--relations", nargs="*", default=None, help="任务关系，例如 concept:worksfor（缺省为全部任务文件夹）")
+    parser.add_argument("--stages", nargs="*", default=None, choices=[s["name"] for s in STAGES])
+    parser.add_argument("--jobs", type=int, default=JOBS, help="并行执行的任务文件夹数")
+    parser.add_argument("--force", action="store_true", help="忽略执行记录，重跑所选阶段")
+    parser.add_argument("--dry-run", action="store_true", help="只列出需要运行的阶段")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    uri = os.environ.get(GRAPH_URI_ENV) or NEO4J_URI
+    relations = args.relations or task_relations()
+    stages = [s for s in STAGES if args.stages is None or s["name"] in args.stages]
+
+    # 1. Neo4j 的三元组导入（内存图/SQLite 由图谱文件本身决定版本）
+    import_pending = False
+    if not uri.startswith(("memory://", "sqlite://")) and args.stages is None:
+        runner = StageRunner("import", ROOT_DIR, None, args.force, args.dry_run)
+        graph_files = sorted(find_graph_files(ROOT_DIR))  # 与 import_all_triples 导入的文件一致
+        status, seconds = runner.run(IMPORT_STAGE, extra_inputs=graph_files)
+        print(f"[import] import_all_triples: {status} ({seconds:.1f}s)")
+        if status in ("failed", "missing"):
+            sys.exit(1)
+        import_pending = status == "pending"
+
+    # 2. 各任务文件夹并行执行；图谱版本在首个依赖图谱的阶段需要时计算一次
+    version = {}
+    version_lock = threading.Lock()
+
+    def graph():
+        if import_pending:
+            return "<pending import>"
+        with version_lock:
+            if "value" not in version:
+                version["value"] = graph_version(uri)
+            return version["value"]
+
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        futures = {relation: pool.submit(run_task, relation, stages, graph, args.force, args.dry_run)
+                   for relation in relations}
+        results = {relation: future.result() for relation, future in futures.items()}
+
+    failed = False
+    print("\n流水线汇总：")
+    for relation, stage_results in results.items():
+        cells = [f"{name}={status}" + (f"({seconds:.1f}s)" if status == "ran" else "")
+                 for name, (status, seconds) in stage_results.items()]
+        print(f"  {relation}: {' '.join(cells)}")
+        failed = failed or any(status in ("failed", "missing") for status, _ in stage_results.values())
+    print(f"总耗时 {time.perf_counter() - start:.2f}s")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+阶段剖析：各阶段脚本的入口经 run_stage 运行（同时记录阶段内存，见 memory_monitor.py），设置环境变量 KGFP_PROFILE 时开启剖析
+  - KGFP_PROFILE=sample    信号（SIGPROF）定时采样调用栈，开销低，适合长时间运行
+  - KGFP_PROFILE=cprofile  cProfile 确定性剖析，另存 <阶段>.prof 供 pstats/snakeviz 查看
+在当前目录（即阶段输出所在目录）写出：
+  <阶段>.collapsed.txt  折叠调用栈（每行 "f1;f2;f3 数值"），可直接交给 flamegraph.pl / speedscope 生成火焰图
+  <阶段>.hot.txt        按自身耗时降序的热点函数表
+
+  KGFP_PROFILE=sample python indicator_calculation.py
+"""
+
+import cProfile
+import collections
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+
+from memory_monitor import track_stage
+
+# ============ 配置区域 ============
+PROFILE_ENV = "KGFP_PROFILE"
+INTERVAL_ENV = "KGFP_PROFILE_INTERVAL"
+SAMPLE_INTERVAL = 0.005  # 采样间隔（秒）
+HOT_TOP = 50  # 热点函数表的行数
+
+
+def frame_label(filename, funcname):
+    """折叠栈中的函数名：文件名:函数名（去掉分号以免破坏格式）"""
+    if filename == "~":
+        return funcname.replace(";", ",")  # cProfile 中的内置函数
+    return f"{os.path.basename(filename)}:{funcname}".replace(";", ",")
+
+
+class StackSampler:
+    """定时采样主线程调用栈；有 SIGPROF 时用信号（按CPU时间），否则用后台线程（按墙钟时间）"""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.thread_id = threading.get_ident()
+        self.running = False
+        self.use_signal = hasattr(signal, "SIGPROF") and threading.current_thread() is threading.main_thread()
+
+    def record(self, frame):
+        stack = []
+        while frame is not None:
+            stack.append(frame_label(frame.f_code.co_filename, frame.f_code.co_name))
+            frame = frame.f_back
+        self.stacks[";".join(reversed(stack))] += 1
+
+    def handle_signal(self, signum, frame):
+        self.record(frame)
+
+    def sample_loop(self):
+        while self.running:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.record(frame)
+            time.sleep(self.interval)
+
+    def start(self):
+        self.running = True
+        if self.use_signal:
+            signal.signal(signal.SIGPROF, self.handle_signal)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        else:
+            threading.Thread(target=self.sample_loop, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        if self.use_signal:
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+    def hot_functions(self):
+        """返回 [(函数, 自身秒数, 包含秒数, 调用次数)]，包含时间按每个样本中出现一次计，采样得不到调用次数"""
+        self_counts, total_counts = collections.Counter(), collections.Counter()
+        for stack, cnt in self.stacks.items():
+            frames = stack.split(";")
+            self_counts[frames[-1]] += cnt
+            for label in set(frames):
+                total_counts[label] += cnt
+        return [(label, self_counts[label] * self.interval, total_counts[label] * self.interval, None)
+                for label in total_counts]
+
+
+def cprofile_collapsed(stats):
+    """
+    由 cProfile 的调用关系近似还原折叠栈：从没有调用者的函数出发，
+    沿调用边按边上的累计时间占比分摊被调函数的自身时间（跳过递归环）
+    """
+    entries = stats.stats  # {func: (cc, nc, tt, ct, callers)}
+    callees = collections.defaultdict(list)
+    for func, (_, _, _, _, callers) in entries.items():
+        for caller, edge in callers.items():
+            callees[caller].append((func, edge[3]))
+
+    stacks = collections.Counter()
+
+    def walk(func, path, scale):
+        _, _, tt, ct, _ = entries[func]
+        path = path + [frame_label(func[0], func[2])]
+        if tt * scale > 0:
+            stacks[";".join(path)] += tt * scale
+        for callee, edge_ct in callees.get(func, []):
+            callee_ct = entries[callee][3]
+            if callee in on_path or not callee_ct:
+                continue
+            on_path.add(callee)
+            walk(callee, path, scale * min(edge_ct / callee_ct, 1.0))
+            on_path.discard(callee)
+
+    for func, (_, _, _, _, callers) in entries.items():
+        if not callers:
+            on_path = {func}
+            walk(func, [], 1.0)
+    return stacks
+
+
+def write_collapsed(path, stacks, scale=1):
+    """写出折叠栈，数值为 样本数 或 微秒"""
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, value in sorted(stacks.items()):
+            value = int(round(value * scale))
+            if value > 0:
+                f.write(f"{stack} {value}\n")
+
+
+def write_hot_table(path, rows, total_seconds, top=HOT_TOP):
+    """写出按自身耗时降序的热点函数表"""
+    rows = sorted(rows, key=lambda row: -row[1])[:top]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"{'self_s':>10} {'self%':>7} {'total_s':>10} {'total%':>7} {'calls':>10}  function\n")
+        for label, self_s, total_s, calls in rows:
+            self_pct = self_s / total_seconds * 100 if total_seconds else 0
+            total_pct = total_s / total_seconds * 100 if total_seconds else 0
+            calls = "-" if calls is None else str(calls)
+            f.write(f"{self_s:>10.3f} {self_pct:>6.1f}% {total_s:>10.3f} {total_pct:>6.1f}% {calls:>10}  {label}\n")
+
+
+def run_stage(stage, func, *args, **kwargs):
+    """运行阶段入口函数，记录阶段内存并按 KGFP_PROFILE 剖析"""
+    with track_stage(stage):
+        return profile_call(stage, func, *args, **kwargs)
+
+
+def profile_call(stage, func, *args, **kwargs):
+    """KGFP_PROFILE 未设置时直接运行"""
+    mode = os.environ.get(PROFILE_ENV)
+    if not mode:
+        return func(*args, **kwargs)
+    if mode not in ("sample", "cprofile"):
+        raise ValueError(f"未知的剖析模式 {PROFILE_ENV}={mode}，可选 sample / cprofile")
+
+    collapsed_file, hot_file = f"{stage}.collapsed.txt", f"{stage}.hot.txt"
+    start = time.perf_counter()
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(func, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            profiler.dump_stats(f"{stage}.prof")
+            stats = pstats.Stats(profiler)
+            write_collapsed(collapsed_file, cprofile_collapsed(stats), scale=1e6)
+            rows = [(frame_label(f[0], f[2]), tt, ct, nc) for f, (_, nc, tt, ct, _) in stats.stats.items()]
+            write_hot_table(hot_file, rows, elapsed)
+            print(f"[{stage}] cProfile 剖析结果已写入 {stage}.prof、{collapsed_file}、{hot_file}")
+    else:
+        sampler = StackSampler(float(os.environ.get(INTERVAL_ENV) or SAMPLE_INTERVAL))
+        sampler.start()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            sampler.stop()
+            elapsed = time.perf_counter() - start
+            write_collapsed(collapsed_file, sampler.stacks)
+            samples = sum(sampler.stacks.values())
+            # 信号采样按CPU时间计，占比以采样总时长为分母
+            write_hot_table(hot_file, sampler.hot_functions(), samples * sampler.interval if sampler.use_signal else elapsed)
+            print(f"[{stage}] 耗时 {elapsed:.1f}s，采样 {samples} 次，剖析结果已写入 {collapsed_file}、{hot_file}")
@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+图查询日志：包装驱动的 session.run，逐条记录查询模板、参数哈希、耗时、返回行数与dbHits
+  - 设置环境变量 KGFP_QUERY_LOG=<日志文件> 后，graph_backend 返回的驱动自动启用（所有脚本共用）
+  - KGFP_PROFILE_RATE=<0~1>：按比例对查询加 PROFILE 前缀，记录dbHits与执行计划（仅Neo4j后端）
+  - 模板为去除多余空白、字符串字面量替换为 ? 后的查询文本；
+    规则链/关系序列的关系名以字面量写在文本中，作为模板下的变体单独统计
+
+日志为JSONL，包含四类记录：
+  {"type": "template", "id", "text"}                               首次出现的模板
+  {"type": "variant", "id", "variant", "literals"}                 首次出现的字面量组合（如规则链）
+  {"type": "query", "id", "variant", "params", "ms", "rows", ...}  每条查询
+  {"type": "plan", "id", "variant", "ms", "db_hits", "plan"}       PROFILE得到的执行计划
+
+汇总报告（各模板 p50/p95/p99 延迟，并保存最慢模板的执行计划）：
+  python query_log.py --log query_log.jsonl --output query_report.json --plans query_plans.json
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+
+import numpy as np
+
+# ============ 配置区域 ============
+QUERY_LOG_ENV = "KGFP_QUERY_LOG"
+PROFILE_RATE_ENV = "KGFP_PROFILE_RATE"
+REPORT_FILE = "query_report.json"
+PLANS_FILE = "query_plans.json"
+REPORT_TOP = 20  # 报告中保存执行计划的最慢模板数
+REPORT_VARIANTS = 5  # 每个模板列出的最慢变体数
+
+LITERAL_PATTERN = re.compile(r"'(?:[^'\\]|\\.)*'")
+
+
+def normalize_query(query):
+    """拆分查询为 (模板, 字面量列表)：Query对象取其文本，压缩空白，字符串字面量替换为 ?"""
+    text = " ".join(getattr(query, "text", query).split())
+    literals = [literal[1:-1] for literal in LITERAL_PATTERN.findall(text)]
+    return LITERAL_PATTERN.sub("?", text), literals
+
+
+def template_id(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+
+
+def variant_id(literals):
+    return template_id("\t".join(literals)) if literals else None
+
+
+def params_hash(params):
+    payload = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
+
+
+def plan_db_hits(plan):
+    """执行计划各算子的dbHits之和"""
+    if not plan:
+        return None
+    return (plan.get("dbHits") or 0) + sum(plan_db_hits(child) or 0 for child in plan.get("children", []))
+
+
+class QueryLog:
+    """追加写入的查询日志（多线程安全）"""
+
+    def __init__(self, path, profile_rate=0.0):
+        self.path = path
+        self.profile_rate = profile_rate
+        self.lock = threading.Lock()
+        self.templates = set()
+        self.variants = set()
+        self.file = open(path, "a", encoding="utf-8")
+
+    def write(self, record):
+        with self.lock:
+            self.file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            self.file.flush()
+
+    def register(self, text, literals):
+        tid, vid = template_id(text), variant_id(literals)
+        if tid not in self.templates:
+            self.templates.add(tid)
+            self.write({"type": "template", "id": tid, "text": text})
+        if vid and (tid, vid) not in self.variants:
+            self.variants.add((tid, vid))
+            self.write({"type": "variant", "id": tid, "variant": vid, "literals": literals})
+        return tid, vid
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class LoggedResult:
+    """包装查询结果：结果被读完（迭代结束 / single / data / consume）时写入一条日志"""
+
+    def __init__(self, log, result, tid, vid, phash, start, profiled):
+        self._log = log
+        self._result = result
+        self._tid = tid
+        self._vid = vid
+        self._phash = phash
+        self._start = start
+        self._profiled = profiled
+        self._rows = 0
+        self._done = False
+
+    def finish(self):
+        if self._done:
+            return
+        self._done = True
+        ms = (time.perf_counter() - self._start) * 1000
+        record = {"type": "query", "id": self._tid, "variant": self._vid, "params": self._phash,
+                  "ms": ms, "rows": self._rows, "db_hits": None, "profiled": self._profiled}
+        if self._profiled:
+            plan = getattr(self._result.consume(), "profile", None)
+            record["db_hits"] = plan_db_hits(plan)
+            if plan:
+                self._log.write({"type": "plan", "id": self._tid, "variant": self._vid, "ms": ms,
+                                 "db_hits": record["db_hits"], "plan": plan})
+        self._log.write(record)
+
+    def __iter__(self):
+        for record in self._result:
+            self._rows += 1
+            yield record
+        self.finish()
+
+    def single(self, *args, **kwargs):
+        record = self._result.single(*args, **kwargs)
+        self._rows += record is not None
+        self.finish()
+        return record
+
+    def data(self, *args, **kwargs):
+        rows = self._result.data(*args, **kwargs)
+        self._rows += len(rows)
+        self.finish()
+        return rows
+
+    def consume(self):
+        self.finish()
+        return self._result.consume()
+
+    def __getattr__(self, name):
+        return getattr(self._result, name)
+
+
+class LoggedSession:
+    """包装会话：记录每条查询；未读完的结果在下一条查询或会话关闭时补记"""
+
+    def __init__(self, log, session, profile):
+        self._log = log
+        self._session = session
+        self._profile = profile
+        self._pending = None
+
+    def run(self, query, parameters=None, **kwargs):
+        if self._pending is not None:
+            self._pending.finish()
+
+        tid, vid = self._log.register(*normalize_query(query))
+        params = dict(parameters or {}, **kwargs)
+        profiled = self._profile and random.random() < self._log.profile_rate
+        if profiled:
+            if hasattr(query, "text"):
+                query = type(query)("PROFILE " + query.text, metadata=query.metadata, timeout=query.timeout)
+            else:
+                query = "PROFILE " + query
+
+        start = time.perf_counter()
+        result = self._session.run(query, parameters, **kwargs)
+        self._pending = LoggedResult(self._log, result, tid, vid, params_hash(params), start, profiled)
+        return self._pending
+
+    def close(self):
+        if self._pending is not None:
+            self._pending.finish()
+        self._session.close()
+
+    def __enter__(self):
+        self._session.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        if self._pending is not None:
+            self._pending.finish()
+        return self._session.__exit__(*exc)
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+
+class LoggedDriver:
+    """包装驱动，使其全部会话记录查询日志"""
+
+    def __init__(self, log, driver, profile):
+        self._log = log
+        self._driver = driver
+        self._profile = profile
+
+    def session(self, *args, **kwargs):
+        return LoggedSession(self._log, self._driver.session(*args, **kwargs), self._profile)
+
+    def close(self):
+        self._driver.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __getattr__(self, name):
+        return getattr(self._driver, name)
+
+
+_LOGS = {}  # {日志文件绝对路径: QueryLog}，同一进程内的驱动共用一个日志
+
+
+def wrap_driver(driver, profile=True):
+    """环境变量 KGFP_QUERY_LOG 已设置时返回记录查询日志的驱动，否则原样返回；profile=False 时不加PROFILE"""
+    path = os.environ.get(QUERY_LOG_ENV)
+    if not path:
+        return driver
+    path = os.path.abspath(path)
+    if path not in _LOGS:
+        _LOGS[path] = QueryLog(path, float(os.environ.get(PROFILE_RATE_ENV) or 0))
+    return LoggedDriver(_LOGS[path], driver, profile)
+
+
+def read_log(log_file):
+    """读取日志，返回 (模板文本, 变体字面量, 每个模板的查询记录, 每个模板最慢的执行计划)"""
+    templates, variants, queries, plans = {}, {}, {}, {}
+    with open(log_file, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # 进程中断时可能留下不完整的行
+            kind = record.get("type")
+            if kind == "template":
+                templates[record["id"]] = record["text"]
+            elif kind == "variant":
+                variants[record["variant"]] = record["literals"]
+            elif kind == "query":
+                queries.setdefault(record["id"], []).append(record)
+            elif kind == "plan":
+                if record["id"] not in plans or record["ms"] > plans[record["id"]]["ms"]:
+                    plans[record["id"]] = record
+    return templates, variants, queries, plans
+
+
+def latency_stats(records):
+    """一组查询记录的延迟分位数、返回行数与dbHits"""
+    ms = np.array([r["ms"] for r in records])
+    rows = np.array([r["rows"] for r in records])
+    db_hits = [r["db_hits"] for r in records if r["db_hits"] is not None]
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        "count": len(records),
+        "distinct_params": len({r["params"] for r in records}),
+        "total_ms": float(ms.sum()),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "max_ms": float(ms.max()),
+        "mean_rows": float(rows.mean()),
+        "profiled": len(db_hits),
+        "mean_db_hits": float(np.mean(db_hits)) if db_hits else None,
+    }
+
+
+def build_report(templates, variants, queries, variant_top=REPORT_VARIANTS):
+    """按模板汇总延迟分位数，并列出每个模板下p95最高的变体（如规则链），按总耗时降序"""
+    report = []
+    for tid, records in queries.items():
+        item = {"id": tid, "template": templates.get(tid, ""), **latency_stats(records)}
+        by_variant = {}
+        for r in records:
+            if r.get("variant"):
+                by_variant.setdefault(r["variant"], []).append(r)
+        if by_variant:
+            variant_stats = [{"variant": vid, "literals": variants.get(vid, []), **latency_stats(rs)}
+                             for vid, rs in by_variant.items()]
+            variant_stats.sort(key=lambda v: -v["p95_ms"])
+            item["variants"] = len(variant_stats)
+            item["slowest_variants"] = variant_stats[:variant_top]
+        report.append(item)
+    report.sort(key=lambda item: -item["total_ms"])
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="汇总图查询日志")
+    parser.add_argument("--log", default=os.environ.get(QUERY_LOG_ENV) or "query_log.jsonl")
+    parser.add_argument("--output", default=REPORT_FILE)
+    parser.add_argument("--plans", default=PLANS_FILE)
+    parser.add_argument("--top", type=int, default=REPORT_TOP)
+    args = parser.parse_args()
+
+    templates, variants, queries, plans = read_log(args.log)
+    report = build_report(templates, variants, queries)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    slowest = sorted(report, key=lambda item: -item["p95_ms"])[:args.top]
+    slow_plans = [dict(plans[item["id"]], template=item["template"], literals=variants.get(plans[item["id"]]["variant"]))
+                  for item in slowest if item["id"] in plans]
+    with open(args.plans, "w", encoding="utf-8") as f:
+        json.dump(slow_plans, f, ensure_ascii=False, indent=2)
+
+    print(f"{'count':>8} {'p50_ms':>9} {'p95_ms':>9} {'p99_ms':>9} {'total_s':>9}  template")
+    for item in report[:args.top]:
+        print(f"{item['count']:>8} {item['p50_ms']:>9.2f} {item['p95_ms']:>9.2f} {item['p99_ms']:>9.2f} "
+              f"{item['total_ms'] / 1000:>9.2f}  {item['template'][:100]}")
+    print(f"共 {len(report)} 个查询模板，报告已写入 {args.output}，{len(slow_plans)} 个慢模板的执行计划已写入 {args.plans}")
+
+
+if __name__ == "__main__":
+    main()
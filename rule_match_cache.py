@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+规则匹配结果缓存：按 (图谱指纹, 关系链) 内容寻址，图谱不变时各阶段重复匹配同一规则链直接读盘
+  - 匹配结果存为排序后的 int64 数组，编码 = (头实体编号 << 32) | 尾实体编号
+  - 实体编号为该指纹下全部实体名排序后的下标，因此编码的顺序即 (头实体名, 尾实体名) 的顺序，
+    判断某实体对是否满足规则链只需一次 searchsorted
+
+目录结构：
+  <cache_dir>/<图谱指纹>/entities.txt    排序后的实体名，每行一个
+  <cache_dir>/<图谱指纹>/<链哈希>.npy    单条规则链的匹配结果
+"""
+
+import hashlib
+import os
+
+import numpy as np
+
+# ============ 配置区域 ============
+RULE_MATCH_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rule_match_cache")
+FETCH_SIZE = 10000
+
+ENTITY_NAMES_QUERY = "MATCH (n:Entity) RETURN n.name AS name"
+
+
+def chain_key(rel_chain):
+    """关系链的内容哈希"""
+    return hashlib.sha1("->".join(rel_chain).encode("utf-8")).hexdigest()[:16]
+
+
+def chain_match_query(rel_chain):
+    """匹配关系链并只返回去重后的起点/终点实体名"""
+    nodes = ["a"] + [f"n{i}" for i in range(len(rel_chain) - 1)] + ["b"]
+    pattern = "(a)"
+    for i, rel in enumerate(rel_chain):
+        pattern += f"-[:RELATION {{name: '{rel}'}}]->({nodes[i + 1]})"
+    return f"""
+    MATCH {pattern}
+    RETURN DISTINCT a.name AS a_name, b.name AS b_name
+    """
+
+
+def save_array(path, codes):
+    """原子写入，避免并发读到写了一半的文件"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, codes)
+    os.replace(tmp_path, path)
+
+
+class RuleMatchCache:
+    """某一图谱指纹下的规则匹配结果缓存"""
+
+    def __init__(self, driver, fingerprint, cache_dir=RULE_MATCH_CACHE_DIR):
+        self.driver = driver
+        self.fingerprint = fingerprint
+        self.dir = os.path.join(cache_dir, fingerprint[:16])
+        self._names = None
+        self._ids = None
+        self._memo = {}  # {链哈希: 编码数组}
+
+    # ---------- 实体编号 ----------
+    @property
+    def names(self):
+        """排序后的全部实体名（首次使用时从图谱读取并落盘）"""
+        if self._names is None:
+            path = os.path.join(self.dir, "entities.txt")
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    self._names = f.read().split("\n")[:-1]
+            else:
+                with self.driver.session(fetch_size=FETCH_SIZE) as session:
+                    self._names = sorted(record["name"] for record in session.run(ENTITY_NAMES_QUERY))
+                os.makedirs(self.dir, exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.writelines(f"{name}\n" for name in self._names)
+                os.replace(tmp_path, path)
+        return self._names
+
+    @property
+    def ids(self):
+        if self._ids is None:
+            self._ids = {name: i for i, name in enumerate(self.names)}
+        return self._ids
+
+    def encode(self, h_name, t_name):
+        """实体对编码，实体不在图谱中时返回None"""
+        h_id, t_id = self.ids.get(h_name), self.ids.get(t_name)
+        if h_id is None or t_id is None:
+            return None
+        return (h_id << 32) | t_id
+
+    def decode(self, codes):
+        """编码数组 -> [(头实体名, 尾实体名), ...]"""
+        names = self.names
+        return [(names[c >> 32], names[c & 0xFFFFFFFF]) for c in codes.tolist()]
+
+    # ---------- 匹配结果 ----------
+    def path(self, rel_chain):
+        return os.path.join(self.dir, f"{chain_key(rel_chain)}.npy")
+
+    def get(self, rel_chain):
+        """读取缓存的匹配结果，未缓存时返回None"""
+        key = chain_key(rel_chain)
+        if key not in self._memo:
+            path = self.path(rel_chain)
+            if not os.path.exists(path):
+                return None
+            self._memo[key] = np.load(path)
+        return self._memo[key]
+
+    def match(self, rel_chain):
+        """读取或计算（并缓存）规则链的匹配结果"""
+        codes = self.get(rel_chain)
+        if codes is not None:
+            return codes
+
+        ids = self.ids
+        with self.driver.session(fetch_size=FETCH_SIZE) as session:
+            result = session.run(chain_match_query(rel_chain))
+            codes = np.fromiter(((ids[r["a_name"]] << 32) | ids[r["b_name"]] for r in result), dtype=np.int64)
+        codes = np.unique(codes)
+
+        os.makedirs(self.dir, exist_ok=True)
+        save_array(self.path(rel_chain), codes)
+        self._memo[chain_key(rel_chain)] = codes
+        return codes
+
+    def contains(self, codes, h_name, t_name):
+        """判断实体对是否在匹配结果中"""
+        code = self.encode(h_name, t_name)
+        if code is None:
+            return False
+        i = np.searchsorted(codes, code)
+        return bool(i < len(codes) and codes[i] == code)
+
+
+def migrate(driver, old_fingerprint, new_fingerprint, chains, changed_relations, cache_dir=RULE_MATCH_CACHE_DIR):
+    """
+    图谱增量更新后迁移匹配结果：不含变更关系的规则链结果不变，按新实体表重映射编号后写入新指纹目录；
+    含变更关系的规则链不迁移，下次使用时重新匹配。返回 (迁移数, 丢弃数)
+    """
+    old = RuleMatchCache(driver, old_fingerprint, cache_dir)
+    new = RuleMatchCache(driver, new_fingerprint, cache_dir)
+    if old.dir == new.dir or not os.path.exists(os.path.join(old.dir, "entities.txt")):
+        return 0, 0
+
+    mapping = None
+    kept = dropped = 0
+    for rel_chain in {tuple(chain) for chain in chains}:
+        codes = old.get(list(rel_chain))
+        if codes is None:
+            continue
+        if set(rel_chain) & set(changed_relations):
+            dropped += 1
+            continue
+        if mapping is None:
+            new_ids = new.ids
+            mapping = np.array([new_ids.get(name, -1) for name in old.names], dtype=np.int64)
+            if (mapping < 0).any():
+                print("有实体已从图谱中删除，旧编码无法映射，规则匹配缓存不迁移")
+                return 0, 0
+        # 删除三元组不删除实体，旧实体表是新实体表的子集，映射单调递增，编码仍保持有序
+        os.makedirs(new.dir, exist_ok=True)
+        save_array(new.path(list(rel_chain)), (mapping[codes >> 32] << 32) | mapping[codes & 0xFFFFFFFF])
+        kept += 1
+    return kept, dropped
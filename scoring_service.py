@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+在线可靠性评分服务
+常驻进程保持图谱连接、实体嵌入、SD/TopK案例表以及路径/实体缓存，
+对单个预测三元组 (head, relation, tail) 返回 CSSM、FSCM 与 RIS。
+
+  启动：python scoring_service.py [--port 8765 | --unix /tmp/kgfp.sock]
+  请求：POST /score  {"head": "...", "relation": "concept:worksfor", "tail": "..."}
+  增量更新图谱：POST /delta  {"added": [[h, r, t], ...], "removed": [[h, r, t], ...]}（见 graph_delta.py）
+  状态：GET /health
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from graph_backend import GraphDatabase
+
+# ============ 配置区域 ============
+NEO4J_URI = "bolt://localhost:7687"
+NEO4J_USER = "neo4j"
+NEO4J_PASSWORD = "neo4jDIONG"
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+HOST = "127.0.0.1"
+PORT = 8765
+
+
+def task_dir(relation):
+    """关系对应的任务文件夹，例如 concept:worksfor -> concept_worksfor"""
+    return os.path.join(ROOT_DIR, relation.replace(":", "_"))
+
+
+class UnknownRelation(KeyError):
+    """关系没有对应的任务文件夹"""
+
+
+def load_task_module(relation, name):
+    """从任务文件夹加载脚本模块（不执行其 __main__ 部分）"""
+    path = os.path.join(task_dir(relation), f"{name}.py")
+    spec = importlib.util.spec_from_file_location(f"{relation.replace(':', '_')}.{name}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class ReadWriteLock:
+    """读写锁：多个读者可同时持有，写者独占；有写者等待时新读者排队，避免写者饿死"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._waiting_writers = 0
+
+    @contextlib.contextmanager
+    def read(self):
+        with self._cond:
+            while self._writing or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writing or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+
+class ReliabilityScorer:
+    """
+    可靠性评分器：按关系懒加载任务脚本与TopK案例，
+    各关系共享同一份路径、关系序列与实体属性缓存（它们与关系无关）
+    """
+
+    def __init__(self, driver, embedding_dtype=None):
+        self.driver = driver
+        self.embedding_dtype = embedding_dtype  # 覆盖各任务 indicator_calculation 的 EMBEDDING_DTYPE
+        self.tasks = {}  # {relation: {"indicator", "adjustment", "top_cases"}}
+        self.shared_caches = {
+            "PATH_CACHE": {},
+            "SIGNATURE_CACHE": {},
+            "ENTITY_PROP_CACHE": {},
+            "ESTIMATED_PAIRS": set(),
+            "CASE_INDEX_CACHE": {},
+        }
+        self.lock = threading.Lock()  # 串行化任务加载
+        self.state_lock = ReadWriteLock()  # 评分共享读取TopK案例与共享缓存，图谱差量独占修改
+
+    def get_task(self, relation):
+        """加载（或取出已加载的）关系任务：指标模块、RIS参数模块与TopK案例"""
+        with self.lock:
+            if relation in self.tasks:
+                return self.tasks[relation]
+            if not os.path.isdir(task_dir(relation)):
+                raise UnknownRelation(relation)
+
+            indicator = load_task_module(relation, "indicator_calculation")
+            for name, cache in self.shared_caches.items():
+                setattr(indicator, name, cache)
+            if self.embedding_dtype:
+                indicator.EMBEDDING_DTYPE = self.embedding_dtype
+            adjustment = load_task_module(relation, "parameter_adjustment")
+
+            top_cases = indicator.prepare_top_cases(
+                self.driver, relation,
+                os.path.join(task_dir(relation), indicator.RULES_FILE),
+                indicator.topk,
+                cache_dir=os.path.join(task_dir(relation), indicator.SD_CACHE_DIR),
+            )
+            task = {"indicator": indicator, "adjustment": adjustment, "top_cases": top_cases}
+            self.tasks[relation] = task
+            return task
+
+    def apply_delta(self, delta):
+        """应用图谱差量，失效受影响的共享缓存，并按迁移后的SD表重新载入已加载关系的TopK案例"""
+        import graph_delta  # graph_delta 依赖本模块的 load_task_module，延迟导入避免循环
+
+        with self.state_lock.write(), self.lock:
+            summary = graph_delta.update_graph(self.driver, delta, caches=self.shared_caches,
+                                               relations=sorted(self.tasks))
+            for relation, task in self.tasks.items():
+                indicator = task["indicator"]
+                task["top_cases"] = indicator.prepare_top_cases(
+                    self.driver, relation,
+                    os.path.join(task_dir(relation), indicator.RULES_FILE),
+                    indicator.topk,
+                    cache_dir=os.path.join(task_dir(relation), indicator.SD_CACHE_DIR),
+                )
+        return summary
+
+    def score(self, head, relation, tail):
+        """计算单个预测三元组的 CSSM、FSCM 与 RIS（持有读锁，不会与图谱差量交错）"""
+        with self.state_lock.read():
+            return self._score(head, relation, tail)
+
+    def _score(self, head, relation, tail):
+        task = self.get_task(relation)
+        indicator, adjustment = task["indicator"], task["adjustment"]
+
+        cssm = indicator.CSSM(self.driver, (head, tail), task["top_cases"])
+        if indicator.FSCM_MODE == "vectorized":
+            fscm = float(indicator.FSCM_batch(self.driver, [(head, tail)])[0])
+        else:
+            fscm = indicator.FSCM(self.driver, head, tail)
+        ris = adjustment.RIS(cssm, fscm, adjustment.sigma, adjustment.miu)
+
+        # 指标可能是 numpy 标量，转换为内置类型以便序列化为JSON
+        return {
+            "head": head,
+            "relation": relation,
+            "tail": tail,
+            "cssm": float(cssm),
+            "fscm": float(fscm),
+            "ris": float(ris),
+            "reliable": bool(ris > adjustment.theta),
+            "estimated": (head, tail) in indicator.ESTIMATED_PAIRS,
+        }
+
+
+class ScoringHandler(BaseHTTPRequestHandler):
+    """HTTP接口：POST /score 与 GET /health"""
+
+    scorer = None
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix socket 下 client_address 不是 (host, port)
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def do_GET(self):
+        if self.path != "/health":
+            self.send_json(404, {"error": f"未知路径: {self.path}"})
+            return
+        self.send_json(200, {"status": "ok", "relations": sorted(self.scorer.tasks)})
+
+    def do_POST(self):
+        if self.path == "/delta":
+            self.handle_delta()
+            return
+        if self.path != "/score":
+            self.send_json(404, {"error": f"未知路径: {self.path}"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            head, relation, tail = request["head"], request["relation"], request["tail"]
+            if not all(isinstance(x, str) for x in (head, relation, tail)):
+                raise TypeError("head/relation/tail 必须为字符串")
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_json(400, {"error": f"请求格式错误，需要 head/relation/tail: {e}"})
+            return
+
+        start = time.perf_counter()
+        try:
+            result = self.scorer.score(head, relation, tail)
+        except UnknownRelation:
+            self.send_json(404, {"error": f"没有关系 {relation} 对应的任务文件夹"})
+            return
+        except Exception as e:
+            self.send_json(500, {"error": f"计算失败: {type(e).__name__}: {e}"})
+            return
+        result["elapsed_ms"] = (time.perf_counter() - start) * 1000
+        self.send_json(200, result)
+
+
+    def handle_delta(self):
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            delta = [("+", h, r, t) for h, r, t in request.get("added", [])]
+            delta += [("-", h, r, t) for h, r, t in request.get("removed", [])]
+        except (ValueError, TypeError) as e:
+            self.send_json(400, {"error": f"请求格式错误，需要 added/removed 三元组列表: {e}"})
+            return
+
+        try:
+            summary = self.scorer.apply_delta(delta)
+        except NotImplementedError as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        except Exception as e:
+            self.send_json(500, {"error": f"更新失败: {type(e).__name__}: {e}"})
+            return
+        self.send_json(200, summary)
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="在线可靠性评分服务")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--unix", default=None, help="监听的Unix socket路径（指定后忽略host/port）")
+    parser.add_argument("--preload", nargs="*", default=[], help="启动时预热的关系，例如 concept:worksfor")
+    args = parser.parse_args()
+
+    driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+    ScoringHandler.scorer = ReliabilityScorer(driver)
+    for relation in args.preload:
+        ScoringHandler.scorer.get_task(relation)
+        print(f"已预热关系 {relation}")
+
+    if args.unix:
+        if os.path.exists(args.unix):
+            os.remove(args.unix)
+        server = ThreadingUnixHTTPServer(args.unix, ScoringHandler)
+        print(f"评分服务已启动: unix:{args.unix}")
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), ScoringHandler)
+        print(f"评分服务已启动: http://{args.host}:{args.port}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        driver.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+SD表持久化：案例三元组的SD值只取决于图谱与规则文件，
+按 (关系, 规则文件哈希, 图谱指纹) 保存，同时保存各topk（及并列组上限）下的 get_top_cases 结果
+"""
+
+import os
+import pickle
+
+from graph_snapshot import file_hash
+
+
+class TopCases(list):
+    """
+    TopK案例列表 [((head, tail), sd), ...]，weights 与之对齐：
+    SD并列组经分层抽样时，组内每个保留案例代表 组大小/保留数 个案例，未抽样的案例为1
+    """
+
+    def __init__(self, cases=(), weights=None):
+        super().__init__(cases)
+        self.weights = list(weights) if weights is not None else [1.0] * len(self)
+
+
+def top_cases_key(topk, tie_cap=None, tie_seed=0):
+    """
+    SD表中 top_cases 的键：不限制并列组时为 topk（与旧表兼容），
+    否则为 (topk, tie_cap, tie_seed)——抽样保留哪些并列案例取决于种子
+    """
+    return (topk, tie_cap, tie_seed) if tie_cap else topk
+
+
+def split_top_cases_key(key):
+    """top_cases_key 的逆：返回 (topk, tie_cap, tie_seed)；旧表的 (topk, tie_cap) 键按种子0处理"""
+    if not isinstance(key, tuple):
+        return key, None, 0
+    return key if len(key) == 3 else (*key, 0)
+
+
+def sd_table_file(cache_dir, relation, rules_hash, fingerprint):
+    """SD表文件路径"""
+    name = relation.replace(":", "_")
+    return os.path.join(cache_dir, f"SD_{name}_{rules_hash[:12]}_{fingerprint[:12]}.pkl")
+
+
+def load_sd_table(cache_dir, relation, rules_file, fingerprint):
+    """加载SD表，不存在或键不一致时返回None"""
+    rules_hash = file_hash(rules_file)
+    path = sd_table_file(cache_dir, relation, rules_hash, fingerprint)
+    if not os.path.exists(path):
+        return None
+
+    with open(path, "rb") as f:
+        table = pickle.load(f)
+    if (table["relation"], table["rules_hash"], table["graph_fingerprint"]) != (relation, rules_hash, fingerprint):
+        return None
+    return table
+
+
+def new_sd_table(relation, rules_file, fingerprint, case_sds, sampling=None):
+    """
+    构造SD表，case_sds 为 [((head, tail), sd), ...]；
+    sampling 非空时 case_sds 只含抽样筛选后计算了精确SD的案例（仅对不超过 sampling["topk"] 的topk完整）
+    """
+    return {
+        "relation": relation,
+        "rules_hash": file_hash(rules_file),
+        "graph_fingerprint": fingerprint,
+        "case_sds": list(case_sds),
+        "top_cases": {},  # {top_cases_key(topk, tie_cap, tie_seed): get_top_cases 结果}
+        "sampling": sampling,
+    }
+
+
+def save_sd_table(cache_dir, table):
+    """保存SD表，返回文件路径"""
+    os.makedirs(cache_dir, exist_ok=True)
+    path = sd_table_file(cache_dir, table["relation"], table["rules_hash"], table["graph_fingerprint"])
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(table, f)
+    os.replace(tmp_path, path)
+    return path
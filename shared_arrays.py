@@ -0,0 +1,403 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+跨进程共享的只读评分数据：父进程构建一次 CSR 图、量化嵌入矩阵与实体度数/关系类型数数组，
+以 .npy 写入共享内存文件系统（/dev/shm），各工作进程按名字以内存映射方式零拷贝挂载，
+工作进程数增加时内存占用基本不变
+  <SHARED_DIR>/kgfp_<名字>/layout.json     各数组的名字与图谱快照清单
+  <SHARED_DIR>/kgfp_<名字>/<数组名>.npy
+
+  CSR 图（实体编号为排序后实体名的下标，关系编号同理）：
+    out_ptr / out_rel / out_dst   出边按 (头, 关系, 尾) 排序，实体 i 的出边为 out_ptr[i]:out_ptr[i+1]
+    in_ptr / in_rel / in_src      入边按 (尾, 关系, 头) 排序
+    degree / relation_types       各实体的连接度数（自环只计一次）与不同关系类型数
+  嵌入：emb_names / emb_ids / emb_rows / emb_scales / emb_inv_norms（见 embedding_store 的量化嵌入）
+
+  发布并保持（其他进程以 KGFP_GRAPH_URI=shared://kgfp 使用）：python shared_arrays.py --name kgfp [--uri URI]
+  batch_scoring.py --processes N 会自动发布并在结束后释放
+"""
+
+import argparse
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from embedding_store import EMBEDDINGS_FILE, QuantizedEmbeddings, quantized_arrays
+from graph_snapshot import TRIPLES_QUERY, driver_manifest
+from id_dict import IdDict
+
+# ============ 配置区域 ============
+NEO4J_URI = "bolt://localhost:7687"
+NEO4J_USER = "neo4j"
+NEO4J_PASSWORD = "neo4jDIONG"
+SHARED_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+SHARED_NAME = "kgfp"
+EMBEDDING_DTYPE = "float16"  # 共享嵌入的精度（float16 / int8）
+FETCH_SIZE = 10000
+
+ENTITY_NAMES_QUERY = "MATCH (n:Entity) RETURN n.name AS name"
+GRAPH_KEYS = ("names", "rel_names", "out_ptr", "out_rel", "out_dst", "in_ptr", "in_rel", "in_src",
+              "degree", "relation_types")
+EMBEDDING_KEYS = ("names", "ids", "rows", "scales", "inv_norms")
+
+_ATTACHED = {}  # {名字: (数组字典, 布局)}
+
+
+# ---------- 发布与挂载 ----------
+def shared_path(name):
+    return os.path.join(SHARED_DIR, f"kgfp_{name}")
+
+
+def publish(name, arrays, layout=None):
+    """把一组数组写入共享目录；先写到临时目录再整体改名，挂载方不会看到写了一半的数据"""
+    path = shared_path(name)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    os.makedirs(tmp_path)
+    for key, array in arrays.items():
+        np.save(os.path.join(tmp_path, f"{key}.npy"), array)
+    with open(os.path.join(tmp_path, "layout.json"), "w", encoding="utf-8") as f:
+        json.dump(dict(layout or {}, arrays=sorted(arrays), published=time.strftime("%Y-%m-%d %H:%M:%S")),
+                  f, ensure_ascii=False, indent=2)
+    release(name)
+    os.rename(tmp_path, path)
+    return path
+
+
+def attach(name):
+    """按名字挂载共享数组（内存映射、只读），返回 (数组字典, 布局)"""
+    if name not in _ATTACHED:
+        path = shared_path(name)
+        if not os.path.exists(os.path.join(path, "layout.json")):
+            raise FileNotFoundError(f"共享数据 {name} 未发布（{path}）")
+        with open(os.path.join(path, "layout.json"), "r", encoding="utf-8") as f:
+            layout = json.load(f)
+        arrays = {key: np.load(os.path.join(path, f"{key}.npy"), mmap_mode="r") for key in layout["arrays"]}
+        _ATTACHED[name] = (arrays, layout)
+    return _ATTACHED[name]
+
+
+def release(name):
+    """删除共享数据（已挂载的进程在解除映射前仍可继续读取）"""
+    _ATTACHED.pop(name, None)
+    shutil.rmtree(shared_path(name), ignore_errors=True)
+
+
+# ---------- CSR 图 ----------
+def read_graph(driver):
+    """读取图谱的全部实体名与三元组：本地后端直接遍历图对象，Neo4j 分批拉取"""
+    graph = getattr(driver, "graph", None)
+    if graph is not None:
+        return graph.all_entities(), list(graph.triples())
+    with driver.session(fetch_size=FETCH_SIZE) as session:
+        entities = [rec["name"] for rec in session.run(ENTITY_NAMES_QUERY)]
+        triples = [(rec["h"], rec["r"], rec["t"]) for rec in session.run(TRIPLES_QUERY)]
+    return entities, triples
+
+
+def encode(names):
+    names = np.asarray(names, dtype=str)
+    return np.char.encode(names, "utf-8") if names.size else np.array([], dtype="S1")
+
+
+def csr_arrays(entities, triples):
+    """由实体名与三元组构建 CSR 图的各数组（重复三元组只保留一条）"""
+    heads = encode([h for h, _, _ in triples])
+    rels = encode([r for _, r, _ in triples])
+    tails = encode([t for _, _, t in triples])
+    names = np.unique(np.concatenate([encode(list(entities)), heads, tails]))
+    rel_names, r = np.unique(rels, return_inverse=True)
+    h = np.searchsorted(names, heads).astype(np.int32)
+    t = np.searchsorted(names, tails).astype(np.int32)
+    r = r.astype(np.int32)
+
+    order = np.lexsort((t, r, h))
+    h, r, t = h[order], r[order], t[order]
+    if len(h) > 1:
+        keep = np.concatenate([[True], (h[1:] != h[:-1]) | (r[1:] != r[:-1]) | (t[1:] != t[:-1])])
+        h, r, t = h[keep], r[keep], t[keep]
+    n = len(names)
+    in_order = np.lexsort((h, r, t))
+
+    loops = h[h == t]
+    degree = np.bincount(h, minlength=n) + np.bincount(t, minlength=n) - np.bincount(loops, minlength=n)
+    rel_num = max(len(rel_names), 1)
+    entity_rels = np.unique(np.concatenate([h.astype(np.int64) * rel_num + r, t.astype(np.int64) * rel_num + r]))
+    relation_types = np.bincount(entity_rels // rel_num, minlength=n)
+
+    return {
+        "names": names,
+        "rel_names": rel_names,
+        "out_ptr": np.concatenate([[0], np.cumsum(np.bincount(h, minlength=n))]).astype(np.int64),
+        "out_rel": r,
+        "out_dst": t,
+        "in_ptr": np.concatenate([[0], np.cumsum(np.bincount(t, minlength=n))]).astype(np.int64),
+        "in_rel": r[in_order],
+        "in_src": h[in_order],
+        "degree": degree.astype(np.int64),
+        "relation_types": relation_types.astype(np.int32),
+    }
+
+
+def group_by_rel(rels, others):
+    """按关系分组（输入已按关系排序）：{关系编号: [实体编号, ...]}"""
+    groups = {}
+    for rel, other in zip(rels, others):
+        groups.setdefault(rel, []).append(other)
+    return groups
+
+
+class CsrGraph:
+    """
+    CSR 数组上的只读图，接口与 local_driver.MemoryGraph 一致（不支持增删三元组），
+    可由 LocalDriver 包装后执行本项目的各类查询（graph_backend 的 shared://<名字>）
+    """
+
+    def __init__(self, arrays, manifest=None):
+        for key in GRAPH_KEYS:
+            setattr(self, key, arrays[key])
+        self.entity_ids = IdDict(self.names, np.arange(len(self.names)), np.arange(len(self.names)))
+        self.rel_ids = IdDict(self.rel_names, np.arange(len(self.rel_names)), np.arange(len(self.rel_names)))
+        self._manifest = manifest
+
+    def name(self, i):
+        return self.names[i].decode("utf-8")
+
+    def rel_name(self, r):
+        return self.rel_names[r].decode("utf-8")
+
+    def _id(self, name):
+        i = self.entity_ids.get(name)
+        return i if i >= 0 else None
+
+    def _out(self, i):
+        s, e = self.out_ptr[i], self.out_ptr[i + 1]
+        return group_by_rel(self.out_rel[s:e].tolist(), self.out_dst[s:e].tolist())
+
+    def _in(self, i):
+        s, e = self.in_ptr[i], self.in_ptr[i + 1]
+        return group_by_rel(self.in_rel[s:e].tolist(), self.in_src[s:e].tolist())
+
+    def _rel_chain_ids(self, rel_chain):
+        """关系名 -> 编号，有未知关系时返回None"""
+        ids = self.rel_ids.lookup(list(rel_chain)).tolist()
+        return None if -1 in ids else ids
+
+    def triples(self):
+        src = np.repeat(np.arange(len(self.names)), np.diff(self.out_ptr))
+        for h, r, t in zip(src.tolist(), self.out_rel.tolist(), self.out_dst.tolist()):
+            yield self.name(h), self.rel_name(r), self.name(t)
+
+    def manifest(self):
+        """发布时记录的快照清单"""
+        return self._manifest
+
+    # ---------- 规则链 ----------
+    def _chain_ends(self, start, rel_chain):
+        """从 start 出发沿规则链（关系编号）可达的终点集合（同名关系重复时保证不重复使用同一条边）"""
+        if len(set(rel_chain)) == len(rel_chain):
+            frontier = {start}
+            for r in rel_chain:
+                frontier = {m for n in frontier for m in self._out(n).get(r, ())}
+                if not frontier:
+                    break
+            return frontier
+
+        ends = set()
+
+        def walk(node, depth, used):
+            if depth == len(rel_chain):
+                ends.add(node)
+                return
+            for m in self._out(node).get(rel_chain[depth], ()):
+                edge = (node, rel_chain[depth], m)
+                if edge not in used:
+                    walk(m, depth + 1, used | {edge})
+
+        walk(start, 0, frozenset())
+        return ends
+
+    def match_chain(self, rel_chain):
+        """匹配规则链，返回全部 (起点名, 终点名)"""
+        rel_ids = self._rel_chain_ids(rel_chain)
+        if rel_ids is None:
+            return set()
+        src = np.repeat(np.arange(len(self.names)), np.diff(self.out_ptr))
+        starts = np.unique(src[self.out_rel == rel_ids[0]]).tolist()
+        return {(self.name(a), self.name(b)) for a in starts for b in self._chain_ends(a, rel_ids)}
+
+    def chain_exists(self, rel_chain, h_name, t_name):
+        """判断 h 与 t 之间是否存在满足规则链的路径"""
+        h, t, rel_ids = self._id(h_name), self._id(t_name), self._rel_chain_ids(rel_chain)
+        if h is None or t is None or rel_ids is None:
+            return False
+        return t in self._chain_ends(h, rel_ids)
+
+    def relation_pairs(self, rel_name):
+        """某关系的全部 (头实体名, 尾实体名)"""
+        r = self.rel_ids.get(rel_name)
+        if r < 0:
+            return set()
+        src = np.repeat(np.arange(len(self.names)), np.diff(self.out_ptr))
+        mask = self.out_rel == r
+        return {(self.name(h), self.name(t)) for h, t in zip(src[mask].tolist(), self.out_dst[mask].tolist())}
+
+    # ---------- 非环路径 ----------
+    def _walk(self, h_name, t_name, max_depth, min_depth=1, rel_chain=None):
+        """深度优先枚举 h 到 t 的非环路径（节点两两不同），生成 (节点编号列表, 关系编号列表)"""
+        h, t = self._id(h_name), self._id(t_name)
+        if h is None or t is None or h == t:
+            return
+        if rel_chain is not None:
+            rel_chain = self._rel_chain_ids(rel_chain)
+            if rel_chain is None:
+                return
+        # 能一步到达 t 的节点，用于剪枝倒数第二跳
+        pre_t = set(self.in_src[self.in_ptr[t]:self.in_ptr[t + 1]].tolist())
+        nodes, rels = [h], []
+
+        def expand(node):
+            depth = len(rels)
+            out = self._out(node)
+            hop_rels = [rel_chain[depth]] if rel_chain else list(out)
+            if min_depth <= depth + 1 <= max_depth:
+                for r in hop_rels:
+                    if t in out.get(r, ()):
+                        yield nodes + [t], rels + [r]
+            if depth + 1 >= max_depth:
+                return
+            for r in hop_rels:
+                for m in out.get(r, ()):
+                    if m == t or m in nodes or (depth + 2 == max_depth and m not in pre_t):
+                        continue
+                    nodes.append(m)
+                    rels.append(r)
+                    yield from expand(m)
+                    nodes.pop()
+                    rels.pop()
+
+        yield from expand(h)
+
+    def paths_between(self, h_name, t_name, max_depth=3, limit=None):
+        """头尾实体间深度≤max_depth的非环路径（至多 limit 条，找够即停止搜索），返回 [(节点名列表, 关系名列表), ...]"""
+        return [([self.name(n) for n in nodes], [self.rel_name(r) for r in rels])
+                for nodes, rels in itertools.islice(self._walk(h_name, t_name, max_depth), limit)]
+
+    def path_signatures(self, h_name, t_name, max_depth=3, min_depth=1):
+        """按关系序列统计非环路径数，返回 {(关系名, ...): 路径数}"""
+        counts = {}
+        for _, rels in self._walk(h_name, t_name, max_depth, min_depth):
+            key = tuple(rels)
+            counts[key] = counts.get(key, 0) + 1
+        return {tuple(self.rel_name(r) for r in key): cnt for key, cnt in counts.items()}
+
+    def chain_paths(self, h_name, t_name, rel_chain):
+        """头尾实体间沿指定关系序列的全部非环路径的节点列表"""
+        depth = len(rel_chain)
+        return [[self.name(n) for n in nodes] for nodes, _ in self._walk(h_name, t_name, depth, depth, rel_chain)]
+
+    # ---------- 邻居 ----------
+    def _neighbors(self, names, ptr, others):
+        ids = self.entity_ids.lookup(list(names))
+        result = set()
+        for i in ids[ids >= 0].tolist():
+            result.update(others[ptr[i]:ptr[i + 1]].tolist())
+        return {self.name(i) for i in result}
+
+    def successors(self, names):
+        """一批实体的全部出边邻居"""
+        return self._neighbors(names, self.out_ptr, self.out_dst)
+
+    def predecessors(self, names):
+        """一批实体的全部入边邻居"""
+        return self._neighbors(names, self.in_ptr, self.in_src)
+
+    # ---------- 统计 ----------
+    def entity_props(self, name):
+        """实体的连接度数与不同关系类型数（发布时预先算好）"""
+        i = self._id(name)
+        if i is None:
+            return {"degree": 0, "relation_types": 0}
+        return {"degree": int(self.degree[i]), "relation_types": int(self.relation_types[i])}
+
+    def max_degree(self):
+        """最高连接度数的实体及其度数"""
+        if not len(self.degree) or not self.degree.max():
+            return None, 0
+        i = int(np.argmax(self.degree))
+        return self.name(i), int(self.degree[i])
+
+    def entity_count(self):
+        return len(self.names)
+
+    def all_entities(self):
+        return np.char.decode(self.names, "utf-8").tolist() if len(self.names) else []
+
+    def relation_counts(self):
+        """每种关系的三元组数"""
+        counts = np.bincount(self.out_rel, minlength=len(self.rel_names))
+        return {self.rel_name(r): int(cnt) for r, cnt in enumerate(counts.tolist()) if cnt}
+
+
+# ---------- 评分数据 ----------
+def publish_scoring_data(driver, name=SHARED_NAME, embeddings_file=EMBEDDINGS_FILE, dtype=EMBEDDING_DTYPE):
+    """父进程：由驱动对应的图谱与嵌入文件构建 CSR 图、量化嵌入与实体统计数组并发布"""
+    start = time.perf_counter()
+    entities, triples = read_graph(driver)
+    arrays = csr_arrays(entities, triples)
+    layout = {"manifest": driver_manifest(driver), "embedding_dtype": None, "embeddings_file": None}
+    if embeddings_file and os.path.exists(embeddings_file):
+        emb_arrays, _ = quantized_arrays(embeddings_file, dtype)
+        arrays.update({f"emb_{key}": array for key, array in emb_arrays.items()})
+        layout.update(embedding_dtype=dtype, embeddings_file=os.path.abspath(embeddings_file))
+    path = publish(name, arrays, layout)
+    size = sum(array.nbytes for array in arrays.values())
+    print(f"已发布共享数据 {path}：{len(arrays['names'])} 个实体，{len(arrays['out_dst'])} 条三元组，"
+          f"共 {size / 2 ** 20:.1f} MB，用时 {time.perf_counter() - start:.2f}s")
+    return layout
+
+
+def attach_graph(name=SHARED_NAME):
+    """工作进程：挂载共享的 CSR 图"""
+    arrays, layout = attach(name)
+    return CsrGraph(arrays, layout.get("manifest"))
+
+
+def attach_embeddings(name=SHARED_NAME):
+    """工作进程：挂载共享的量化嵌入，未发布嵌入时返回None"""
+    arrays, layout = attach(name)
+    if not layout.get("embedding_dtype"):
+        return None
+    return QuantizedEmbeddings(layout["embedding_dtype"], *(arrays[f"emb_{key}"] for key in EMBEDDING_KEYS))
+
+
+def main():
+    from graph_backend import GraphDatabase
+
+    parser = argparse.ArgumentParser(description="发布跨进程共享的 CSR 图、量化嵌入与实体统计数组")
+    parser.add_argument("--name", default=SHARED_NAME)
+    parser.add_argument("--uri", default=NEO4J_URI)
+    parser.add_argument("--embeddings", default=EMBEDDINGS_FILE)
+    parser.add_argument("--dtype", default=EMBEDDING_DTYPE, choices=["float16", "int8"])
+    args = parser.parse_args()
+
+    driver = GraphDatabase.driver(args.uri, auth=(NEO4J_USER, NEO4J_PASSWORD))
+    publish_scoring_data(driver, args.name, args.embeddings, args.dtype)
+    driver.close()
+    print(f"其他进程可通过 KGFP_GRAPH_URI=shared://{args.name} 使用，Ctrl-C 释放")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        release(args.name)
+
+
+if __name__ == "__main__":
+    main()
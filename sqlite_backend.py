@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+SQLite三元组存储（无需Neo4j服务）
+将 graph.txt 导入整数编码的三元组表，并把项目中的图查询翻译为SQL自连接：
+  - create_cypher_for_chain 的规则链匹配   -> SqliteGraph.match_chain
+  - SD 中的规则链存在性检查               -> SqliteGraph.chain_exists
+  - get_paths_between 的深度≤3非环路径     -> SqliteGraph.paths_between / path_signatures
+  - 实体度数/关系类型数、find_cases 等     -> 其余方法
+  导入时把图谱快照清单（graph_snapshot.build_manifest）写入 manifest 表
+
+  建库：python sqlite_backend.py [--db graph.db] [graph.txt ...]
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+
+from graph_snapshot import build_manifest
+
+# ============ 配置区域 ============
+DB_FILE = "graph.db"
+ROOT_DIR = "."  # 未指定 graph.txt 时，在该目录下递归查找
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entities (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS relations (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS triples (
+    rel INTEGER NOT NULL,
+    head INTEGER NOT NULL,
+    tail INTEGER NOT NULL,
+    PRIMARY KEY (rel, head, tail)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_rel_tail ON triples (rel, tail, head);
+CREATE INDEX IF NOT EXISTS idx_head ON triples (head, tail, rel);
+CREATE INDEX IF NOT EXISTS idx_tail ON triples (tail, head, rel);
+CREATE TABLE IF NOT EXISTS manifest (id INTEGER PRIMARY KEY CHECK (id = 0), data TEXT NOT NULL);
+"""
+
+TRIPLE_NAMES_SQL = """
+SELECT h.name, r.name, t.name FROM triples
+JOIN entities h ON h.id = triples.head
+JOIN relations r ON r.id = triples.rel
+JOIN entities t ON t.id = triples.tail
+"""
+
+
+def chain_sql(depth, same_rel_pairs=(), bound_head=False, bound_tail=False):
+    """
+    规则链的SQL自连接：t0.tail = t1.head, t1.tail = t2.head, ...
+    同名关系出现在链上多个位置时，要求对应的边不同（与Cypher的关系唯一性一致）
+    """
+    joins = ["triples t0"]
+    conditions = ["t0.rel = ?"]
+    for i in range(1, depth):
+        joins.append(f"JOIN triples t{i} ON t{i}.head = t{i - 1}.tail")
+        conditions.append(f"t{i}.rel = ?")
+    for i, j in same_rel_pairs:
+        conditions.append(f"NOT (t{i}.head = t{j}.head AND t{i}.tail = t{j}.tail)")
+    if bound_head:
+        conditions.append("t0.head = ?")
+    if bound_tail:
+        conditions.append(f"t{depth - 1}.tail = ?")
+    return " ".join(joins), " AND ".join(conditions)
+
+
+def paths_sql(depth, bound_rels=False):
+    """
+    深度为 depth 的非环路径（节点两两不同）的 FROM/WHERE 子句，
+    返回 (子句, 中间节点列, 各跳关系列)；bound_rels 时各跳关系由参数 :r0, :r1, ... 指定
+    """
+    joins = ["triples t0"]
+    for i in range(1, depth):
+        joins.append(f"JOIN triples t{i} ON t{i}.head = t{i - 1}.tail")
+
+    nodes = ["t0.head"] + [f"t{i}.head" for i in range(1, depth)] + [f"t{depth - 1}.tail"]
+    conditions = ["t0.head = :h", f"t{depth - 1}.tail = :t"]
+    if bound_rels:
+        conditions += [f"t{i}.rel = :r{i}" for i in range(depth)]
+    for i in range(len(nodes)):
+        for j in range(i + 1, len(nodes)):
+            conditions.append(f"{nodes[i]} <> {nodes[j]}")
+
+    clause = f"FROM {' '.join(joins)} WHERE {' AND '.join(conditions)}"
+    return clause, nodes[1:-1], [f"t{i}.rel" for i in range(depth)]
+
+
+class SqliteGraph:
+    """基于SQLite的只读图查询（多进程可同时以只读方式打开同一个库文件）"""
+
+    def __init__(self, db_file=DB_FILE, readonly=True):
+        if readonly:
+            self.conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.entity_ids = dict(self.conn.execute("SELECT name, id FROM entities"))
+        self.entity_names = {i: name for name, i in self.entity_ids.items()}
+        self.relation_ids = dict(self.conn.execute("SELECT name, id FROM relations"))
+        self.relation_names = {i: name for name, i in self.relation_ids.items()}
+
+    def close(self):
+        self.conn.close()
+
+    def _chain_args(self, rel_chain):
+        """关系名 -> id，以及需要满足边互异的同名关系位置对；有未知关系时返回None"""
+        rel_ids = [self.relation_ids.get(rel) for rel in rel_chain]
+        if any(r is None for r in rel_ids):
+            return None
+        same_rel_pairs = [(i, j) for i in range(len(rel_ids)) for j in range(i + 1, len(rel_ids))
+                          if rel_ids[i] == rel_ids[j]]
+        return rel_ids, same_rel_pairs
+
+    def match_chain(self, rel_chain):
+        """匹配规则链，返回全部 (起点名, 终点名)"""
+        args = self._chain_args(rel_chain)
+        if args is None:
+            return set()
+        rel_ids, same_rel_pairs = args
+        joins, where = chain_sql(len(rel_ids), same_rel_pairs)
+        sql = f"SELECT DISTINCT t0.head, t{len(rel_ids) - 1}.tail FROM {joins} WHERE {where}"
+        names = self.entity_names
+        return {(names[a], names[b]) for a, b in self.conn.execute(sql, rel_ids)}
+
+    def chain_exists(self, rel_chain, h_name, t_name):
+        """判断 h 与 t 之间是否存在满足规则链的路径"""
+        args = self._chain_args(rel_chain)
+        h_id, t_id = self.entity_ids.get(h_name), self.entity_ids.get(t_name)
+        if args is None or h_id is None or t_id is None:
+            return False
+        rel_ids, same_rel_pairs = args
+        joins, where = chain_sql(len(rel_ids), same_rel_pairs, bound_head=True, bound_tail=True)
+        sql = f"SELECT 1 FROM {joins} WHERE {where} LIMIT 1"
+        return self.conn.execute(sql, rel_ids + [h_id, t_id]).fetchone() is not None
+
+    def relation_pairs(self, rel_name):
+        """某关系的全部 (头实体名, 尾实体名)"""
+        rel_id = self.relation_ids.get(rel_name)
+        if rel_id is None:
+            return set()
+        names = self.entity_names
+        rows = self.conn.execute("SELECT head, tail FROM triples WHERE rel = ?", (rel_id,))
+        return {(names[h], names[t]) for h, t in rows}
+
+    def paths_between(self, h_name, t_name, max_depth=3, limit=None):
+        """头尾实体间深度≤max_depth的非环路径（至多 limit 条，取够即停止），返回 [(节点名列表, 关系名列表), ...]"""
+        h_id, t_id = self.entity_ids.get(h_name), self.entity_ids.get(t_name)
+        if h_id is None or t_id is None:
+            return []
+
+        paths = []
+        for depth in range(1, max_depth + 1):
+            clause, middle_columns, rel_columns = paths_sql(depth)
+            sql = f"SELECT {', '.join(middle_columns + rel_columns)} {clause}"
+            for row in self.conn.execute(sql, {"h": h_id, "t": t_id}):
+                if limit is not None and len(paths) >= limit:
+                    return paths
+                middle, rels = row[:depth - 1], row[depth - 1:]
+                nodes = [h_name] + [self.entity_names[n] for n in middle] + [t_name]
+                paths.append((nodes, [self.relation_names[r] for r in rels]))
+        return paths
+
+    def path_signatures(self, h_name, t_name, max_depth=3, min_depth=1):
+        """按关系序列统计非环路径数，返回 {(关系名, ...): 路径数}"""
+        h_id, t_id = self.entity_ids.get(h_name), self.entity_ids.get(t_name)
+        if h_id is None or t_id is None:
+            return {}
+
+        signatures = {}
+        for depth in range(min_depth, max_depth + 1):
+            clause, _, rel_columns = paths_sql(depth)
+            rel_columns = ", ".join(rel_columns)
+            sql = f"SELECT {rel_columns}, COUNT(*) {clause} GROUP BY {rel_columns}"
+            for row in self.conn.execute(sql, {"h": h_id, "t": t_id}):
+                signatures[tuple(self.relation_names[r] for r in row[:-1])] = row[-1]
+        return signatures
+
+    def chain_paths(self, h_name, t_name, rel_chain):
+        """头尾实体间沿指定关系序列的全部非环路径的节点列表"""
+        h_id, t_id = self.entity_ids.get(h_name), self.entity_ids.get(t_name)
+        rel_ids = [self.relation_ids.get(rel) for rel in rel_chain]
+        if h_id is None or t_id is None or any(r is None for r in rel_ids):
+            return []
+
+        clause, middle_columns, _ = paths_sql(len(rel_ids), bound_rels=True)
+        params = {"h": h_id, "t": t_id}
+        params.update({f"r{i}": r for i, r in enumerate(rel_ids)})
+        sql = f"SELECT {', '.join(middle_columns) or '1'} {clause}"
+        paths = []
+        for row in self.conn.execute(sql, params):
+            middle = row[:len(middle_columns)]
+            paths.append([h_name] + [self.entity_names[n] for n in middle] + [t_name])
+        return paths
+
+    def _neighbors(self, names, column, other):
+        ids = [self.entity_ids[n] for n in names if n in self.entity_ids]
+        if not ids:
+            return set()
+        rows = self.conn.execute(f"SELECT DISTINCT {other} FROM triples WHERE {column} IN ({','.join('?' * len(ids))})", ids)
+        return {self.entity_names[i] for i, in rows}
+
+    def successors(self, names):
+        """一批实体的全部出边邻居"""
+        return self._neighbors(names, "head", "tail")
+
+    def predecessors(self, names):
+        """一批实体的全部入边邻居"""
+        return self._neighbors(names, "tail", "head")
+
+    def entity_props(self, name):
+        """实体的连接度数与不同关系类型数"""
+        entity_id = self.entity_ids.get(name)
+        if entity_id is None:
+            return {"degree": 0, "relation_types": 0}
+        degree, types = self.conn.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT rel) FROM triples WHERE head = ? OR tail = ?",
+            (entity_id, entity_id)).fetchone()
+        return {"degree": degree, "relation_types": types}
+
+    def max_degree(self):
+        """最高连接度数的实体及其度数"""
+        row = self.conn.execute("""
+            SELECT id, COUNT(*) AS degree FROM (
+                SELECT head AS id FROM triples
+                UNION ALL
+                SELECT tail AS id FROM triples WHERE tail <> head
+            ) GROUP BY id ORDER BY degree DESC LIMIT 1
+        """).fetchone()
+        if row is None:
+            return None, 0
+        return self.entity_names[row[0]], row[1]
+
+    def entity_count(self):
+        return len(self.entity_ids)
+
+    def all_entities(self):
+        return list(self.entity_ids)
+
+    def relation_counts(self):
+        """每种关系的三元组数"""
+        rows = self.conn.execute("SELECT rel, COUNT(*) FROM triples GROUP BY rel")
+        return {self.relation_names[r]: cnt for r, cnt in rows}
+
+    def triples(self):
+        """全部 (头实体名, 关系名, 尾实体名)"""
+        return self.conn.execute(TRIPLE_NAMES_SQL)
+
+    def build_manifest(self, sources=()):
+        return build_manifest(self.triples(), len(self.entity_ids), sources)
+
+    def manifest(self):
+        """导入时写入的快照清单，旧版本建的库没有清单时返回None"""
+        try:
+            row = self.conn.execute("SELECT data FROM manifest WHERE id = 0").fetchone()
+        except sqlite3.OperationalError:
+            return None
+        return json.loads(row[0]) if row else None
+
+
+def read_triples(graph_file):
+    """读取 graph.txt 中的 (头实体, 关系, 尾实体)"""
+    with open(graph_file, "r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.strip().split("\t")
+            if len(parts) < 3:
+                continue
+            yield parts[0], parts[1], parts[2]
+
+
+def load_graph(graph_files, db_file=DB_FILE):
+    """将若干 graph.txt 导入SQLite库（重复三元组只保留一条）并写入快照清单，返回导入的三元组数"""
+    conn = sqlite3.connect(db_file)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.executescript(SCHEMA)
+
+    entity_ids = dict(conn.execute("SELECT name, id FROM entities"))
+    relation_ids = dict(conn.execute("SELECT name, id FROM relations"))
+
+    def intern(ids, table, name):
+        if name not in ids:
+            ids[name] = len(ids)
+            conn.execute(f"INSERT INTO {table} (id, name) VALUES (?, ?)", (ids[name], name))
+        return ids[name]
+
+    total = 0
+    for graph_file in graph_files:
+        batch = []
+        for h, r, t in read_triples(graph_file):
+            batch.append((intern(relation_ids, "relations", r),
+                          intern(entity_ids, "entities", h),
+                          intern(entity_ids, "entities", t)))
+        conn.executemany("INSERT OR IGNORE INTO triples (rel, head, tail) VALUES (?, ?, ?)", batch)
+        conn.commit()
+        total += len(batch)
+        print(f"成功从 [{graph_file}] 读取 {len(batch)} 条三元组")
+
+    manifest = build_manifest(conn.execute(TRIPLE_NAMES_SQL), len(entity_ids), graph_files)
+    conn.execute("INSERT OR REPLACE INTO manifest (id, data) VALUES (0, ?)", (json.dumps(manifest, ensure_ascii=False),))
+    print(f"快照清单：{manifest['triple_num']} 条三元组，指纹 {manifest['fingerprint'][:12]}")
+
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="将 graph.txt 导入SQLite三元组库")
+    parser.add_argument("graph_files", nargs="*", help="graph.txt 路径，缺省时在当前目录下递归查找")
+    parser.add_argument("--db", default=DB_FILE)
+    args = parser.parse_args()
+
+    graph_files = args.graph_files
+    if not graph_files:
+        for root, dirs, files in os.walk(ROOT_DIR):
+            if "graph.txt" in files:
+                graph_files.append(os.path.join(root, "graph.txt"))
+    if not graph_files:
+        print("未找到任何 graph.txt 文件")
+        return
+
+    total = load_graph(graph_files, args.db)
+    print(f"导入完成，共处理 {total} 条三元组，数据库: {args.db}")
+
+
+if __name__ == "__main__":
+    main()
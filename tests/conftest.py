@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+import functools
+import os
+import sys
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, "benchmark"))
+
+from graph_backend import load_memory_graph
+from local_driver import LocalDriver
+from rule_match_cache import RuleMatchCache
+from scoring_service import load_task_module
+import synthetic_graph
+
+SYNTHETIC_TRIPLES = 3000
+
+
+@pytest.fixture(scope="session")
+def synthetic_dir(tmp_path_factory):
+    """约3000条三元组的合成图谱目录（benchmark/synthetic_graph.py），整个测试会话共用"""
+    out_dir = str(tmp_path_factory.mktemp("synthetic"))
+    synthetic_graph.generate(out_dir, SYNTHETIC_TRIPLES, seed=0)
+    return out_dir
+
+
+@pytest.fixture
+def synthetic_driver(synthetic_dir):
+    return LocalDriver(load_memory_graph(synthetic_dir))
+
+
+@pytest.fixture
+def indicator(tmp_path, monkeypatch):
+    """新加载的指标计算模块（各缓存为空），规则匹配缓存写到临时目录而不是仓库下的 rule_match_cache/"""
+    module = load_task_module("concept:worksfor", "indicator_calculation")
+    monkeypatch.setattr(module, "RuleMatchCache",
+                        functools.partial(RuleMatchCache, cache_dir=str(tmp_path / "rule_match_cache")))
+    return module
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+from graph_delta import update_graph
+from local_driver import LocalDriver, MemoryGraph
+
+# 路径 h -a-> x -b-> u -c-> v，另有一条无关的边 p -d-> q
+TRIPLES = [("h", "a", "x"), ("x", "b", "u"), ("u", "c", "v"), ("p", "d", "q")]
+
+
+def memory_driver(triples=TRIPLES):
+    graph = MemoryGraph()
+    for h, r, t in triples:
+        graph.add_triple(h, r, t)
+    return LocalDriver(graph)
+
+
+def fresh_caches():
+    return {
+        "PATH_CACHE": {("h", "v"): [], ("x", "u"): [], ("p", "q"): []},
+        "SIGNATURE_CACHE": {("h", "v"): {}, ("p", "q"): {}},
+        "ENTITY_PROP_CACHE": {"h": {"degree": 1, "relation_types": 1}, "p": {"degree": 1, "relation_types": 1}},
+        "ESTIMATED_PAIRS": {("h", "v")},
+        "CASE_INDEX_CACHE": {0: None},
+    }
+
+
+def test_double_removed_edges_invalidate_path_through_both():
+    """删除路径上的两条边 a、c 后，经过它们的 (h, v) 的缓存必须失效，无关的 (p, q) 保留"""
+    driver = memory_driver()
+    caches = fresh_caches()
+    summary = update_graph(driver, [("-", "h", "a", "x"), ("-", "u", "c", "v")], caches=caches, relations=[])
+
+    assert summary["removed"] == 2
+    assert summary["new_fingerprint"] != summary["old_fingerprint"]
+    assert set(caches["PATH_CACHE"]) == {("p", "q")}
+    assert set(caches["SIGNATURE_CACHE"]) == {("p", "q")}
+    assert not caches["ESTIMATED_PAIRS"]
+    assert not caches["CASE_INDEX_CACHE"]
+    # 只刷新变更边端点的度数，其他实体的条目不动
+    assert caches["ENTITY_PROP_CACHE"]["h"] == {"degree": 0, "relation_types": 0}
+    assert caches["ENTITY_PROP_CACHE"]["p"] == {"degree": 1, "relation_types": 1}
+
+
+def test_removed_middle_edge_invalidates_paths_through_it():
+    """删除中间的边 b：头实体 h 只能经保留的边 a 到达 b 的起点，(h, v) 与 (x, u) 都须失效"""
+    driver = memory_driver()
+    caches = fresh_caches()
+    update_graph(driver, [("-", "x", "b", "u")], caches=caches, relations=[])
+    assert set(caches["PATH_CACHE"]) == {("p", "q")}
+
+
+def test_added_edge_invalidates_new_paths():
+    """新增边在应用之后计算区域：q -e-> h 使 (p, x) 之间出现新路径"""
+    driver = memory_driver()
+    caches = fresh_caches()
+    caches["PATH_CACHE"][("p", "x")] = []
+    update_graph(driver, [("+", "q", "e", "h")], caches=caches, relations=[])
+    assert ("p", "x") not in caches["PATH_CACHE"]
+
+
+def test_noop_delta_keeps_fingerprint_and_caches():
+    """删除不存在的边、新增已存在的边都不改变图谱"""
+    driver = memory_driver()
+    caches = fresh_caches()
+    summary = update_graph(driver, [("-", "h", "z", "v"), ("+", "h", "a", "x")], caches=caches, relations=[])
+    assert summary["new_fingerprint"] == summary["old_fingerprint"]
+    assert caches == fresh_caches()
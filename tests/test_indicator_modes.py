@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+"""同一合成图谱上各计算模式（FSCM_MODE / PS_MODE / SD_MODE）的结果须一致"""
+
+import os
+
+import pytest
+
+import synthetic_graph
+
+PAIR_NUM = 12
+
+
+@pytest.fixture
+def case_pairs(indicator, synthetic_driver):
+    return sorted(indicator.find_cases(synthetic_driver, synthetic_graph.TARGET_RELATION))
+
+
+@pytest.fixture
+def rules_file(synthetic_dir):
+    return os.path.join(synthetic_dir, "concept_" + synthetic_graph.TARGET_RELATION.split(":")[1],
+                        synthetic_graph.RULES_FILE)
+
+
+@pytest.mark.parametrize("path_budget", [10000, 5])
+def test_fscm_loop_matches_vectorized(indicator, synthetic_driver, case_pairs, path_budget):
+    """逐路径循环与展平后向量化的FSCM一致（path_budget 较小时包含抽样估计的实体对）"""
+    indicator.PATH_BUDGET = path_budget
+    indicator.PATH_SAMPLE_SIZE = 5
+    pairs = case_pairs[:PAIR_NUM]
+    loop = [indicator.FSCM(synthetic_driver, h, t) for h, t in pairs]
+    vectorized = indicator.FSCM_batch(synthetic_driver, pairs)
+    assert vectorized == pytest.approx(loop, abs=1e-12)
+    assert any(loop)
+
+
+def test_ps_paths_matches_count(indicator, synthetic_driver, case_pairs):
+    """物化路径与按关系序列计数的路径相似度一致"""
+    pairs = case_pairs[:PAIR_NUM]
+    combos = [(pred, case) for pred in pairs for case in pairs[:4]]
+    indicator.PS_MODE = "paths"
+    by_paths = [indicator.PS(synthetic_driver, pred, case) for pred, case in combos]
+    indicator.PS_MODE = "count"
+    by_count = [indicator.PS(synthetic_driver, pred, case) for pred, case in combos]
+    assert by_count == pytest.approx(by_paths, abs=1e-12)
+    assert any(by_paths)
+
+
+@pytest.mark.parametrize("tie_cap", [None, 2])
+def test_sd_sampled_matches_exact(indicator, synthetic_driver, rules_file, tmp_path, case_pairs, tie_cap):
+    """抽样SD得到的TopK案例与全部计算一致"""
+    indicator.TIE_CAP = tie_cap
+    indicator.SD_SAMPLE_SIZE = 20
+    assert len(case_pairs) > indicator.SD_SAMPLE_SIZE
+
+    indicator.SD_MODE = "exact"
+    exact = indicator.prepare_top_cases(synthetic_driver, synthetic_graph.TARGET_RELATION, rules_file, 3,
+                                        cache_dir=str(tmp_path / "exact"))
+    indicator.SD_MODE = "sampled"
+    sampled = indicator.prepare_top_cases(synthetic_driver, synthetic_graph.TARGET_RELATION, rules_file, 3,
+                                          cache_dir=str(tmp_path / "sampled"))
+    assert list(sampled) == list(exact)
+    assert getattr(sampled, "weights", None) == getattr(exact, "weights", None)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+import pytest
+
+import pair_store
+from pair_store import PairTable, read_pairs, rows_path, text_path, write_pairs
+
+PAIRS = [("concept_person_张三", "concept_company_b"), ("concept_person_a", "concept_company_b"),
+         ("concept_person_a", "concept_city_c")]
+
+
+def indicators_table():
+    return PairTable.from_pairs("indicators", PAIRS, cssm=[0.25, 0.5, 0.125], fscm=[0.1, 0.2, 0.3],
+                                fp=[1, 0, -1], estimated=[0, 1, 0])
+
+
+def assert_same_table(a, b):
+    assert a.kind == b.kind
+    assert a.pairs() == b.pairs()
+    for field in ("fp", "estimated", "cssm", "fscm"):
+        np.testing.assert_array_equal(a[field], b[field])
+
+
+def test_binary_round_trip_is_memory_mapped(tmp_path):
+    path = str(tmp_path / "indicators_output.npz")
+    write_pairs(path, indicators_table())
+    assert os.path.exists(rows_path(path)) and os.path.exists(text_path(path))
+
+    table = read_pairs(path, "indicators")
+    assert isinstance(table.rows, np.memmap)
+    assert_same_table(table, indicators_table())
+
+
+def test_text_round_trip_keeps_estimated_column(tmp_path):
+    """文本第6列为 estimated，从文本读回与二进制一致"""
+    path = str(tmp_path / "indicators_output.npz")
+    write_pairs(path, indicators_table())
+    with open(text_path(path), encoding="utf-8") as f:
+        assert [line.rstrip("\n").split("\t")[-1] for line in f] == ["0", "1", "0"]
+
+    os.remove(path)
+    assert_same_table(read_pairs(path, "indicators"), indicators_table())
+
+
+def test_old_text_without_estimated_column(tmp_path):
+    """旧版5列的 indicators_output.txt 读取时 estimated 取缺省值0"""
+    path = str(tmp_path / "indicators_output.npz")
+    with open(text_path(path), "w", encoding="utf-8") as f:
+        f.write("a\tb\t0.5\t0.25\t1\n")
+    table = read_pairs(path, "indicators")
+    assert table.pairs() == [("a", "b")]
+    assert table["estimated"].tolist() == [0]
+    assert table["fp"].tolist() == [1]
+
+
+def test_newer_text_takes_precedence(tmp_path):
+    path = str(tmp_path / "test_pairs.npz")
+    write_pairs(path, PairTable.from_pairs("pairs", PAIRS))
+    with open(text_path(path), "w", encoding="utf-8") as f:
+        f.write("x\ty\n")
+    stat = os.stat(path)
+    os.utime(text_path(path), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert read_pairs(path).pairs() == [("x", "y")]
+
+
+def test_unknown_kind_and_mismatch(tmp_path):
+    path = str(tmp_path / "test_pairs.npz")
+    write_pairs(path, PairTable.from_pairs("pairs", PAIRS), text=False)
+    with pytest.raises(ValueError):
+        read_pairs(path, "indicators")
+    with pytest.raises(ValueError):
+        PairTable.from_pairs("unknown", PAIRS)
+
+
+def test_appender_matches_from_pairs(tmp_path, monkeypatch):
+    """PairAppender 分块写出（块小于行数）与一次性构造的结果一致"""
+    monkeypatch.setattr(pair_store, "CHUNK_ROWS", 2)
+    path = str(tmp_path / "predicted_pairs.npz")
+    with pair_store.PairAppender(path) as out:
+        for h, t in PAIRS:
+            out.append(out.entity_id(h), out.entity_id(t))
+        assert out.finish() == len(PAIRS)
+    assert_same_table(read_pairs(path, "pairs"), PairTable.from_pairs("pairs", PAIRS))
+    assert sorted(os.listdir(tmp_path)) == ["predicted_pairs.npz", "predicted_pairs.rows.npy", "predicted_pairs.txt"]
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+
+from local_driver import LocalDriver, MemoryGraph
+from rule_match_cache import RuleMatchCache, migrate
+
+TRIPLES = [("a", "r1", "b"), ("b", "r2", "c"), ("a", "r1", "d"), ("d", "r2", "c"), ("c", "r3", "a")]
+
+
+def memory_driver():
+    graph = MemoryGraph()
+    for h, r, t in TRIPLES:
+        graph.add_triple(h, r, t)
+    return LocalDriver(graph)
+
+
+def test_encode_decode_round_trip(tmp_path):
+    cache = RuleMatchCache(memory_driver(), "f" * 40, str(tmp_path))
+    assert cache.names == ["a", "b", "c", "d"]
+    pairs = [(h, t) for h in cache.names for t in cache.names]
+    codes = np.array([cache.encode(h, t) for h, t in pairs], dtype=np.int64)
+    # 编码顺序即 (头实体名, 尾实体名) 的顺序
+    assert (np.diff(codes) > 0).all()
+    assert cache.decode(codes) == pairs
+    assert cache.encode("a", "missing") is None
+
+
+def test_match_is_persisted_and_searchable(tmp_path):
+    driver = memory_driver()
+    cache = RuleMatchCache(driver, "f" * 40, str(tmp_path))
+    codes = cache.match(["r1", "r2"])
+    assert cache.decode(codes) == [("a", "c")]
+    assert cache.contains(codes, "a", "c")
+    assert not cache.contains(codes, "a", "b")
+    assert not cache.contains(codes, "a", "missing")
+
+    # 新实例从磁盘读取实体表与匹配结果
+    reloaded = RuleMatchCache(driver, "f" * 40, str(tmp_path))
+    assert os.path.exists(reloaded.path(["r1", "r2"]))
+    np.testing.assert_array_equal(reloaded.get(["r1", "r2"]), codes)
+    assert reloaded.get(["r3"]) is None
+
+
+def test_migrate_remaps_codes_to_new_entity_table(tmp_path):
+    """新增实体后编号改变，未变更的规则链按新实体表重映射，含变更关系的规则链丢弃"""
+    driver = memory_driver()
+    old = RuleMatchCache(driver, "0" * 40, str(tmp_path))
+    old.match(["r1", "r2"])
+    old.match(["r3"])
+
+    driver.graph.add_triple("aa", "r4", "c")
+    kept, dropped = migrate(driver, "0" * 40, "1" * 40, [["r1", "r2"], ["r3"], ["r4"]], {"r3", "r4"}, str(tmp_path))
+    assert (kept, dropped) == (1, 1)
+
+    new = RuleMatchCache(driver, "1" * 40, str(tmp_path))
+    assert new.names == ["a", "aa", "b", "c", "d"]
+    assert new.decode(new.get(["r1", "r2"])) == [("a", "c")]
+    assert new.get(["r3"]) is None